@@ -0,0 +1,122 @@
+# /benchmarks/bench_async.py
+# Задержка запросов при параллельной нагрузке: AsyncLibrary в asyncio против Library в пуле потоков.
+#   python benchmarks/bench_async.py --requests 2000 --concurrency 50
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from async_library import AsyncLibrary
+from library import Library, User
+
+
+def make_requests(count, books, users, seed):
+    # Смешанная нагрузка: просмотр книги, поиск, выдача и возврат
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        operation = rng.random()
+        if operation < 0.4:
+            requests.append(('view_book', (rng.randint(1, books),), {}))
+        elif operation < 0.7:
+            requests.append(('search_books', (), {'author': f"Writer{rng.randint(0, 499)}", 'limit': 20}))
+        else:
+            user_id, isbn = rng.randint(1, users), rng.randint(1, books)
+            requests.append(('borrow_book', (user_id, isbn), {}))
+            requests.append(('return_book', (user_id, isbn), {}))
+    return requests
+
+
+def populate(db_file, books, users):
+    library = Library(db_file)
+    library.add_books((isbn, f"Book {isbn}", f"Writer{isbn % 500}", 1000) for isbn in range(1, books + 1))
+    with library.unit_of_work() as session:
+        session.add_all(User(user_id=user_id, name=f"User {user_id}", reputation=100) for user_id in range(1, users + 1))
+    library.close_connection()
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def run_sync(db_file, requests, concurrency):
+    library = Library(db_file, pool_size=concurrency)
+
+    def timed(name, args, kwargs):
+        start = time.perf_counter()
+        getattr(library, name)(*args, **kwargs)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda request: timed(*request), requests))
+    elapsed = time.perf_counter() - start
+    library.close_connection()
+    return summarize(latencies, elapsed)
+
+
+async def run_async(db_file, requests, concurrency):
+    library = AsyncLibrary(db_file, pool_size=concurrency)
+    await library.connect()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(name, args, kwargs):
+        async with semaphore:
+            start = time.perf_counter()
+            await getattr(library, name)(*args, **kwargs)
+            return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(*request) for request in requests))
+    elapsed = time.perf_counter() - start
+    await library.close_connection()
+    return summarize(latencies, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение AsyncLibrary и Library в пуле потоков")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--books', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+    logging.getLogger('library').disabled = True
+
+    requests = make_requests(args.requests, args.books, args.users, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ('sync_threads', 'async'):
+            db_file = os.path.join(directory, f'{name}.db')
+            populate(db_file, args.books, args.users)
+            if name == 'async':
+                results[name] = asyncio.run(run_async(db_file, requests, args.concurrency))
+            else:
+                results[name] = run_sync(db_file, requests, args.concurrency)
+
+    print(f"{'Вариант':<14}{'запросов/с':>12}{'p50, мс':>10}{'p99, мс':>10}")
+    for name, result in results.items():
+        print(f"{name:<14}{result['requests_per_sec']:>12.0f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# /benchmarks/bench_import.py
+# Массовая загрузка каталога с индексом нечеткого поиска на реалистичном словаре (частоты слов по Ципфу):
+#   python benchmarks/bench_import.py --books 300000 --vocabulary 300000 --json import.json
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sqlalchemy import text
+
+from library import Library
+
+SYLLABLES = ["ка", "ро", "ми", "ле", "на", "ст", "во", "ду", "ша", "пе", "ти", "го", "ль", "зи", "мо", "ар",
+             "ен", "ох", "ба", "ры", "ск", "ют", "ве", "че"]
+
+
+def make_vocabulary(rng, size):
+    # Различные слова из 2-5 слогов; ранг частоты слова не зависит от его написания
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def make_books(rng, vocabulary, count, zipf):
+    # Названия из 2-6 слов, частота слова обратно пропорциональна его рангу в степени zipf
+    weights = list(itertools.accumulate(1 / rank ** zipf for rank in range(1, len(vocabulary) + 1)))
+    authors = [f"{rng.choice(vocabulary).capitalize()} {rng.choice(vocabulary).capitalize()}" for _ in range(count // 10 or 1)]
+    return [(isbn, " ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(2, 6))).capitalize(),
+             rng.choice(authors), 2) for isbn in range(1, count + 1)]
+
+
+def with_typo(rng, word):
+    position = rng.randrange(len(word))
+    return word[:position] + rng.choice("аеиоуыкрст") + word[position + 1:]
+
+
+def measure_import(directory, name, books, chunk_size, defer_search_index):
+    library = Library(os.path.join(directory, f'{name}.db'))
+    try:
+        start = time.perf_counter()
+        library.add_books(books, chunk_size=chunk_size, defer_search_index=defer_search_index)
+        seconds = time.perf_counter() - start
+        words = library.session.execute(text("SELECT COUNT(*) FROM search_words")).scalar()
+    finally:
+        library.close_connection()
+    return {'seconds': seconds, 'rows_per_sec': len(books) / seconds, 'words': words}
+
+
+def measure_rebuild(directory, name):
+    library = Library(os.path.join(directory, f'{name}.db'))
+    try:
+        start = time.perf_counter()
+        library.rebuild_search_index()
+        return time.perf_counter() - start
+    finally:
+        library.close_connection()
+
+
+def measure_queries(directory, name, queries):
+    library = Library(os.path.join(directory, f'{name}.db'))
+    try:
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            library.fuzzy_search_books(title=query)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        library.close_connection()
+    timings.sort()
+    return {'median_ms': statistics.median(timings), 'p95_ms': timings[int(len(timings) * 0.95) - 1], 'max_ms': timings[-1]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Скорость загрузки каталога с индексом нечеткого поиска")
+    parser.add_argument('--books', type=int, default=300_000)
+    parser.add_argument('--vocabulary', type=int, default=300_000, help="Размер словаря, из которого выбираются слова")
+    parser.add_argument('--zipf', type=float, default=1.0, help="Показатель распределения частот слов")
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--queries', type=int, default=50, help="Количество нечетких запросов")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    books = make_books(rng, vocabulary, args.books, args.zipf)
+    # Запросы: одно слово и два слова с опечаткой, слова выбираются из названий равномерно
+    title_words = [title.lower().split() for _, title, _, _ in books]
+    queries = [" ".join(with_typo(rng, word) for word in rng.sample(words, min(len(words), 1 + i % 2)))
+               for i, words in enumerate(rng.sample(title_words, args.queries))]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results['per_chunk'] = measure_import(directory, 'per_chunk', books, args.chunk_size, False)
+        results['deferred'] = measure_import(directory, 'deferred', books, args.chunk_size, True)
+        results['deferred']['rebuild_seconds'] = measure_rebuild(directory, 'deferred')
+        results['queries'] = measure_queries(directory, 'deferred', queries)
+
+    words = results['per_chunk']['words']
+    print(f"Книг: {args.books}, различных слов в индексе: {words}")
+    print(f"{'Загрузка':<28}{'с':>10}{'строк/с':>12}")
+    for name in ('per_chunk', 'deferred'):
+        print(f"{name:<28}{results[name]['seconds']:>10.1f}{results[name]['rows_per_sec']:>12.0f}")
+    print(f"{'  в т.ч. rebuild_search_index':<28}{results['deferred']['rebuild_seconds']:>10.1f}")
+    queries = results['queries']
+    print(f"fuzzy_search_books: медиана {queries['median_ms']:.1f} мс, p95 {queries['p95_ms']:.1f} мс, "
+          f"максимум {queries['max_ms']:.1f} мс")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'results': results}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
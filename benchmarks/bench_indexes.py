@@ -0,0 +1,118 @@
+# /benchmarks/bench_indexes.py
+# Замер времени поиска по горячим столбцам до и после миграции индексов:
+#   python benchmarks/bench_indexes.py --loans 10000000 --json indexes.json
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sqlalchemy import create_engine, inspect, text
+
+from models import Base, upgrade_schema
+
+LOOKUPS = {
+    # return_book / set_return_date
+    'loan_by_user_isbn': "SELECT id FROM borrowed_books WHERE user_id = :user_id AND isbn = :isbn LIMIT 1",
+    # Подсчет книг пользователя
+    'loans_by_user': "SELECT COUNT(*) FROM borrowed_books WHERE user_id = :user_id",
+    # Поиск просроченных книг
+    'overdue_scan': "SELECT id FROM borrowed_books WHERE due_date < :as_of ORDER BY due_date LIMIT 100",
+    'books_by_author': "SELECT isbn FROM books WHERE author = :author",
+    'books_by_title': "SELECT isbn FROM books WHERE title = :title",
+}
+
+FILL = (
+    """INSERT INTO users (user_id, name, penalty, reputation, max_books, return_days, active_loans)
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :users)
+    SELECT n, 'User ' || n, 0.0, 100, 10, 14, 0 FROM seq""",
+    """INSERT INTO books (isbn, title, author, copies)
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :books)
+    SELECT n, 'Book ' || n, 'Author ' || (n % 5000), 5 FROM seq""",
+    """INSERT INTO borrowed_books (user_id, isbn, borrow_date, due_date)
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :loans)
+    SELECT (n * 7919) % :users + 1, (n * 104729) % :books + 1,
+           datetime('2024-01-01', '+' || (n % 365) || ' days'),
+           datetime('2024-01-15', '+' || (n % 365) || ' days')
+    FROM seq""",
+)
+
+
+def create_legacy_database(engine, users, books, loans):
+    # База в состоянии до миграции: только первичные ключи, без индексов и триггеров
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(connection)
+        for name in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars().all():
+            connection.execute(text(f"DROP TRIGGER {name}"))
+        for statement in FILL:
+            connection.execute(text(statement), {'users': users, 'books': books, 'loans': loans})
+
+
+def measure(engine, params, repeat):
+    results = {}
+    with engine.connect() as connection:
+        for name, sql in LOOKUPS.items():
+            timings = []
+            for values in params[:repeat]:
+                start = time.perf_counter()
+                connection.execute(text(sql), values).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {'median_ms': statistics.median(timings), 'max_ms': max(timings)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время поиска до и после добавления индексов")
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--books', type=int, default=1_000_000)
+    parser.add_argument('--loans', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=20, help="Количество замеров каждого запроса")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    params = [{
+        'user_id': rng.randint(1, args.users),
+        'isbn': rng.randint(1, args.books),
+        'as_of': '2024-03-01 00:00:00',
+        'author': f"Author {rng.randint(0, 4999)}",
+        'title': f"Book {rng.randint(1, args.books)}",
+    } for _ in range(args.repeat)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'library.db')}")
+        start = time.perf_counter()
+        create_legacy_database(engine, args.users, args.books, args.loans)
+        print(f"Данные сгенерированы за {time.perf_counter() - start:.1f} с")
+
+        before = measure(engine, params, args.repeat)
+        start = time.perf_counter()
+        changes = upgrade_schema(engine)
+        migration_seconds = time.perf_counter() - start
+        after = measure(engine, params, args.repeat)
+        indexes = sorted(index['name'] for index in inspect(engine).get_indexes('borrowed_books'))
+        engine.dispose()
+
+    print(f"Миграция: {len(changes)} изменений за {migration_seconds:.1f} с, индексы borrowed_books: {', '.join(indexes)}")
+    print(f"{'Запрос':<20}{'до, мс':>12}{'после, мс':>12}{'ускорение':>12}")
+    for name in LOOKUPS:
+        speedup = before[name]['median_ms'] / max(after[name]['median_ms'], 1e-6)
+        print(f"{name:<20}{before[name]['median_ms']:>12.3f}{after[name]['median_ms']:>12.3f}{speedup:>11.0f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'migration_seconds': migration_seconds,
+                       'before': before, 'after': after}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# /benchmarks/bench_projection.py
+# Время и память на строку для больших выборок: объекты ORM против неизменяемых записей (read_only_records):
+#   python benchmarks/bench_projection.py --rows 100000 --json projection.json
+import argparse
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from library import Library
+from suite import generate_dataset
+
+READS = {
+    'search_books': lambda library: library.search_books(),
+    'search_users': lambda library: library.search_users(),
+    'iter_books': lambda library: sum(1 for _ in library.iter_books()),
+}
+
+
+def measure(db_file, read_only_records, repeat):
+    library = Library(db_file, read_only_records=read_only_records)
+    results = {}
+    try:
+        for name, read in READS.items():
+            timings = []
+            for _ in range(repeat):
+                # Каждый замер - с пустой картой идентичности, как у нового запроса
+                library.release_session()
+                gc.collect()
+                start = time.perf_counter()
+                rows = read(library)
+                timings.append(time.perf_counter() - start)
+                del rows
+            library.release_session()
+            gc.collect()
+            tracemalloc.start()
+            rows = read(library)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            count = rows if isinstance(rows, int) else len(rows)
+            del rows
+            results[name] = {'rows': count, 'median_ms': statistics.median(timings) * 1000,
+                             'peak_bytes_per_row': peak / max(count, 1)}
+    finally:
+        library.close_connection()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Объекты ORM против записей read_only_records на больших выборках")
+    parser.add_argument('--rows', type=int, default=100_000, help="Количество книг и пользователей")
+    parser.add_argument('--repeat', type=int, default=5, help="Количество замеров каждого чтения")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+    logging.getLogger('library').disabled = True
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, 'library.db')
+        generate_dataset(db_file, books=args.rows, users=args.rows, loans=0, active_per_user=0, seed=args.seed)
+        orm = measure(db_file, False, args.repeat)
+        records = measure(db_file, True, args.repeat)
+
+    print(f"{'Чтение':<16}{'строк':>9}{'ORM, мс':>10}{'записи, мс':>12}{'ORM, Б/строку':>16}{'записи, Б/строку':>19}")
+    for name in READS:
+        print(f"{name:<16}{orm[name]['rows']:>9}{orm[name]['median_ms']:>10.1f}{records[name]['median_ms']:>12.1f}"
+              f"{orm[name]['peak_bytes_per_row']:>16.0f}{records[name]['peak_bytes_per_row']:>19.0f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'orm': orm, 'records': records}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# /benchmarks/bench_schema.py
+# Время импорта модулей схемы, настройки мапперов и создания таблиц в чистом процессе:
+#   python benchmarks/bench_schema.py --runs 20
+# Параметр --src позволяет замерить другую версию исходников (например, извлеченную через git worktree).
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MEASURE = """
+import json, time
+start = time.perf_counter()
+import sqlalchemy.orm
+from sqlalchemy import create_engine
+sqlalchemy_loaded = time.perf_counter()
+import library, database
+modules_loaded = time.perf_counter()
+sqlalchemy.orm.configure_mappers()
+mappers_configured = time.perf_counter()
+metadatas = list({id(module.Base.metadata): module.Base.metadata for module in (library, database)}.values())
+engine = create_engine('sqlite://')
+for metadata in metadatas:
+    metadata.create_all(engine)
+tables_created = time.perf_counter()
+print(json.dumps({
+    'sqlalchemy_import_ms': (sqlalchemy_loaded - start) * 1000,
+    'modules_import_ms': (modules_loaded - sqlalchemy_loaded) * 1000,
+    'configure_mappers_ms': (mappers_configured - modules_loaded) * 1000,
+    'create_all_ms': (tables_created - mappers_configured) * 1000,
+    'metadata_objects': len(metadatas),
+    'tables': sum(len(metadata.tables) for metadata in metadatas),
+}))
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время импорта и создания схемы")
+    parser.add_argument('--src', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', MEASURE], cwd=args.src, capture_output=True, text=True, check=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    for key, value in result.items():
+        print(f"{key:<24}{value:>10.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'median': result}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# /benchmarks/bench_service.py
+# Нагрузочный тест службы библиотеки: N рабочих мест параллельно выполняют смешанный поток операций,
+# для каждой операции выводятся p50/p99 задержки и общая пропускная способность:
+#   python benchmarks/bench_service.py --desks 50 --ops-per-desk 200 --json service.json
+#   python benchmarks/bench_service.py --mode direct   (каждое рабочее место открывает базу само, как раньше)
+#   python benchmarks/bench_service.py --mode shared   (один экземпляр Library на все потоки, COMMIT на операцию)
+#   python benchmarks/bench_service.py --mode group    (тот же экземпляр с group_commit=True)
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+SERVICE = os.path.join(SRC, 'service.py')
+sys.path.insert(0, SRC)
+
+from client import LibraryClient
+from library import Library
+from suite import generate_dataset
+
+# Доли операций в потоке рабочего места; loan_cycle - выдача и сразу возврат (две записи)
+WEIGHTS = {'view_book': 40, 'search_books': 20, 'view_user': 10, 'loan_cycle': 30}
+
+
+def run_operation(library, name, dataset, rng):
+    if name == 'view_book':
+        library.view_book(dataset.random_isbn(rng))
+    elif name == 'search_books':
+        library.search_books(query=dataset.random_words(rng), limit=20)
+    elif name == 'view_user':
+        library.view_user(dataset.random_user_id(rng))
+    else:
+        user_id, isbn = dataset.random_user_id(rng), dataset.random_isbn(rng)
+        library.borrow_book(user_id, isbn)
+        library.return_book(user_id, isbn)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_desks(open_library, dataset, desks, ops_per_desk, seed, shared=False):
+    # Возвращает {операция: [задержки, с]} и общее время прогона; shared - open_library возвращает
+    # общий для всех потоков экземпляр, который закрывает вызывающий
+    latencies = {name: [] for name in WEIGHTS}
+    lock = threading.Lock()
+    barrier = threading.Barrier(desks + 1)
+
+    def desk(number):
+        rng = random.Random(f"{seed}:{number}")
+        library = open_library()
+        plan = rng.choices(list(WEIGHTS), weights=list(WEIGHTS.values()), k=ops_per_desk)
+        own = {name: [] for name in WEIGHTS}
+        barrier.wait()
+        try:
+            for name in plan:
+                start = time.perf_counter()
+                run_operation(library, name, dataset, rng)
+                own[name].append(time.perf_counter() - start)
+        finally:
+            if shared:
+                library.release_session()
+            else:
+                library.close_connection()
+        with lock:
+            for name, values in own.items():
+                latencies[name].extend(values)
+
+    threads = [threading.Thread(target=desk, args=(number,)) for number in range(desks)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def summarize(latencies, elapsed):
+    rows = {name: {'count': len(values), 'p50_ms': percentile(values, 0.5) * 1000,
+                   'p99_ms': percentile(values, 0.99) * 1000, 'mean_ms': statistics.fmean(values) * 1000}
+            for name, values in latencies.items() if values}
+    everything = [value for values in latencies.values() for value in values]
+    rows['all'] = {'count': len(everything), 'p50_ms': percentile(everything, 0.5) * 1000,
+                   'p99_ms': percentile(everything, 0.99) * 1000, 'mean_ms': statistics.fmean(everything) * 1000}
+    return {'operations': rows, 'seconds': elapsed, 'ops_per_sec': len(everything) / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест службы библиотеки")
+    parser.add_argument('--mode', choices=('service', 'direct', 'shared', 'group'), default='service',
+                        help="service - через службу с групповой фиксацией, direct - каждое место открывает базу, "
+                             "shared/group - общий экземпляр Library без групповой фиксации/с ней")
+    parser.add_argument('--desks', type=int, default=50, help="Количество рабочих мест")
+    parser.add_argument('--ops-per-desk', type=int, default=200, help="Операций на рабочее место")
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--loans', type=int, default=20_000)
+    parser.add_argument('--window-ms', type=float, default=2, help="Время набора пакета изменений, мс")
+    parser.add_argument('--max-batch', type=int, default=64, help="Максимальное количество операций в пакете")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+    logging.getLogger('library').disabled = True
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, 'library.db')
+        dataset = generate_dataset(db_file, books=args.books, users=args.users, loans=args.loans, seed=args.seed)
+        batching = None
+        Library(db_file).close_connection()  # Схема создана до запуска рабочих мест
+        if args.mode == 'service':
+            # Служба - отдельный процесс, как при развертывании: рабочие места не делят с ней GIL
+            service = subprocess.Popen([sys.executable, SERVICE, '--db', db_file, '--port', '0',
+                                        '--window-ms', str(args.window_ms), '--max-batch', str(args.max_batch)],
+                                       stdout=subprocess.PIPE, text=True)
+            try:
+                url = re.search(r'http://\S+', service.stdout.readline()).group(0)
+                latencies, elapsed = run_desks(lambda: LibraryClient(url), dataset, args.desks,
+                                               args.ops_per_desk, args.seed)
+                with urllib.request.urlopen(f"{url}/health") as response:
+                    batching = json.load(response)['batching']
+            finally:
+                service.terminate()
+                service.wait()
+        elif args.mode == 'direct':
+            # Каждое рабочее место - отдельный экземпляр Library с собственными соединениями, как отдельный процесс
+            latencies, elapsed = run_desks(lambda: Library(db_file), dataset, args.desks, args.ops_per_desk, args.seed)
+        else:
+            library = Library(db_file, pool_size=args.desks, group_commit=args.mode == 'group',
+                              group_commit_window_ms=args.window_ms, group_commit_max=args.max_batch)
+            try:
+                latencies, elapsed = run_desks(lambda: library, dataset, args.desks, args.ops_per_desk, args.seed,
+                                               shared=True)
+                if library.batcher is not None:
+                    batching = library.batcher.stats()
+            finally:
+                library.close_connection()
+
+    result = summarize(latencies, elapsed)
+    print(f"Режим {args.mode}, рабочих мест: {args.desks}, операций: {result['operations']['all']['count']}, "
+          f"{result['ops_per_sec']:.0f} оп/с")
+    print(f"{'Операция':<14}{'кол-во':>8}{'p50, мс':>10}{'p99, мс':>10}{'среднее, мс':>14}")
+    for name, row in result['operations'].items():
+        print(f"{name:<14}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['mean_ms']:>14.2f}")
+    if batching:
+        print(f"Пакетов записи: {batching['batches']}, операций в пакете в среднем: "
+              f"{batching['operations_per_batch']:.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'batching': batching, **result}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
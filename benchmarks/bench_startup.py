@@ -0,0 +1,84 @@
+# /benchmarks/bench_startup.py
+# Время запуска консольного меню: от старта процесса до приглашения выбрать действие и до выхода
+# (выход ждет окончания фоновой загрузки Library), а также отчет о самых долгих импортах:
+#   python benchmarks/bench_startup.py --repeat 20 --json startup.json
+#   python benchmarks/bench_startup.py --binary dist/main/main
+# Для отчета об импортах собранного PyInstaller файла сборка выполняется с LIBRARY_IMPORT_REPORT=1 (см. main.spec).
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'main.py')
+PROMPT = "Введите номер действия".encode('utf-8')
+EXIT_CHOICE = b"14\n"
+
+
+def launch(command, directory):
+    # Возвращает (мс до приглашения меню, мс до завершения процесса, stderr)
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output = b""
+    while PROMPT not in output:
+        chunk = os.read(process.stdout.fileno(), 65536)
+        if not chunk:
+            raise RuntimeError(f"Процесс завершился, не показав меню: {process.stderr.read().decode(errors='replace')}")
+        output += chunk
+    menu = time.perf_counter() - start
+    _, stderr = process.communicate(EXIT_CHOICE)
+    return menu * 1000, (time.perf_counter() - start) * 1000, stderr.decode('utf-8', errors='replace')
+
+
+def import_report(stderr, top=15):
+    # Разбирает вывод -X importtime: (накопленное время, мс; собственное время, мс; модуль), самые долгие первыми
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        rows.append((int(cumulative) / 1000, int(own) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время появления меню src/main.py и отчет об импортах")
+    parser.add_argument('--binary', help="Собранный исполняемый файл вместо python src/main.py")
+    parser.add_argument('--repeat', type=int, default=10, help="Количество замеряемых запусков")
+    parser.add_argument('--top', type=int, default=15, help="Количество модулей в отчете об импортах")
+    parser.add_argument('--max-menu-ms', type=float, default=200, help="Допустимая медиана времени до меню, мс")
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+
+    command = [os.path.abspath(args.binary)] if args.binary else [sys.executable, os.path.abspath(MAIN)]
+    with tempfile.TemporaryDirectory() as directory:
+        # Первый запуск создает базу и заполняет кэш байт-кода; замеряются запуски с существующей базой
+        launch(command, directory)
+        timings = [launch(command, directory)[:2] for _ in range(args.repeat)]
+        report_command = command if args.binary else [sys.executable, '-X', 'importtime', os.path.abspath(MAIN)]
+        report = import_report(launch(report_command, directory)[2], args.top)
+
+    menu = statistics.median(timing[0] for timing in timings)
+    total = statistics.median(timing[1] for timing in timings)
+    print(f"Меню: медиана {menu:.1f} мс, максимум {max(timing[0] for timing in timings):.1f} мс")
+    print(f"Запуск и выход (Library загружена): медиана {total:.1f} мс")
+    if report:
+        print(f"{'накоплено, мс':>14}{'собственное, мс':>17}  модуль")
+        for cumulative, own, name in report:
+            print(f"{cumulative:>14.1f}{own:>17.1f}  {name}")
+    elif args.binary:
+        print("Отчет об импортах недоступен: соберите файл с LIBRARY_IMPORT_REPORT=1")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'menu_ms': menu, 'total_ms': total, 'runs': timings,
+                       'imports': report}, f, indent=2, ensure_ascii=False)
+    return 1 if menu > args.max_menu_ms else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# /benchmarks/bench_threads.py
+# Пропускная способность одного экземпляра Library при смешанной нагрузке (выдача, возврат, поиск)
+# в зависимости от количества рабочих потоков:
+#   python benchmarks/bench_threads.py --threads 1 2 4 8 --duration 5
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from library import Library, User
+
+
+def populate(library, books, users):
+    library.add_books((isbn, f"Book {isbn}", f"Writer{isbn % 500}", 1000) for isbn in range(1, books + 1))
+    with library.unit_of_work() as session:
+        session.add_all(User(user_id=user_id, name=f"User {user_id}", reputation=100) for user_id in range(1, users + 1))
+
+
+def run(library, threads, duration, books, users, seed):
+    counts = [0] * threads
+    stop_at = time.perf_counter() + duration
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        # У каждого потока свои пользователи, чтобы возвраты относились к его же выдачам
+        own_users = list(range(index + 1, users + 1, threads))
+        loans = []
+        barrier.wait()
+        while time.perf_counter() < stop_at:
+            operation = rng.random()
+            if operation < 0.3 or (operation < 0.6 and not loans):
+                user_id, isbn = rng.choice(own_users), rng.randint(1, books)
+                library.borrow_book(user_id, isbn)
+                loans.append((user_id, isbn))
+            elif operation < 0.6:
+                library.return_book(*loans.pop(rng.randrange(len(loans))))
+            else:
+                library.search_books(author=f"Writer{rng.randint(0, 499)}", limit=20)
+            counts[index] += 1
+        library.release_session()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Масштабирование Library по количеству потоков")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--duration', type=float, default=5.0, help="Длительность замера для каждого количества потоков, с")
+    parser.add_argument('--books', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        library = Library(os.path.join(directory, 'library.db'), pool_size=max(args.threads))
+        library.logger.setLevel(logging.CRITICAL)
+        populate(library, args.books, args.users)
+        for threads in args.threads:
+            results[threads] = run(library, threads, args.duration, args.books, args.users, args.seed)
+        library.close_connection()
+
+    baseline = results[args.threads[0]]
+    print(f"{'Потоков':>8}{'операций/с':>14}{'ускорение':>12}")
+    for threads, ops in results.items():
+        print(f"{threads:>8}{ops:>14.0f}{ops / baseline:>11.2f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'ops_per_sec': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+# /benchmarks/suite/__init__.py
+# Набор бенчмарков публичных методов Library на синтетической базе:
+#   python -m benchmarks.suite --scale full --json results.json --compare baseline.json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+
+from .dataset import SCALES, Dataset, generate_dataset
+from .runner import compare, run_suite
+from .scenarios import SCENARIOS
@@ -0,0 +1,97 @@
+# /benchmarks/suite/__main__.py
+#   python -m benchmarks.suite --scale small --json results.json
+#   python -m benchmarks.suite --scale small --json new.json --compare results.json --max-regression 0.2
+#   python -m benchmarks.suite --scale full --db bench.db -k search   (база сохраняется и используется повторно)
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from instrumentation import Instrumentation
+
+from . import SCALES, SCENARIOS, compare, generate_dataset, run_suite
+from .dataset import Dataset
+
+
+def load_or_generate(db_file, params):
+    # Сохраненная база используется повторно, только если она сгенерирована с теми же параметрами
+    meta_file = f"{db_file}.json"
+    if os.path.exists(db_file) and os.path.exists(meta_file):
+        with open(meta_file, encoding='utf-8') as f:
+            if json.load(f) == params:
+                print(f"Используется сохраненная база {db_file}")
+                return Dataset(db_file, **params)
+        os.remove(db_file)
+    start = time.perf_counter()
+    dataset = generate_dataset(db_file, **params)
+    print(f"Данные сгенерированы за {time.perf_counter() - start:.1f} с: {params}")
+    with open(meta_file, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return dataset
+
+
+def print_result(benchmark):
+    stats = benchmark['stats']
+    print(f"{benchmark['group']:<12}{benchmark['name']:<28}{stats['median'] * 1000:>12.3f}"
+          f"{stats['mean'] * 1000:>12.3f}{stats['max'] * 1000:>12.3f}{stats['ops']:>12.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description="Бенчмарки методов Library")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Размер синтетической базы")
+    parser.add_argument('--books', type=int, help="Количество книг (вместо значения из --scale)")
+    parser.add_argument('--users', type=int, help="Количество пользователей")
+    parser.add_argument('--loans', type=int, help="Общее количество выдач, включая завершенные")
+    parser.add_argument('--active-per-user', type=int, default=3, help="Невозвращенных книг у каждого пользователя")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rounds', type=int, default=50, help="Количество замеряемых раундов сценария")
+    parser.add_argument('--warmup', type=int, default=5, help="Раунды прогрева, не входящие в результат")
+    parser.add_argument('--cache-size', type=int, default=0, help="Размер кэша Library")
+    parser.add_argument('-k', '--filter', help="Запускать только сценарии, имя или группа которых содержит строку")
+    parser.add_argument('--db', help="Файл базы; по умолчанию база создается во временном каталоге")
+    parser.add_argument('--json', help="Файл для сохранения результатов")
+    parser.add_argument('--metrics', help="Файл для метрик методов Library (SQL-запросы на вызов, медленные запросы)")
+    parser.add_argument('--slow-ms', type=float, default=100, help="Порог медленного запроса для --metrics, мс")
+    parser.add_argument('--compare', help="Файл с предыдущими результатами для сравнения")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Допустимое замедление медианы при сравнении (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    params = dict(SCALES[args.scale], active_per_user=args.active_per_user, seed=args.seed)
+    params.update({name: getattr(args, name) for name in ('books', 'users', 'loans') if getattr(args, name)})
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not args.filter or args.filter in scenario.name or args.filter == scenario.group]
+
+    # Метрики искажают замеры (обертки и события движка), поэтому собираются только по запросу
+    instrumentation = Instrumentation(slow_ms=args.slow_ms) if args.metrics else None
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = load_or_generate(args.db or os.path.join(directory, 'library.db'), params)
+        print(f"{'Группа':<12}{'Сценарий':<28}{'медиана, мс':>12}{'среднее, мс':>12}{'макс, мс':>12}{'оп/с':>12}")
+        results = run_suite(dataset, scenarios, args.rounds, args.warmup, args.seed, args.cache_size,
+                            progress=print_result, instrumentation=instrumentation)
+    if instrumentation is not None:
+        instrumentation.write(args.metrics, format='text')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['params'] != results['params']:
+            print(f"Внимание: параметры отличаются от сохраненных ({baseline['params']})")
+        rows = compare(baseline, results, args.max_regression)
+        print(f"{'Сценарий':<28}{'было, мс':>12}{'стало, мс':>12}{'отношение':>12}")
+        for name, before, after, ratio, regressed in rows:
+            print(f"{name:<28}{before * 1000:>12.3f}{after * 1000:>12.3f}{ratio:>11.2f}x{'  РЕГРЕССИЯ' if regressed else ''}")
+        regressions = [row for row in rows if row[4]]
+        print(f"Регрессий: {len(regressions)}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
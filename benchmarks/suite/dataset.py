@@ -0,0 +1,151 @@
+# /benchmarks/suite/dataset.py
+# Детерминированная синтетическая база: при одинаковых параметрах и seed генерируются одни и те же данные
+import hashlib
+import itertools
+import json
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from library import Library
+from models import Book, BorrowedBook, LoanHistory, User
+
+# Размеры наборов данных: книги, пользователи, выдачи (активные и завершенные)
+SCALES = {
+    'tiny': {'books': 2_000, 'users': 200, 'loans': 5_000},
+    'small': {'books': 100_000, 'users': 10_000, 'loans': 1_000_000},
+    'full': {'books': 1_000_000, 'users': 100_000, 'loans': 10_000_000},
+}
+
+# Дата, относительно которой строятся выдачи; не зависит от времени запуска
+REFERENCE_DATE = datetime(2024, 7, 1)
+
+WORDS = (
+    "война", "мир", "преступление", "наказание", "идиот", "бесы", "мастер", "маргарита", "тихий", "дон",
+    "мертвые", "души", "отцы", "дети", "герой", "нашего", "времени", "горе", "от", "ума", "белая", "гвардия",
+    "собачье", "сердце", "доктор", "живаго", "анна", "каренина", "капитанская", "дочка", "обломов", "вишневый",
+    "сад", "чайка", "дама", "собачкой", "старик", "море", "остров", "сокровищ", "золотой", "теленок",
+)
+FIRST_NAMES = ("Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна", "Иван", "Ксения", "Лев",
+               "Мария", "Никита", "Ольга", "Павел", "Роман", "Софья", "Тимур", "Ульяна", "Федор", "Юлия")
+LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Волков", "Соколов", "Лебедев",
+              "Козлов", "Новиков", "Морозов", "Егоров", "Павлов", "Орлов", "Макаров", "Зайцев", "Соловьев",
+              "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьев", "Сергеев", "Фролов")
+
+CHUNK_SIZE = 50_000
+
+
+class Dataset:
+    # Параметры сгенерированной базы и источник новых ID для сценариев, добавляющих книги и пользователей
+    def __init__(self, db_file, books, users, loans, active_per_user, seed):
+        self.db_file = db_file
+        self.books = books
+        self.users = users
+        self.loans = loans
+        self.active_per_user = active_per_user
+        self.seed = seed
+        self.reference_date = REFERENCE_DATE
+        self._new_isbns = itertools.count(books + 1)
+        self._new_user_ids = itertools.count(users + 1)
+
+    @property
+    def params(self):
+        return {'books': self.books, 'users': self.users, 'loans': self.loans,
+                'active_per_user': self.active_per_user, 'seed': self.seed}
+
+    def next_isbn(self):
+        return next(self._new_isbns)
+
+    def next_user_id(self):
+        return next(self._new_user_ids)
+
+    def random_isbn(self, rng):
+        return rng.randint(1, self.books)
+
+    def random_user_id(self, rng):
+        return rng.randint(1, self.users)
+
+    def random_words(self, rng, count=1):
+        return " ".join(rng.sample(WORDS, count))
+
+
+def book_title(rng):
+    return " ".join(rng.sample(WORDS, rng.randint(2, 4))).capitalize()
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _generate_books(rng, count):
+    for isbn in range(1, count + 1):
+        yield {'isbn': isbn, 'title': book_title(rng), 'author': person_name(rng), 'copies': rng.randint(20, 50)}
+
+
+def _generate_users(rng, count):
+    for user_id in range(1, count + 1):
+        yield {'user_id': user_id, 'name': person_name(rng), 'penalty': 0.0, 'reputation': rng.randint(50, 100),
+               'max_books': 10, 'return_days': 14, 'active_loans': 0}
+
+
+def _generate_active_loans(rng, dataset):
+    # У каждого пользователя active_per_user невозвращенных книг, часть из них просрочена
+    for user_id in range(1, dataset.users + 1):
+        for _ in range(dataset.active_per_user):
+            borrow_date = REFERENCE_DATE - timedelta(days=rng.randint(0, 30), seconds=rng.randint(0, 86399))
+            yield {'user_id': user_id, 'isbn': dataset.random_isbn(rng), 'borrow_date': borrow_date,
+                   'due_date': borrow_date + timedelta(days=14), 'return_date': None,
+                   'penalty': 0.0, 'penalized_days': 0}
+
+
+def _generate_history(rng, dataset, count):
+    # Завершенные выдачи за два года до REFERENCE_DATE
+    for loan_id in range(1, count + 1):
+        borrow_date = REFERENCE_DATE - timedelta(days=rng.randint(31, 730), seconds=rng.randint(0, 86399))
+        due_date = borrow_date + timedelta(days=14)
+        return_date = borrow_date + timedelta(days=rng.randint(1, 21))
+        overdue_days = max((return_date - due_date).days, 0)
+        yield {'loan_id': loan_id, 'period': LoanHistory.period_of(return_date),
+               'user_id': dataset.random_user_id(rng), 'isbn': dataset.random_isbn(rng),
+               'borrow_date': borrow_date, 'due_date': due_date, 'return_date': return_date,
+               'penalty': overdue_days * Library.OVERDUE_PENALTY_PER_DAY, 'penalized_days': overdue_days}
+
+
+def _insert(connection, table, rows):
+    for chunk in iter(lambda: list(itertools.islice(rows, CHUNK_SIZE)), []):
+        connection.execute(table.insert(), chunk)
+
+
+def generate_dataset(db_file, books, users, loans, active_per_user=3, seed=42):
+    # Создает базу через Library (схема, индексы, триггеры, полнотекстовый индекс) и заполняет ее.
+    # Из loans выдач users * active_per_user остаются активными, остальные попадают в loan_history.
+    dataset = Dataset(db_file, books, users, loans, active_per_user, seed)
+    library = Library(db_file)
+    rng = random.Random(seed)
+    try:
+        with library.engine.begin() as connection:
+            _insert(connection, Book.__table__, _generate_books(rng, books))
+            _insert(connection, User.__table__, _generate_users(rng, users))
+            _insert(connection, BorrowedBook.__table__, _generate_active_loans(rng, dataset))
+            history = max(loans - users * active_per_user, 0)
+            _insert(connection, LoanHistory.__table__, _generate_history(rng, dataset, history))
+        with library.engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+    finally:
+        library.close_connection()
+    return dataset
+
+
+def dataset_checksum(db_file):
+    # Контрольная сумма содержимого основных таблиц для проверки воспроизводимости генерации
+    library = Library(db_file)
+    digest = hashlib.sha256()
+    try:
+        with library.engine.connect() as connection:
+            for table in (Book.__table__, User.__table__, BorrowedBook.__table__, LoanHistory.__table__):
+                for row in connection.execute(table.select().order_by(*table.primary_key.columns)):
+                    digest.update(json.dumps(list(row), default=str, ensure_ascii=False).encode('utf-8'))
+    finally:
+        library.close_connection()
+    return digest.hexdigest()
@@ -0,0 +1,97 @@
+# /benchmarks/suite/runner.py
+# Прогон сценариев, статистика раундов и сравнение с сохраненными результатами
+import logging
+import platform
+import random
+import sqlite3
+import statistics
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+from library import Library
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'sqlite': sqlite3.sqlite_version,
+    }
+
+
+def round_stats(timings):
+    # Те же показатели, что сохраняет pytest-benchmark; время в секундах
+    quartiles = statistics.quantiles(timings, n=4) if len(timings) > 1 else [timings[0]] * 3
+    mean = statistics.fmean(timings)
+    return {
+        'min': min(timings),
+        'max': max(timings),
+        'mean': mean,
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'median': statistics.median(timings),
+        'iqr': quartiles[2] - quartiles[0],
+        'rounds': len(timings),
+        'ops': 1 / mean if mean else 0.0,
+    }
+
+
+def measure(scenario, library, dataset, rounds, warmup, seed):
+    # Для каждого сценария свой генератор: добавление или удаление сценариев не меняет данные остальных
+    rng = random.Random(f"{seed}:{scenario.name}")
+    if scenario.max_rounds is not None:
+        rounds = min(rounds, scenario.max_rounds)
+        warmup = min(warmup, 1)
+    timings = []
+    for number in range(warmup + rounds):
+        args = scenario.setup(library, dataset, rng) if scenario.setup else ()
+        start = time.perf_counter()
+        scenario.run(library, *args)
+        elapsed = time.perf_counter() - start
+        if scenario.teardown:
+            scenario.teardown(library, *args)
+        if number >= warmup:
+            timings.append(elapsed)
+    return timings
+
+
+def run_suite(dataset, scenarios, rounds=50, warmup=5, seed=42, cache_size=0, progress=None, instrumentation=None):
+    # Ошибки бизнес-правил (например, нет свободных копий) Library пишет в журнал; в замерах они не нужны
+    logger = logging.getLogger('library')
+    disabled, logger.disabled = logger.disabled, True
+    library = Library(dataset.db_file, cache_size=cache_size, instrumentation=instrumentation)
+    benchmarks = []
+    try:
+        for scenario in scenarios:
+            timings = measure(scenario, library, dataset, rounds, warmup, seed)
+            library.release_session()
+            benchmarks.append({'name': scenario.name, 'group': scenario.group, 'stats': round_stats(timings)})
+            if progress:
+                progress(benchmarks[-1])
+    finally:
+        library.close_connection()
+        logger.disabled = disabled
+    return {
+        'machine_info': machine_info(),
+        'datetime': datetime.now().isoformat(timespec='seconds'),
+        'params': dict(dataset.params, rounds=rounds, warmup=warmup, cache_size=cache_size),
+        'benchmarks': benchmarks,
+    }
+
+
+def compare(baseline, current, max_regression=0.2):
+    # Сравнивает медианы одноименных сценариев. Возвращает список (name, было, стало, отношение, регрессия);
+    # регрессией считается замедление более чем в 1 + max_regression раз
+    previous = {benchmark['name']: benchmark['stats']['median'] for benchmark in baseline['benchmarks']}
+    rows = []
+    for benchmark in current['benchmarks']:
+        if benchmark['name'] not in previous:
+            continue
+        before, after = previous[benchmark['name']], benchmark['stats']['median']
+        ratio = after / before if before else float('inf')
+        rows.append((benchmark['name'], before, after, ratio, ratio > 1 + max_regression))
+    return rows
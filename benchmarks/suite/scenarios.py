@@ -0,0 +1,356 @@
+# /benchmarks/suite/scenarios.py
+# Сценарии бенчмарков: по одному на публичный метод Library и смешанные нагрузки.
+# setup готовит аргументы раунда и в замер не входит, run замеряется, teardown возвращает базу в исходное состояние.
+from datetime import timedelta
+
+from .dataset import person_name
+
+
+class Scenario:
+    def __init__(self, name, group, run, setup=None, teardown=None, max_rounds=None):
+        self.name = name
+        self.group = group
+        self.run = run
+        self.setup = setup
+        self.teardown = teardown
+        # Ограничение числа раундов для сценариев, обходящих всю таблицу
+        self.max_rounds = max_rounds
+
+
+SCENARIOS = []
+
+
+def scenario(group, setup=None, teardown=None, max_rounds=None):
+    def register(run):
+        SCENARIOS.append(Scenario(run.__name__, group, run, setup, teardown, max_rounds))
+        return run
+    return register
+
+
+def random_book(library, dataset, rng):
+    return (dataset.random_isbn(rng),)
+
+
+def random_user(library, dataset, rng):
+    return (dataset.random_user_id(rng),)
+
+
+def random_loan(library, dataset, rng):
+    return dataset.random_user_id(rng), dataset.random_isbn(rng)
+
+
+def borrowed_loan(library, dataset, rng):
+    user_id, isbn = random_loan(library, dataset, rng)
+    library.borrow_book(user_id, isbn)
+    return user_id, isbn
+
+
+def new_book(library, dataset, rng):
+    isbn = dataset.next_isbn()
+    library.add_book(isbn, "Новая книга", "Новый автор", 1)
+    return (isbn,)
+
+
+def new_user(library, dataset, rng):
+    user_id = dataset.next_user_id()
+    library.register_user(user_id, "Новый пользователь")
+    return (user_id,)
+
+
+def return_loan(library, user_id, isbn, *args):
+    library.return_book(user_id, isbn)
+
+
+# Книги
+
+@scenario('books', setup=random_book)
+def view_book(library, isbn):
+    library.view_book(isbn)
+
+
+@scenario('books', setup=random_book)
+def book_exists(library, isbn):
+    library.book_exists(isbn)
+
+
+@scenario('books', setup=lambda library, dataset, rng: (dataset.next_isbn(),))
+def add_book(library, isbn):
+    library.add_book(isbn, "Новая книга", "Новый автор", 1)
+
+
+@scenario('books', setup=lambda library, dataset, rng: ([
+    (dataset.next_isbn(), "Новая книга", "Новый автор", 1) for _ in range(1000)
+],))
+def add_books_1000(library, books):
+    library.add_books(books)
+
+
+@scenario('books', setup=lambda library, dataset, rng: (dataset.random_isbn(rng), rng.randint(20, 50)))
+def update_book(library, isbn, copies):
+    library.update_book(isbn, copies=copies)
+
+
+@scenario('books', setup=new_book)
+def delete_book(library, isbn):
+    library.delete_book(isbn)
+
+
+# Поиск
+
+@scenario('search', setup=lambda library, dataset, rng: (dataset.random_words(rng),))
+def search_books_title(library, word):
+    library.search_books(title=word, limit=20)
+
+
+@scenario('search', setup=lambda library, dataset, rng: (dataset.random_words(rng, 2),))
+def search_books_query(library, words):
+    library.search_books(query=words, limit=20)
+
+
+@scenario('search', setup=random_book)
+def search_books_isbn(library, isbn):
+    library.search_books(isbn=isbn)
+
+
+@scenario('search', setup=lambda library, dataset, rng: (dataset.random_isbn(rng),))
+def search_books_page(library, after):
+    library.search_books(limit=100, after=after)
+
+
+@scenario('search', setup=random_user)
+def search_users(library, user_id):
+    library.search_users(user_id=user_id)
+
+
+def misspelled(rng, text):
+    # Одна опечатка в каждом слове: пропуск, замена или перестановка соседних букв
+    words = []
+    for word in text.split():
+        position = rng.randrange(len(word) - 1) if len(word) > 1 else 0
+        edit = rng.choice(('drop', 'replace', 'swap')) if len(word) > 3 else 'keep'
+        if edit == 'drop':
+            word = word[:position] + word[position + 1:]
+        elif edit == 'replace':
+            word = word[:position] + rng.choice('аеиоуыэюя') + word[position + 1:]
+        elif edit == 'swap':
+            word = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+        words.append(word)
+    return " ".join(words)
+
+
+@scenario('search', setup=lambda library, dataset, rng: (misspelled(rng, dataset.random_words(rng, 2)),))
+def fuzzy_search_books_title(library, words):
+    library.fuzzy_search_books(title=words, limit=20)
+
+
+@scenario('search', setup=lambda library, dataset, rng: (misspelled(rng, person_name(rng)),))
+def fuzzy_search_books_author(library, name):
+    library.fuzzy_search_books(author=name, limit=20)
+
+
+@scenario('search', setup=lambda library, dataset, rng: (misspelled(rng, person_name(rng)),))
+def fuzzy_search_users(library, name):
+    library.fuzzy_search_users(name, limit=20)
+
+
+# Пользователи
+
+@scenario('users', setup=random_user)
+def view_user(library, user_id):
+    library.view_user(user_id)
+
+
+@scenario('users', setup=random_user)
+def user_exists(library, user_id):
+    library.user_exists(user_id)
+
+
+@scenario('users', setup=lambda library, dataset, rng: (dataset.next_user_id(),))
+def register_user(library, user_id):
+    library.register_user(user_id, "Новый пользователь")
+
+
+@scenario('users', setup=lambda library, dataset, rng: (dataset.random_user_id(rng), f"Пользователь {rng.random()}"))
+def update_user(library, user_id, name):
+    library.update_user(user_id, name)
+
+
+@scenario('users', setup=new_user)
+def delete_user(library, user_id):
+    library.delete_user(user_id)
+
+
+# Выдача и возврат
+
+@scenario('loans', setup=random_loan, teardown=return_loan)
+def borrow_book(library, user_id, isbn):
+    library.borrow_book(user_id, isbn)
+
+
+@scenario('loans', setup=borrowed_loan)
+def return_book(library, user_id, isbn):
+    library.return_book(user_id, isbn)
+
+
+@scenario('loans', setup=lambda library, dataset, rng: (*borrowed_loan(library, dataset, rng), dataset.reference_date),
+          teardown=return_loan)
+def set_return_date(library, user_id, isbn, return_date):
+    library.set_return_date(user_id, isbn, return_date)
+
+
+def random_cart(library, dataset, rng, size=5):
+    return dataset.random_user_id(rng), [dataset.random_isbn(rng) for _ in range(size)]
+
+
+def borrowed_cart(library, dataset, rng):
+    user_id, isbns = random_cart(library, dataset, rng)
+    library.borrow_books(user_id, isbns)
+    return user_id, isbns
+
+
+@scenario('loans', setup=random_cart, teardown=lambda library, user_id, isbns: library.return_books(user_id, isbns))
+def borrow_books_5(library, user_id, isbns):
+    library.borrow_books(user_id, isbns)
+
+
+@scenario('loans', setup=borrowed_cart)
+def return_books_5(library, user_id, isbns):
+    library.return_books(user_id, isbns)
+
+
+@scenario('loans', setup=random_user)
+def get_borrowed_books_count(library, user_id):
+    library.get_borrowed_books_count(user_id)
+
+
+@scenario('loans', setup=random_user)
+def view_borrowed_books(library, user_id):
+    library.view_borrowed_books(user_id)
+
+
+@scenario('loans', setup=random_user)
+def view_borrowed_books_lazy(library, user_id):
+    # Вывод списка выдач с названиями через ORM-объекты: отдельный запрос книги на каждую выдачу
+    borrowed_books, _ = library.view_borrowed_books(user_id)
+    [borrowed_book.book.title for borrowed_book in borrowed_books]
+
+
+@scenario('loans', setup=random_user)
+def view_loans(library, user_id):
+    library.view_loans(user_id, with_user=True)
+
+
+@scenario('loans', setup=random_user)
+def view_loan_history(library, user_id):
+    library.view_loan_history(user_id=user_id, limit=20)
+
+
+@scenario('loans', setup=lambda library, dataset, rng: (
+    (dataset.reference_date - timedelta(days=rng.randint(31, 730))).strftime('%Y-%m'),
+))
+def view_loan_history_period(library, period):
+    library.view_loan_history(period=period, limit=100)
+
+
+# Резервы: очередь на книгу без свободных копий
+
+def unavailable_book(library, dataset, rng):
+    isbn = dataset.next_isbn()
+    library.add_book(isbn, "Популярная книга", "Новый автор", 0)
+    return dataset.random_user_id(rng), isbn
+
+
+def held_loan(library, dataset, rng):
+    # Единственная копия на руках у нового пользователя, в очереди на нее стоит другой
+    isbn = dataset.next_isbn()
+    library.add_book(isbn, "Популярная книга", "Новый автор", 1)
+    (user_id,) = new_user(library, dataset, rng)
+    library.borrow_book(user_id, isbn)
+    library.place_hold(dataset.random_user_id(rng), isbn)
+    return user_id, isbn
+
+
+@scenario('holds', setup=unavailable_book, teardown=lambda library, user_id, isbn: library.cancel_hold(user_id, isbn))
+def place_hold(library, user_id, isbn):
+    library.place_hold(user_id, isbn)
+
+
+@scenario('holds', setup=held_loan)
+def return_book_to_hold(library, user_id, isbn):
+    library.return_book(user_id, isbn)
+
+
+@scenario('holds')
+def holds_ready_for_pickup(library):
+    library.holds_ready_for_pickup(limit=100)
+
+
+# Статистика выдач по дневным сводкам
+
+@scenario('stats', setup=lambda library, dataset, rng: (
+    (dataset.reference_date - timedelta(days=rng.randint(31, 730))).strftime('%Y-%m'),
+))
+def stats_month(library, period):
+    library.stats(period=period, limit=10)
+
+
+@scenario('stats', setup=lambda library, dataset, rng: (
+    dataset.reference_date - timedelta(days=rng.randint(38, 730)),
+))
+def stats_week(library, start):
+    library.stats(start=start, end=start + timedelta(days=7), limit=10)
+
+
+# Обслуживание: обходят всю таблицу выдач
+
+@scenario('maintenance', setup=lambda library, dataset, rng: (dataset.reference_date,), max_rounds=5)
+def process_overdues_dry_run(library, as_of):
+    library.process_overdues(as_of=as_of, dry_run=True)
+
+
+@scenario('maintenance', max_rounds=5)
+def verify_loan_counters(library):
+    library.verify_loan_counters()
+
+
+# Смешанные нагрузки: раунд - пакет из 50 операций, выбранных с заданными весами
+
+MIXED_ARGS = {
+    'view_book': lambda dataset, rng: (dataset.random_isbn(rng),),
+    'search_books': lambda dataset, rng: (dataset.random_words(rng),),
+    'view_user': lambda dataset, rng: (dataset.random_user_id(rng),),
+    'view_borrowed_books': lambda dataset, rng: (dataset.random_user_id(rng),),
+    # Выдача и сразу возврат, чтобы количество книг у пользователей не росло от раунда к раунду
+    'loan_cycle': lambda dataset, rng: (dataset.random_user_id(rng), dataset.random_isbn(rng)),
+}
+
+
+def mixed_plan(weights, count=50):
+    def setup(library, dataset, rng):
+        names = rng.choices(list(weights), list(weights.values()), k=count)
+        return ([(name, MIXED_ARGS[name](dataset, rng)) for name in names],)
+    return setup
+
+
+def run_mixed(library, plan):
+    for name, args in plan:
+        if name == 'search_books':
+            library.search_books(query=args[0], limit=20)
+        elif name == 'loan_cycle':
+            library.borrow_book(*args)
+            library.return_book(*args)
+        else:
+            getattr(library, name)(*args)
+
+
+# Абонемент: в основном просмотр и выдача
+@scenario('mixed', setup=mixed_plan({'view_book': 30, 'search_books': 20, 'view_user': 15,
+                                     'view_borrowed_books': 15, 'loan_cycle': 20}))
+def mixed_desk_x50(library, plan):
+    run_mixed(library, plan)
+
+
+# Каталог: почти только чтение
+@scenario('mixed', setup=mixed_plan({'view_book': 40, 'search_books': 55, 'loan_cycle': 5}))
+def mixed_catalog_x50(library, plan):
+    run_mixed(library, plan)
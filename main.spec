@@ -1,16 +1,24 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# Сборка в каталог (dist/main): файлы не распаковываются во временный каталог при каждом запуске,
+# как у одиночного exe, поэтому меню появляется быстрее.
+# LIBRARY_IMPORT_REPORT=1 pyinstaller main.spec - сборка, выводящая время импортов (-X importtime) в stderr,
+# для отчета benchmarks/bench_startup.py --binary dist/main/main
+options = [('X importtime', None, 'OPTION')] if os.environ.get('LIBRARY_IMPORT_REPORT') else []
 
 a = Analysis(
-    ['D:\\Library_TZ\\src\\main.py'],
-    pathex=[],
+    [os.path.join(SPECPATH, 'src', 'main.py')],
+    pathex=[os.path.join(SPECPATH, 'src')],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # library импортируется в фоновом потоке main.LibraryLoader
+    hiddenimports=['library'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Модули, которые консольному меню не нужны
+    excludes=['tkinter', 'async_library', 'aiosqlite', 'exporter', 'pyarrow', 'instrumentation'],
     noarchive=False,
     optimize=0,
 )
@@ -19,16 +27,13 @@ pyz = PYZ(a.pure)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
-    [],
+    options,
+    exclude_binaries=True,
     name='main',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,  # Сжатые UPX библиотеки распаковываются при каждой загрузке
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +41,13 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='main',
+)
@@ -0,0 +1,252 @@
+# /src/async_library.py
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from cache import LRUCache
+from library import Library, set_sqlite_pragmas
+from models import apply_schema_upgrades, has_full_text_search
+
+
+def create_async_library_engine(db_file, pool_size=5, max_overflow=10, busy_timeout=5000):
+    # Асинхронный движок на aiosqlite с теми же настройками SQLite, что и у синхронного Library
+    if str(db_file) == ':memory:':
+        return create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+
+    engine = create_async_engine(f'sqlite+aiosqlite:///{db_file}', pool_size=pool_size, max_overflow=max_overflow)
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, busy_timeout)
+
+    return engine
+
+
+class AsyncLibrary:
+    # Асинхронный аналог Library для приложений на asyncio: операции не блокируют цикл событий.
+    # Каждый вызов открывает свою сессию асинхронного движка и выполняет в ней метод Library через run_sync,
+    # поэтому лимиты по репутации, сроки возврата и штрафы задаются в одном месте - в классе Library.
+    # Схема базы проверяется при первом обращении (или явно через connect()).
+
+    def __init__(self, db_file='library.db', full_text_search=True, cache_size=0, cache_ttl=None,
+                 pool_size=5, max_overflow=10, busy_timeout=5000, instrumentation=None, read_only_records=False):
+        self.engine = create_async_library_engine(db_file, pool_size, max_overflow, busy_timeout)
+        self.async_session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.full_text_search = full_text_search
+        self.read_only_records = read_only_records
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach_engine(self.engine)
+        self._connected = False
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._connected:
+                return
+            async with self.engine.begin() as connection:
+                await connection.run_sync(apply_schema_upgrades)
+                self.full_text_search = self.full_text_search and await connection.run_sync(has_full_text_search)
+            self._connected = True
+
+    async def close_connection(self):
+        await self.engine.dispose()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_connection()
+
+    async def _run(self, operation, *args, **kwargs):
+        if not self._connected:
+            await self.connect()
+        async with self.async_session() as session:
+            def call(sync_session):
+                library = Library.for_session(sync_session, self.full_text_search, self.cache, self.read_only_records)
+                if self.instrumentation is None:
+                    return operation(library, *args, **kwargs)
+                # Замер выполняется внутри run_sync, где идут и SQL-запросы этой операции
+                with self.instrumentation.measure(operation.__name__):
+                    return operation(library, *args, **kwargs)
+            return await session.run_sync(call)
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    async def add_book(self, isbn, title, author, copies):
+        return await self._run(Library.add_book, isbn, title, author, copies)
+
+    async def add_books(self, books, chunk_size=None, upsert=True, defer_search_index=False):
+        return await self._run(Library.add_books, books, chunk_size, upsert, defer_search_index)
+
+    async def update_book(self, isbn, title=None, author=None, copies=None):
+        return await self._run(Library.update_book, isbn, title, author, copies)
+
+    async def delete_book(self, isbn):
+        return await self._run(Library.delete_book, isbn)
+
+    async def view_book(self, isbn):
+        return await self._run(Library.view_book, isbn)
+
+    async def book_exists(self, isbn):
+        return await self._run(Library.book_exists, isbn)
+
+    async def register_user(self, user_id, name):
+        return await self._run(Library.register_user, user_id, name)
+
+    async def user_exists(self, user_id):
+        return await self._run(Library.user_exists, user_id)
+
+    async def view_user(self, user_id):
+        return await self._run(Library.view_user, user_id)
+
+    async def update_user(self, user_id, name, max_books=None, reputation=None):
+        return await self._run(Library.update_user, user_id, name, max_books, reputation)
+
+    async def delete_user(self, user_id):
+        return await self._run(Library.delete_user, user_id)
+
+    async def loan_policies(self):
+        return await self._run(Library.loan_policies)
+
+    async def set_loan_policy(self, tier, min_reputation=None, max_books=None, return_days=None, penalty_per_day=None):
+        return await self._run(Library.set_loan_policy, tier, min_reputation, max_books, return_days, penalty_per_day)
+
+    async def delete_loan_policy(self, tier):
+        return await self._run(Library.delete_loan_policy, tier)
+
+    async def borrow_book(self, user_id, isbn):
+        return await self._run(Library.borrow_book, user_id, isbn)
+
+    async def borrow_books(self, user_id, isbns):
+        return await self._run(Library.borrow_books, user_id, isbns)
+
+    async def return_book(self, user_id, isbn):
+        return await self._run(Library.return_book, user_id, isbn)
+
+    async def return_books(self, user_id, isbns):
+        return await self._run(Library.return_books, user_id, isbns)
+
+    async def place_hold(self, user_id, isbn):
+        return await self._run(Library.place_hold, user_id, isbn)
+
+    async def cancel_hold(self, user_id, isbn):
+        return await self._run(Library.cancel_hold, user_id, isbn)
+
+    async def hold_position(self, user_id, isbn):
+        return await self._run(Library.hold_position, user_id, isbn)
+
+    async def expire_holds(self, as_of=None):
+        return await self._run(Library.expire_holds, as_of)
+
+    async def compact_loans(self, before=None, chunk_size=None):
+        return await self._run(Library.compact_loans, before, chunk_size)
+
+    async def process_overdues(self, as_of=None, dry_run=False):
+        return await self._run(Library.process_overdues, as_of, dry_run)
+
+    async def set_return_date(self, user_id, isbn, return_date):
+        return await self._run(Library.set_return_date, user_id, isbn, return_date)
+
+    async def get_borrowed_books_count(self, user_id):
+        return await self._run(Library.get_borrowed_books_count, user_id)
+
+    async def view_borrowed_books(self, user_id, limit=None, after=None):
+        return await self._run(Library.view_borrowed_books, user_id, limit, after)
+
+    async def view_loans(self, user_id=None, limit=None, after=None, with_user=False):
+        return await self._run(Library.view_loans, user_id, limit, after, with_user)
+
+    async def view_holds(self, user_id=None, isbn=None, status=None, limit=None, after=None):
+        return await self._run(Library.view_holds, user_id, isbn, status, limit, after)
+
+    async def holds_ready_for_pickup(self, user_id=None, limit=None, after=None):
+        return await self._run(Library.holds_ready_for_pickup, user_id, limit, after)
+
+    async def view_loan_history(self, user_id=None, period=None, limit=None, after=None):
+        return await self._run(Library.view_loan_history, user_id, period, limit, after)
+
+    async def stats(self, period=None, start=None, end=None, limit=10):
+        return await self._run(Library.stats, period, start, end, limit)
+
+    async def search_books(self, title=None, author=None, isbn=None, query=None, limit=None, offset=0, after=None):
+        return await self._run(Library.search_books, title, author, isbn, query, limit, offset, after)
+
+    async def search_users(self, name=None, user_id=None, limit=None, after=None):
+        return await self._run(Library.search_users, name, user_id, limit, after)
+
+    async def fuzzy_search_books(self, title=None, author=None, query=None, threshold=None, limit=20):
+        return await self._run(Library.fuzzy_search_books, title, author, query, threshold, limit)
+
+    async def fuzzy_search_users(self, name, threshold=None, limit=20):
+        return await self._run(Library.fuzzy_search_users, name, threshold, limit)
+
+    async def verify_loan_counters(self):
+        return await self._run(Library.verify_loan_counters)
+
+    async def rebuild_loan_counters(self):
+        return await self._run(Library.rebuild_loan_counters)
+
+    async def rebuild_circulation_stats(self):
+        return await self._run(Library.rebuild_circulation_stats)
+
+    async def rebuild_search_index(self):
+        return await self._run(Library.rebuild_search_index)
+
+    # Потоковые варианты: записи читаются страницами по batch_size с курсором по ключу
+
+    async def iter_books(self, title=None, author=None, isbn=None, query=None, batch_size=1000):
+        # Страницы search_books согласованы только при упорядочении по ISBN, которое включает after
+        after = 0
+        while True:
+            books = await self.search_books(title, author, isbn, query, limit=batch_size, after=after)
+            if not books:
+                return
+            for book in books:
+                yield book
+            after = books[-1].isbn
+
+    async def iter_users(self, name=None, user_id=None, batch_size=1000):
+        after = None
+        while True:
+            users = await self.search_users(name, user_id, limit=batch_size, after=after)
+            if not users:
+                return
+            for user in users:
+                yield user
+            after = users[-1].user_id
+
+    async def iter_borrowed_books(self, user_id, batch_size=1000):
+        after = None
+        while True:
+            borrowed_books, _ = await self.view_borrowed_books(user_id, limit=batch_size, after=after)
+            if not borrowed_books:
+                return
+            for borrowed_book in borrowed_books:
+                yield borrowed_book
+            after = borrowed_books[-1].id
+
+    async def iter_loans(self, user_id=None, batch_size=1000, with_user=False):
+        after = None
+        while True:
+            loans = await self.view_loans(user_id, limit=batch_size, after=after, with_user=with_user)
+            if not loans:
+                return
+            for loan in loans:
+                yield loan
+            after = loans[-1].id
+
+    async def iter_loan_history(self, user_id=None, period=None, batch_size=1000):
+        after = None
+        while True:
+            history = await self.view_loan_history(user_id, period, limit=batch_size, after=after)
+            if not history:
+                return
+            for loan in history:
+                yield loan
+            after = history[-1].id
@@ -0,0 +1,104 @@
+# /src/batching.py
+# Групповая фиксация изменений: операции Library, поступающие из разных потоков, выполняются одним
+# потоком-писателем и фиксируются общей транзакцией (один COMMIT и одна синхронизация файла на пакет)
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import Session
+
+from library import Library
+
+
+class WriteBatcher:
+    # Пакет набирается, пока не пройдет window_ms с момента первой операции или не наберется max_batch
+    # операций. Каждая операция выполняется в своей точке сохранения (SAVEPOINT): commit и rollback внутри
+    # методов Library фиксируют или откатывают только ее, поэтому ошибка одной операции не откатывает
+    # остальные операции пакета. Результат возвращается вызывающему только после фиксации пакета.
+    def __init__(self, library, window_ms=2, max_batch=64):
+        self.library = library
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='library-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args, **kwargs):
+        # operation - функция Library (например, Library.borrow_book); блокирует до фиксации пакета
+        if not self._thread.is_alive():
+            raise RuntimeError("Поток записи остановлен")
+        future = Future()
+        self._queue.put((future, operation, args, kwargs))
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {'batches': self.batches, 'operations': self.operations,
+                'operations_per_batch': self.operations / self.batches if self.batches else 0.0}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        results = []
+        try:
+            # Транзакция начинается явно (BEGIN IMMEDIATE): в обычном режиме драйвер sqlite3 не начинает
+            # транзакцию перед SAVEPOINT, и освобождение первой точки сохранения фиксировало бы ее сразу
+            with self.library.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.begin()
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                for future, operation, args, kwargs in batch:
+                    results.append(self._apply(connection, operation, args, kwargs))
+                connection.commit()
+        except Exception as e:
+            for future, *_ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            # Читатели могли закэшировать значения между изменением и фиксацией пакета
+            self.library.cache.clear()
+        self.batches += 1
+        self.operations += len(batch)
+        for (future, *_), (result, error) in zip(batch, results):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _apply(self, connection, operation, args, kwargs):
+        session = Session(bind=connection, join_transaction_mode='create_savepoint', expire_on_commit=False)
+        library = Library.for_session(session, self.library.full_text_search, self.library.cache,
+                                      self.library.read_only_records, raise_errors=True)
+        try:
+            result = operation(library, *args, **kwargs)
+            session.commit()
+            return result, None
+        except Exception as e:
+            session.rollback()
+            return None, e
+        finally:
+            session.close()
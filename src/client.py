@@ -0,0 +1,119 @@
+# /src/client.py
+# Клиент службы библиотеки (service.py) для рабочих мест: те же методы, что у Library, выполняемые
+# через JSON API. Модуль использует только стандартную библиотеку и не загружает SQLAlchemy.
+import http.client
+import json
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+PAGE_SIZE = 100  # Количество записей, запрашиваемых за раз методами iter_*
+
+
+class ServiceError(Exception):
+    pass
+
+
+class RemoteRecord(SimpleNamespace):
+    # Запись, полученная от службы: поля доступны как атрибуты, str() - как у объекта на стороне службы
+    def __init__(self, record_type, fields, text):
+        super().__init__(**fields)
+        self._type = record_type
+        self._text = text
+
+    def __str__(self):
+        return self._text
+
+
+def decode(value):
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        if '__record__' in value:
+            return RemoteRecord(value['__record__'], decode(value['fields']), value['text'])
+        return {key: decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+def encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+class LibraryClient:
+    # Каждый поток использует свое постоянное HTTP-соединение
+    def __init__(self, url='http://127.0.0.1:8765', timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def call(self, name, *args, **kwargs):
+        body = json.dumps({'args': encode(args), 'kwargs': {key: encode(value) for key, value in kwargs.items()}})
+        reused = getattr(self._local, 'connection', None) is not None
+        try:
+            status, payload = self._request(body, name)
+        except (ConnectionError, http.client.HTTPException):
+            # Служба могла закрыть простаивавшее соединение (например, после перезапуска):
+            # запрос повторяется по новому соединению, ошибка нового соединения передается вызывающему
+            self._close_connection()
+            if not reused:
+                raise
+            status, payload = self._request(body, name)
+        if status != 200:
+            # Ошибки бизнес-правил передаются как ValueError, чтобы их обработка не отличалась от Library
+            error = ValueError if payload.get('type') == 'ValueError' else ServiceError
+            raise error(payload.get('error'))
+        return decode(payload['result'])
+
+    def _request(self, body, name):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        connection.request('POST', f'/call/{name}', body.encode('utf-8'), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def _close_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    # Потоковые методы Library выполняются постранично по ключу последней полученной записи
+
+    def _pages(self, name, key, *args, after=None, **kwargs):
+        while True:
+            rows = self.call(name, *args, limit=PAGE_SIZE, after=after, **kwargs) or []
+            yield from rows
+            if len(rows) < PAGE_SIZE:
+                return
+            after = getattr(rows[-1], key)
+
+    def iter_books(self, title=None, author=None, isbn=None, query=None, batch_size=None):
+        # Страницы search_books согласованы только при упорядочении по ISBN, которое включает after
+        return self._pages('search_books', 'isbn', title, author, isbn, query, after=0)
+
+    def iter_users(self, name=None, user_id=None, batch_size=None):
+        return self._pages('search_users', 'user_id', name, user_id)
+
+    def iter_loans(self, user_id=None, batch_size=None, with_user=False):
+        return self._pages('view_loans', 'id', user_id, with_user=with_user)
+
+    def iter_loan_history(self, user_id=None, period=None, batch_size=None):
+        return self._pages('view_loan_history', 'id', user_id, period)
+
+    def close_connection(self):
+        self._close_connection()
@@ -0,0 +1,192 @@
+# /src/exporter.py
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, select
+
+from library import Library
+from models import Book, BorrowedBook, LoanHistory, User
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet недоступен, столбцовый формат заменяется сжатым CSV
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = 10_000  # Количество строк, читаемых из базы и записываемых в файл за раз
+
+TABLES = {
+    'books': Book.__table__,
+    'users': User.__table__,
+    'borrowed_books': BorrowedBook.__table__,
+    'loan_history': LoanHistory.__table__,
+}
+
+# Столбцы, по которым выгрузка может продолжаться с отметки предыдущей (high-water mark).
+# Записи loan_history не изменяются и не удаляются, поэтому их ID только растут; ID в borrowed_books
+# SQLite может использовать повторно после возврата книги, поэтому новые выдачи отбираются по дате.
+# Книги и пользователи не хранят время изменения и всегда выгружаются целиком.
+INCREMENTAL = {
+    'borrowed_books': BorrowedBook.__table__.c.borrow_date,
+    'loan_history': LoanHistory.__table__.c.id,
+}
+
+FORMATS = ('columnar', 'parquet', 'csv', 'csv.gz')
+
+
+def resolve_format(format):
+    # columnar - Parquet, если установлен pyarrow, иначе CSV со сжатием gzip
+    if format == 'columnar':
+        return 'parquet' if pyarrow is not None else 'csv.gz'
+    if format == 'parquet' and pyarrow is None:
+        raise ValueError("Для выгрузки в Parquet требуется пакет pyarrow")
+    if format not in FORMATS:
+        raise ValueError(f"Неподдерживаемый формат выгрузки: {format}")
+    return format
+
+
+class CsvWriter:
+    def __init__(self, path, columns, compress=False):
+        self.file = gzip.open(path, 'wt', newline='', encoding='utf-8') if compress else \
+            open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(column.name for column in columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        self.schema = pyarrow.schema([(column.name, self._arrow_type(column.type)) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    @staticmethod
+    def _arrow_type(column_type):
+        if isinstance(column_type, Integer):
+            return pyarrow.int64()
+        if isinstance(column_type, Float):
+            return pyarrow.float64()
+        if isinstance(column_type, DateTime):
+            return pyarrow.timestamp('us')
+        return pyarrow.string()
+
+    def write(self, rows):
+        # Порция записывается отдельной группой строк файла
+        arrays = [pyarrow.array([row[index] for row in rows], type=field.type)
+                  for index, field in enumerate(self.schema)]
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path, columns, format):
+    if format == 'parquet':
+        return ParquetWriter(path, columns)
+    return CsvWriter(path, columns, compress=format == 'csv.gz')
+
+
+def export_table(library, table_name, path, format='csv', since=None, chunk_size=None):
+    # Выгружает таблицу порциями по chunk_size строк, в памяти находится не больше одной порции.
+    # since - отметка предыдущей выгрузки для таблиц из INCREMENTAL: выгружаются только более новые строки.
+    # Возвращает количество строк и новую отметку (максимальное значение ключа среди выгруженных строк).
+    table = TABLES[table_name]
+    format = resolve_format(format)
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    key = INCREMENTAL.get(table_name)
+    statement = select(table)
+    if key is not None:
+        if since is not None:
+            statement = statement.where(key > since)
+        statement = statement.order_by(key, *table.primary_key.columns)
+    else:
+        statement = statement.order_by(*table.primary_key.columns)
+
+    start = time.perf_counter()
+    rows = 0
+    high_water_mark = since
+    writer = open_writer(path, table.columns, format)
+    try:
+        with library.engine.connect() as connection:
+            result = connection.execution_options(yield_per=chunk_size).execute(statement)
+            for chunk in result.partitions():
+                writer.write(chunk)
+                rows += len(chunk)
+                if key is not None:
+                    high_water_mark = chunk[-1]._mapping[key.name]
+    finally:
+        writer.close()
+    return {'table': table_name, 'path': path, 'format': format, 'rows': rows,
+            'high_water_mark': high_water_mark, 'seconds': time.perf_counter() - start}
+
+
+def load_state(path):
+    # Отметки предыдущей выгрузки; даты хранятся в файле в формате ISO
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    return {name: datetime.fromisoformat(value) if isinstance(INCREMENTAL[name].type, DateTime) else value
+            for name, value in state.items() if name in INCREMENTAL and value is not None}
+
+
+def save_state(path, state):
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({name: value.isoformat() if isinstance(value, datetime) else value
+                   for name, value in state.items()}, f, indent=2)
+    os.replace(temporary, path)
+
+
+def export_database(library, directory, tables=None, format='columnar', state_file=None, chunk_size=None):
+    # Выгружает таблицы в каталог. С state_file выгрузка инкрементальная: файлы получают метку времени
+    # в имени, а новые отметки сохраняются только после успешной выгрузки всех таблиц.
+    format = resolve_format(format)
+    os.makedirs(directory, exist_ok=True)
+    state = load_state(state_file)
+    suffix = f"-{datetime.now():%Y%m%dT%H%M%S}" if state_file else ""
+    results = []
+    for table_name in tables or TABLES:
+        path = os.path.join(directory, f"{table_name}{suffix}.{format}")
+        result = export_table(library, table_name, path, format, state.get(table_name), chunk_size)
+        if table_name in INCREMENTAL and result['high_water_mark'] is not None:
+            state[table_name] = result['high_water_mark']
+        results.append(result)
+    if state_file:
+        save_state(state_file, state)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка таблиц библиотеки в CSV/Parquet")
+    parser.add_argument('directory', help="Каталог для файлов выгрузки")
+    parser.add_argument('--db', default='library.db', help="Файл базы данных")
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLES), help="Таблицы (по умолчанию все)")
+    parser.add_argument('--format', choices=FORMATS, default='columnar',
+                        help="columnar - Parquet при установленном pyarrow, иначе csv.gz")
+    parser.add_argument('--state', help="Файл отметок для инкрементальной выгрузки")
+    parser.add_argument('--chunk-size', type=int, default=None, help="Количество строк в одной порции")
+    args = parser.parse_args(argv)
+
+    library = Library(args.db)
+    try:
+        results = export_database(library, args.directory, args.tables, args.format, args.state, args.chunk_size)
+    finally:
+        library.close_connection()
+    for result in results:
+        rows_per_sec = result['rows'] / result['seconds'] if result['seconds'] > 0 else 0.0
+        print(f"{result['table']}: {result['rows']} строк -> {result['path']} "
+              f"за {result['seconds']:.2f} с ({rows_per_sec:.0f} строк/с)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# /src/importer.py
+import argparse
+import csv
+import json
+import os
+import time
+
+from library import Library
+
+
+def read_csv(path):
+    # Строки читаются по одной, файл целиком в память не загружается
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+READERS = {
+    '.csv': read_csv,
+    '.jsonl': read_jsonl,
+    '.ndjson': read_jsonl,
+}
+
+
+def import_catalog(library, path, chunk_size=None, upsert=True, defer_search_index=False):
+    extension = os.path.splitext(path)[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Неподдерживаемый формат файла каталога: {extension}")
+
+    start = time.perf_counter()
+    rows = library.add_books(reader(path), chunk_size=chunk_size, upsert=upsert, defer_search_index=defer_search_index)
+    elapsed = time.perf_counter() - start
+    rows_per_sec = rows / elapsed if elapsed > 0 else 0.0
+    return {'rows': rows, 'seconds': elapsed, 'rows_per_sec': rows_per_sec}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовая загрузка каталога книг из CSV/JSONL")
+    parser.add_argument('path', help="Файл каталога (.csv с заголовком isbn,title,author,copies или .jsonl)")
+    parser.add_argument('--db', default='library.db', help="Файл базы данных")
+    parser.add_argument('--chunk-size', type=int, default=None, help="Количество книг в одной транзакции")
+    parser.add_argument('--no-upsert', action='store_true', help="Не обновлять книги с уже существующим ISBN")
+    parser.add_argument('--defer-search-index', action='store_true',
+                        help="Не индексировать порции, построить индекс поиска заново после загрузки")
+    args = parser.parse_args(argv)
+
+    library = Library(args.db)
+    try:
+        stats = import_catalog(library, args.path, chunk_size=args.chunk_size, upsert=not args.no_upsert,
+                               defer_search_index=args.defer_search_index)
+    finally:
+        library.close_connection()
+    print(f"Загружено книг: {stats['rows']} за {stats['seconds']:.2f} с ({stats['rows_per_sec']:.0f} строк/с)")
+
+
+if __name__ == '__main__':
+    main()
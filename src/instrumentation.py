@@ -0,0 +1,273 @@
+# /src/instrumentation.py
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Границы корзин гистограммы длительности вызовов, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Служебные методы Library, которые не измеряются
+NOT_INSTRUMENTED = {'for_session', 'unit_of_work', 'release_session', 'close_connection', 'cache_stats'}
+
+# Запросы, для которых имеет смысл EXPLAIN QUERY PLAN
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_current_call = contextvars.ContextVar('library_call', default=None)
+
+
+def _instrumentation_logger():
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+    if not logger.handlers:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        logger.addHandler(stream_handler)
+    return logger
+
+
+class _Call:
+    # Текущий вызов метода Library; SQL-запросы засчитываются самому внутреннему вызову,
+    # а при его завершении - и вызвавшему методу
+    def __init__(self, method, parent):
+        self.method = method
+        self.parent = parent
+        self.statements = 0
+
+
+class _MethodStats:
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.statements = 0
+        self.max_statements = 0
+
+
+class Instrumentation:
+    # Необязательный сбор метрик Library: гистограммы длительности методов, количество SQL-запросов
+    # на вызов (по событиям движка SQLAlchemy), журнал медленных запросов с планом выполнения
+    # и выгрузка метрик в текстовом виде и в формате Prometheus.
+    # Подключается через Library(..., instrumentation=Instrumentation()); без него Library не измеряется.
+
+    def __init__(self, slow_ms=100, explain=True, on_slow=None, buckets=LATENCY_BUCKETS, keep_slow=100):
+        self.slow_seconds = slow_ms / 1000 if slow_ms is not None else None
+        self.explain = explain
+        self.on_slow = on_slow  # Вызывается с описанием каждого медленного запроса или вызова
+        self.buckets = tuple(buckets)
+        self.slow_queries = deque(maxlen=keep_slow)
+        self._methods = {}
+        self._statements_outside_calls = 0
+        self._engines = set()
+        self._lock = threading.Lock()
+        self.logger = _instrumentation_logger()
+
+    def attach(self, library):
+        # Оборачивает публичные методы экземпляра и подписывается на события его движка
+        self.attach_engine(library.engine)
+        for name, method in inspect.getmembers(type(library), inspect.isfunction):
+            if name.startswith('_') or name in NOT_INSTRUMENTED or inspect.isgeneratorfunction(method):
+                continue
+            setattr(library, name, self.wrap(getattr(library, name), name))
+        return library
+
+    def attach_engine(self, engine):
+        engine = getattr(engine, 'sync_engine', engine)
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def wrap(self, method, name):
+        @functools.wraps(method)
+        def instrumented(*args, **kwargs):
+            with self.measure(name):
+                return method(*args, **kwargs)
+        return instrumented
+
+    @contextmanager
+    def measure(self, method):
+        call = _Call(method, _current_call.get())
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield call
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_call.reset(token)
+            if call.parent is not None:
+                call.parent.statements += call.statements
+            self._record_call(call, elapsed, failed)
+
+    def _record_call(self, call, elapsed, failed):
+        with self._lock:
+            stats = self._methods.get(call.method)
+            if stats is None:
+                stats = self._methods[call.method] = _MethodStats(self.buckets)
+            stats.count += 1
+            stats.errors += failed
+            stats.seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stats.statements += call.statements
+            stats.max_statements = max(stats.max_statements, call.statements)
+            for index, bound in enumerate(self.buckets):
+                if elapsed <= bound:
+                    stats.bucket_counts[index] += 1
+                    break
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            self._report_slow({'kind': 'call', 'method': call.method, 'ms': elapsed * 1000,
+                               'statements': call.statements})
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('instrumentation_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['instrumentation_start'].pop()
+        call = _current_call.get()
+        if call is not None:
+            call.statements += 1
+        else:
+            with self._lock:
+                self._statements_outside_calls += 1
+        if self.slow_seconds is None or elapsed < self.slow_seconds:
+            return
+        record = {'kind': 'query', 'method': call.method if call is not None else None, 'ms': elapsed * 1000,
+                  'statement': statement, 'parameters': None if executemany else parameters}
+        if self.explain and not executemany and statement.lstrip().upper().startswith(EXPLAINABLE):
+            record['plan'] = self._explain(conn, statement, parameters)
+        with self._lock:
+            self.slow_queries.append(record)
+        self._report_slow(record)
+
+    def _explain(self, conn, statement, parameters):
+        # План выполняется отдельным курсором того же соединения, чтобы видеть те же данные и индексы
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        except Exception as e:
+            return [f"EXPLAIN QUERY PLAN не выполнен: {e}"]
+        finally:
+            cursor.close()
+
+    def _report_slow(self, record):
+        if record['kind'] == 'query':
+            plan = "; ".join(record.get('plan') or [])
+            self.logger.warning(f"Медленный запрос ({record['ms']:.1f} мс, {record['method']}): "
+                                f"{' '.join(record['statement'].split())} | план: {plan}")
+        else:
+            self.logger.warning(f"Медленный вызов {record['method']}: {record['ms']:.1f} мс, "
+                                f"SQL-запросов: {record['statements']}")
+        if self.on_slow is not None:
+            self.on_slow(record)
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self.slow_queries.clear()
+            self._statements_outside_calls = 0
+
+    def snapshot(self):
+        # Текущие метрики по методам: количество вызовов, ошибки, время и SQL-запросы на вызов
+        with self._lock:
+            methods = {}
+            for name, stats in sorted(self._methods.items()):
+                methods[name] = {
+                    'calls': stats.count,
+                    'errors': stats.errors,
+                    'seconds': stats.seconds,
+                    'mean_ms': stats.seconds / stats.count * 1000,
+                    'p50_ms': self._quantile(stats, 0.5) * 1000,
+                    'p95_ms': self._quantile(stats, 0.95) * 1000,
+                    'p99_ms': self._quantile(stats, 0.99) * 1000,
+                    'max_ms': stats.max_seconds * 1000,
+                    'statements': stats.statements,
+                    'statements_per_call': stats.statements / stats.count,
+                    'max_statements': stats.max_statements,
+                    'buckets': list(zip(self.buckets, stats.bucket_counts)),
+                }
+            return {'methods': methods, 'statements_outside_calls': self._statements_outside_calls,
+                    'slow_queries': len(self.slow_queries)}
+
+    def _quantile(self, stats, q):
+        # Оценка квантиля по гистограмме: верхняя граница корзины, в которую он попадает
+        rank = q * stats.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, stats.bucket_counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, stats.max_seconds)
+        return stats.max_seconds
+
+    def render_text(self):
+        snapshot = self.snapshot()
+        lines = [f"{'Метод':<28}{'вызовов':>9}{'ошибок':>8}{'сред, мс':>10}{'p50, мс':>10}{'p95, мс':>10}"
+                 f"{'макс, мс':>10}{'SQL/вызов':>11}{'макс SQL':>10}"]
+        for name, stats in snapshot['methods'].items():
+            lines.append(f"{name:<28}{stats['calls']:>9}{stats['errors']:>8}{stats['mean_ms']:>10.2f}"
+                         f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['max_ms']:>10.2f}"
+                         f"{stats['statements_per_call']:>11.2f}{stats['max_statements']:>10}")
+        lines.append(f"SQL-запросов вне методов Library: {snapshot['statements_outside_calls']}")
+        with self._lock:
+            slow_queries = list(self.slow_queries)
+        lines.append(f"Медленные запросы: {len(slow_queries)}")
+        for record in slow_queries:
+            lines.append(f"  {record['ms']:.1f} мс [{record['method']}] {' '.join(record['statement'].split())}")
+            for step in record.get('plan') or []:
+                lines.append(f"    {step}")
+        return "\n".join(lines) + "\n"
+
+    def render_prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP library_call_duration_seconds Длительность вызовов методов Library",
+            "# TYPE library_call_duration_seconds histogram",
+        ]
+        for name, stats in snapshot['methods'].items():
+            cumulative = 0
+            for bound, count in stats['buckets']:
+                cumulative += count
+                lines.append(f'library_call_duration_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'library_call_duration_seconds_bucket{{method="{name}",le="+Inf"}} {stats["calls"]}')
+            lines.append(f'library_call_duration_seconds_sum{{method="{name}"}} {stats["seconds"]}')
+            lines.append(f'library_call_duration_seconds_count{{method="{name}"}} {stats["calls"]}')
+        for metric, key, kind, help_text in (
+            ('library_call_errors_total', 'errors', 'counter', "Вызовы, завершившиеся исключением"),
+            ('library_sql_statements_total', 'statements', 'counter', "SQL-запросы, выполненные методом"),
+            ('library_sql_statements_max', 'max_statements', 'gauge', "Наибольшее число SQL-запросов за вызов"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in snapshot['methods'].items():
+                lines.append(f'{metric}{{method="{name}"}} {stats[key]}')
+        lines += [
+            "# HELP library_slow_queries Медленные запросы в журнале",
+            "# TYPE library_slow_queries gauge",
+            f"library_slow_queries {snapshot['slow_queries']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, format='prometheus'):
+        # Файл заменяется атомарно, поэтому сборщик (например, textfile collector node_exporter)
+        # не прочитает его наполовину записанным
+        content = self.render_prometheus() if format == 'prometheus' else self.render_text()
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temporary, path)
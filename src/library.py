@@ -1,74 +1,340 @@
 # /src/library.py
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from itertools import islice
+import functools
+import math
+import re
+from sqlalchemy import create_engine, Float, Integer, DateTime, and_, bindparam, case, column, delete, event, exists, func, inspect, literal, literal_column, null, select, text, update, values
+from sqlalchemy.orm import aliased, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import logging
 
-Base = declarative_base()
+from cache import LRUCache
+from models import (ACTUAL_LOANS_SQL, CIRCULATION_STATS, DEFAULT_LOAN_POLICIES, RECORDS, Book, BookDailyStats,
+                    BookMonthlyStats, BookStatsRecord, BorrowedBook, Hold, HoldRecord, LoanHistory, LoanPolicy,
+                    LoanPolicyRecord, LoanRecord, SearchPosting, SearchTrigram, SearchWord, User, UserDailyStats,
+                    UserMonthlyStats, UserStatsRecord, backfill_circulation_stats, books_fts, build_search_index,
+                    has_full_text_search, index_books, prune_search_words, recount_active_loans, search_index_deferred,
+                    search_words_of, unindex_books, upgrade_schema, word_trigrams)
 
-class User(Base):
-    __tablename__ = 'users'
+def create_library_engine(db_file, pool_size=5, max_overflow=10, busy_timeout=5000):
+    if str(db_file) == ':memory:':
+        # База в памяти существует только внутри соединения, поэтому все потоки используют одно соединение
+        return create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
 
-    user_id = Column(Integer, primary_key=True)
-    name = Column(String)
-    penalty = Column(Float, default=0.0)
-    reputation = Column(Integer, default=100)
-    max_books = Column(Integer, default=10)
-    return_days = Column(Integer, default=14)
-class Book(Base):
-    __tablename__ = 'books'
+    # Соединения выдаются потокам из пула; WAL позволяет читать параллельно с записью,
+    # а busy_timeout заставляет писателя подождать освобождения блокировки вместо ошибки "database is locked"
+    engine = create_engine(f'sqlite:///{db_file}', poolclass=QueuePool, pool_size=pool_size,
+                           max_overflow=max_overflow, connect_args={'check_same_thread': False})
 
-    isbn = Column(Integer, primary_key=True)
-    title = Column(String)
-    author = Column(String)
-    copies = Column(Integer)
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, busy_timeout)
 
-    def __str__(self):
-        return f"ID: {self.isbn}, Название: {self.title}, Автор: {self.author}, Количество копий: {self.copies}"
+    return engine
 
-class BorrowedBook(Base):
-    __tablename__ = 'borrowed_books'
+def set_sqlite_pragmas(dbapi_connection, busy_timeout=5000):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.user_id'))
-    isbn = Column(Integer, ForeignKey('books.isbn'))
-    borrow_date = Column(DateTime, default=datetime.now)
-    return_date = Column(DateTime)
-    due_date = Column(DateTime)
+def _library_logger():
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.ERROR)
+    if not logger.handlers:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        logger.addHandler(stream_handler)
+    return logger
 
+class Library:
+    # Один экземпляр Library можно использовать из нескольких потоков: self.session - это scoped_session,
+    # и каждый поток работает со своей сессией и своим соединением из пула. Объекты, возвращенные методами,
+    # принадлежат сессии вызвавшего потока. Поток, завершивший обработку запроса, освобождает сессию
+    # через release_session(); для явной транзакции используется контекстный менеджер unit_of_work().
+    # Политики выдачи по умолчанию. Действующие лимиты, сроки и ставки штрафа хранятся в таблице loan_policies
+    # (loan_policies/set_loan_policy) и материализуются в строках пользователей
+    HIGH_REPUTATION_LIMIT = DEFAULT_LOAN_POLICIES['high'].max_books  # Максимальное количество книг для пользователей с высокой репутацией
+    MIDDLE_REPUTATION_LIMIT = DEFAULT_LOAN_POLICIES['middle'].max_books  # Максимальное количество книг для пользователей со средней репутацией
+    LOW_REPUTATION_LIMIT = DEFAULT_LOAN_POLICIES['low'].max_books  # Максимальное количество книг для пользователей с низкой репутацией
+    HIGH_REPUTATION_RETURN_DAYS = DEFAULT_LOAN_POLICIES['high'].return_days  # Срок возврата для пользователей с высокой репутацией (в днях)
+    MIDDLE_REPUTATION_RETURN_DAYS = DEFAULT_LOAN_POLICIES['middle'].return_days  # Срок возврата для пользователей со средней репутацией (в днях)
+    LOW_REPUTATION_RETURN_DAYS = DEFAULT_LOAN_POLICIES['low'].return_days  # Срок возврата для пользователей с низкой репутацией (в днях)
+    OVERDUE_PENALTY_PER_DAY = DEFAULT_LOAN_POLICIES['high'].penalty_per_day  # Штраф за каждый день просрочки
+    HOLD_PICKUP_DAYS = 3  # Срок, в течение которого закрепленная за резервом копия ждет владельца (в днях)
+    BULK_CHUNK_SIZE = 5000  # Количество книг в одной транзакции при массовой загрузке
+    FUZZY_THRESHOLD = 0.3  # Минимальное триграммное сходство слова при нечетком поиске
+    FUZZY_WORD_CANDIDATES = 50  # Количество похожих слов словаря, по которым ищется каждое слово запроса
+    # Изменяющие методы, которые в режиме групповой фиксации выполняются потоком записи. Обслуживающие
+    # операции тоже передаются ему: иначе их транзакции конкурировали бы с BEGIN IMMEDIATE потока записи
+    # за блокировку базы. Фиксации порций внутри них (compact_loans) освобождают только точку сохранения,
+    # все изменение фиксируется пакетом.
+    WRITE_OPERATIONS = frozenset({
+        'add_book', 'add_books', 'update_book', 'delete_book', 'register_user', 'update_user', 'delete_user',
+        'borrow_book', 'borrow_books', 'return_book', 'return_books', 'set_return_date',
+        'place_hold', 'cancel_hold',
+        'set_loan_policy', 'delete_loan_policy', 'process_overdues', 'expire_holds', 'compact_loans',
+        'rebuild_loan_counters', 'rebuild_circulation_stats', 'rebuild_search_index',
+    })
 
-    user = relationship("User")
-    book = relationship("Book")
+    def __init__(self, db_file='library.db', full_text_search=True, cache_size=0, cache_ttl=None,
+                 pool_size=5, max_overflow=10, busy_timeout=5000, instrumentation=None, read_only_records=False,
+                 group_commit=False, group_commit_window_ms=2, group_commit_max=64):
+        self.engine = create_library_engine(db_file, pool_size, max_overflow, busy_timeout)
+        upgrade_schema(self.engine)
+        # Если SQLite собран без FTS5, поиск книг выполняется через LIKE
+        with self.engine.connect() as connection:
+            self.full_text_search = full_text_search and has_full_text_search(connection)
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+        # Кэш книг и пользователей для view_*/…_exists; cache_size=0 (по умолчанию) отключает кэширование.
+        # Из кэша возвращаются отсоединенные от сессии копии, изменять их следует через update_*.
+        self.cache = LRUCache(cache_size, cache_ttl)
+        # Режим только для чтения: view_book, view_user, search_* и iter_books/iter_users возвращают
+        # неизменяемые записи BookRecord/UserRecord, выбранные запросом Core без карты идентичности сессии
+        self.read_only_records = read_only_records
+        self._policies = None
+        self.logger = _library_logger()
+        self.raise_errors = False
+        # Групповая фиксация: методы WRITE_OPERATIONS этого экземпляра передаются потоку записи
+        # batching.WriteBatcher, который фиксирует изменения всех потоков общей транзакцией раз в
+        # group_commit_window_ms мс или по group_commit_max операций. Метод возвращает результат
+        # (или исключение) своей операции после фиксации пакета.
+        self.batcher = None
+        if group_commit:
+            from batching import WriteBatcher
+            self.batcher = WriteBatcher(self, group_commit_window_ms, group_commit_max)
+            for name in self.WRITE_OPERATIONS:
+                setattr(self, name, self._group_committed(getattr(type(self), name)))
+        # Сбор метрик (instrumentation.Instrumentation) включается явно и оборачивает методы этого экземпляра
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self)
 
-    def set_due_date(self):
-        self.due_date = datetime.now() + timedelta(days=14)
+    @classmethod
+    def for_session(cls, session, full_text_search=False, cache=None, read_only_records=False, raise_errors=False):
+        # Library без собственного движка, выполняющая операции в переданной сессии.
+        # Через нее AsyncLibrary применяет те же бизнес-правила, что и синхронный класс.
+        # raise_errors=True - borrow_book, return_book и set_return_date не только записывают ошибку в журнал,
+        # но и передают ее вызывающему (пакет групповой фиксации возвращает ее операции, которая ее вызвала).
+        library = cls.__new__(cls)
+        library.engine = session.get_bind()
+        library.session = session
+        library.full_text_search = full_text_search
+        library.cache = cache if cache is not None else LRUCache(0)
+        library.read_only_records = read_only_records
+        library._policies = None
+        library.logger = _library_logger()
+        library.instrumentation = None
+        library.batcher = None
+        library.raise_errors = raise_errors
+        return library
 
-class Library:
-    HIGH_REPUTATION_LIMIT = 10  # Максимальное количество книг для пользователей с высокой репутацией
-    MIDDLE_REPUTATION_LIMIT = 5  # Максимальное количество книг для пользователей со средней репутацией
-    LOW_REPUTATION_LIMIT = 2   # Максимальное количество книг для пользователей с низкой репутацией
-    HIGH_REPUTATION_RETURN_DAYS = 14  # Срок возврата для пользователей с высокой репутацией (в днях)
-    MIDDLE_REPUTATION_RETURN_DAYS = 7  # Срок возврата для пользователей со средней репутацией (в днях)
-    LOW_REPUTATION_RETURN_DAYS = 3    # Срок возврата для пользователей с низкой репутацией (в днях)
-
-    def __init__(self, db_file='library.db'):
-        self.engine = create_engine(f'sqlite:///{db_file}')
-        Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.ERROR)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(formatter)
-        self.logger.addHandler(stream_handler)
+    def _group_committed(self, operation):
+        @functools.wraps(operation)
+        def submit(*args, **kwargs):
+            try:
+                return self.batcher.submit(operation, *args, **kwargs)
+            finally:
+                # Объекты, загруженные сессией вызывающего потока до фиксации пакета, устарели;
+                # политики выдачи могли измениться в экземпляре потока записи
+                self.session.expire_all()
+                self._policies = None
+        return submit
+
+    @contextmanager
+    def unit_of_work(self):
+        # Сессия текущего потока: изменения фиксируются при успешном выходе из блока,
+        # откатываются при исключении, после чего сессия освобождается
+        session = self.session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self.session.remove()
+
+    def release_session(self):
+        self.session.remove()
+
+    def verify_loan_counters(self):
+        # Возвращает список (user_id, значение счетчика, фактическое количество) для расхождений
+        rows = self.session.execute(text(
+            f"SELECT user_id, active_loans, {ACTUAL_LOANS_SQL} AS actual FROM users "
+            f"WHERE active_loans != {ACTUAL_LOANS_SQL} ORDER BY user_id"
+        ))
+        return [tuple(row) for row in rows]
+
+    def rebuild_loan_counters(self):
+        # Пересчитывает счетчики по таблице borrowed_books, возвращает количество исправленных пользователей
+        try:
+            fixed = recount_active_loans(self.session.connection())
+            self.session.commit()
+            self.cache.clear()
+            return fixed
+        except Exception as e:
+            self.logger.error(f"Ошибка при пересчете количества взятых книг: {e}")
+            self.session.rollback()
+            raise
+
+    def rebuild_circulation_stats(self):
+        # Заполняет сводки статистики выдач заново по borrowed_books и loan_history,
+        # возвращает количество строк дневной сводки по книгам
+        try:
+            connection = self.session.connection()
+            for model, *_ in CIRCULATION_STATS:
+                connection.execute(delete(model))
+            rows = backfill_circulation_stats(connection)
+            self.session.commit()
+            return rows
+        except Exception as e:
+            self.logger.error(f"Ошибка при пересчете статистики выдач: {e}")
+            self.session.rollback()
+            raise
+
+    def rebuild_search_index(self):
+        # Строит индекс нечеткого поиска заново и снимает флаг отложенной индексации (add_books),
+        # возвращает количество слов в словаре
+        try:
+            connection = self.session.connection()
+            for model in (SearchPosting, SearchTrigram, SearchWord):
+                connection.execute(delete(model))
+            words = build_search_index(connection)
+            connection.execute(search_index_deferred.delete())
+            self.session.commit()
+            return words
+        except Exception as e:
+            self.logger.error(f"Ошибка при построении индекса нечеткого поиска: {e}")
+            self.session.rollback()
+            raise
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    @staticmethod
+    def _cache_key(kind, key):
+        # ID из пользовательского ввода приходят строками; некорректные значения не кэшируются
+        try:
+            return kind, int(key)
+        except (TypeError, ValueError):
+            return None
+
+    def _cached(self, model, kind, key_name, key):
+        cache_key = self._cache_key(kind, key)
+        if cache_key is not None:
+            instance = self.cache.get(cache_key)
+            if instance is not None:
+                return instance
+        query = self.session.query(model).filter_by(**{key_name: key})
+        if self.read_only_records:
+            # Запись неизменяема, поэтому кэшируется без копирования
+            instance = next(self._records(query.limit(1), model), None)
+            if instance is not None and cache_key is not None:
+                self.cache.put(cache_key, instance)
+            return instance
+        instance = query.first()
+        if instance is not None and cache_key is not None and self.cache.maxsize:
+            # Копия со значениями столбцов, не привязанная к сессии
+            mapper = inspect(model)
+            instance = model(**{attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs})
+            self.cache.put(cache_key, instance)
+        return instance
+
+    def _records(self, query, model, batch_size=None):
+        # Выполняет запрос ORM как SELECT столбцов таблицы через Core и возвращает записи RECORDS[model]
+        statement = query.with_entities(*model.__table__.columns).statement
+        if batch_size is not None:
+            statement = statement.execution_options(yield_per=batch_size)
+        return map(RECORDS[model]._make, self.session.connection().execute(statement))
+
+    def _invalidate(self, user_id=None, isbn=None):
+        keys = [self._cache_key('user', user_id), self._cache_key('book', isbn)]
+        self.cache.invalidate(*(key for key in keys if key is not None))
+
+    @staticmethod
+    def _due_date(borrow_date):
+        # Срок возврата по сроку пользователя, вычисляемый в SQL. Доли секунды дописываются строкой,
+        # чтобы дата хранилась в том же формате, в котором SQLAlchemy записывает остальные даты.
+        return func.strftime('%Y-%m-%d %H:%M:%S', literal(borrow_date, DateTime),
+                             func.printf('+%d days', User.return_days)).op('||')(borrow_date.strftime('.%f'))
 
     def add_book(self, isbn, title, author, copies):
         new_book = Book(isbn=isbn, title=title, author=author, copies=copies)
         self.session.add(new_book)
         self.session.commit()
 
+    def add_books(self, books, chunk_size=None, upsert=True, defer_search_index=False):
+        # Массовая загрузка: книги читаются из итератора пакетами, каждый пакет
+        # вставляется одним executemany и фиксируется одной транзакцией.
+        # При upsert=True у существующих ISBN обновляются название и автор, иначе книги остаются без изменений.
+        # copies - количество доступных сейчас копий (выдача его уменьшает), поэтому повторный импорт каталога
+        # его не перезаписывает: иначе выданные копии снова считались бы доступными.
+        # defer_search_index=True - для загрузки большого каталога: порции не индексируются, флаг
+        # search_index_deferred остается установленным до конца загрузки, после которой индекс строится
+        # заново одним rebuild_search_index. Если загрузка прервана ошибкой, индекс остается неполным
+        # до следующего rebuild_search_index.
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        table = Book.__table__
+        stmt = sqlite_insert(table)
+        if upsert:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.isbn],
+                set_={name: stmt.excluded[name] for name in ('title', 'author')},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.isbn])
+
+        rows = (self._book_row(book) for book in books)
+        total = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            try:
+                connection = self.session.connection()
+                connection.execute(search_index_deferred.delete())
+                connection.execute(search_index_deferred.insert().values(deferred=1))
+                if defer_search_index:
+                    self.session.execute(stmt, chunk)
+                else:
+                    # Индекс нечеткого поиска обновляется для порции целиком, а не триггерами по строкам:
+                    # новые книги и книги с измененным названием или автором, остальные не затрагиваются
+                    imported = {row['isbn']: (row['title'], row['author']) for row in chunk}
+                    existing = {isbn: (title, author) for isbn, title, author in self.session.execute(
+                        select(Book.isbn, Book.title, Book.author).where(Book.isbn.in_(imported)))}
+                    changed = [isbn for isbn in existing if upsert and imported[isbn] != existing[isbn]]
+                    unindexed = unindex_books(connection, changed) if changed else set()
+                    self.session.execute(stmt, chunk)
+                    index_books(connection, [isbn for isbn in imported if isbn not in existing] + changed)
+                    if unindexed:
+                        prune_search_words(connection, unindexed)
+                    connection.execute(search_index_deferred.delete())
+                self.session.commit()
+                self.cache.invalidate(*(('book', row['isbn']) for row in chunk))
+            except Exception as e:
+                self.logger.error(f"Ошибка при массовой загрузке книг: {e}")
+                self.session.rollback()
+                raise
+            total += len(chunk)
+        if defer_search_index and total:
+            self.rebuild_search_index()
+        return total
+
+    @staticmethod
+    def _book_row(book):
+        # Книга может быть передана словарем или кортежем (isbn, title, author, copies)
+        if isinstance(book, dict):
+            isbn, title, author, copies = (book.get(key) for key in ('isbn', 'title', 'author', 'copies'))
+        else:
+            isbn, title, author, copies = book
+        return {'isbn': int(isbn), 'title': title, 'author': author, 'copies': int(copies) if copies not in (None, '') else 1}
+
     def update_book(self, isbn, title=None, author=None, copies=None):
         book = self.session.query(Book).filter_by(isbn=isbn).first()
         if book:
@@ -79,24 +345,28 @@ class Library:
             if copies is not None:
                 book.copies = copies
             self.session.commit()
+            self._invalidate(isbn=isbn)
         else:
             raise ValueError("Книга с указанным ID не найдена.")
 
     def delete_book(self, isbn):
         book = self.session.query(Book).filter_by(isbn=isbn).first()
         if book:
+            self.session.execute(delete(Hold.__table__).where(Hold.__table__.c.isbn == isbn))
             self.session.delete(book)
             self.session.commit()
+            self._invalidate(isbn=isbn)
         else:
             raise ValueError("Книга с указанным ID не найдена.")
 
     def view_book(self, isbn):
-        book = self.session.query(Book).filter_by(isbn=isbn).first()
-        return book
+        return self._cached(Book, 'book', 'isbn', isbn)
 
     def book_exists(self, isbn):
-        book = self.session.query(Book).filter_by(isbn=isbn).first()
-        return book is not None
+        cache_key = self._cache_key('book', isbn)
+        if cache_key is not None and self.cache.get(cache_key) is not None:
+            return True
+        return self.session.query(exists().where(Book.isbn == isbn)).scalar()
 
     def register_user(self, user_id, name):
         new_user = User(user_id=user_id, name=name, reputation=100)  # Устанавливаем репутацию по умолчанию
@@ -104,83 +374,205 @@ class Library:
         self.session.commit()
 
     def user_exists(self, user_id):
-        user = self.session.query(User).filter_by(user_id=user_id).first()
-        return user is not None
+        cache_key = self._cache_key('user', user_id)
+        if cache_key is not None and self.cache.get(cache_key) is not None:
+            return True
+        return self.session.query(exists().where(User.user_id == user_id)).scalar()
 
     def close_connection(self):
-        self.session.close()
-        self.session = None
+        if self.batcher is not None:
+            self.batcher.close()
+        self.session.remove()
+        self.engine.dispose()
 
 
     def view_user(self, user_id):
-        user = self.session.query(User).filter_by(user_id=user_id).first()
-        return user
+        return self._cached(User, 'user', 'user_id', user_id)
 
     def update_user(self, user_id, name, max_books=None, reputation=None):
         user = self.session.query(User).filter_by(user_id=user_id).first()
         if user:
             user.name = name
-            if max_books is not None:
-                user.max_books = max_books
             if reputation is not None:
                 user.reputation = reputation
+                # Триггер пересчитывает политику пользователя при записи репутации; явный лимит применяется после
+                self.session.flush()
+            if max_books is not None:
+                user.max_books = max_books
             self.session.commit()
+            self._invalidate(user_id=user_id)
         else:
             raise ValueError("Пользователь с указанным ID не найден.")
 
     def delete_user(self, user_id):
         user = self.session.query(User).filter_by(user_id=user_id).first()
         if user:
+            # Копии, закрепленные за резервами пользователя, переходят следующим в очереди
+            holds = Hold.__table__
+            released = []
+            for hold in self.session.execute(
+                delete(holds).where(holds.c.user_id == user_id).returning(holds.c.isbn, holds.c.status)
+            ).all():
+                if hold.status == Hold.READY:
+                    self._release_copy(hold.isbn)
+                    released.append(hold.isbn)
             self.session.delete(user)
             self.session.commit()
+            self._invalidate(user_id=user_id)
+            for isbn in released:
+                self._invalidate(isbn=isbn)
         else:
             raise ValueError("Пользователь с указанным ID не найден.")
 
-    def borrow_book(self, user_id, isbn):
-        try:
-            user = self.session.query(User).filter_by(user_id=user_id).first()
-            book = self.session.query(Book).filter_by(isbn=isbn).first()
-
-            if user is None:
-                raise ValueError(f"Пользователь с ID {user_id} не найден.")
-            if book is None:
-                raise ValueError(f"Книга с ID {isbn} не найдена.")
-            if book.copies == 0:
-                raise ValueError("Нет доступных копий книги.")
+    def loan_policies(self):
+        # Политики выдачи по убыванию минимальной репутации. Список загружается один раз и обновляется
+        # после set_loan_policy/delete_loan_policy; сами правила применяются по значениям в строках users.
+        if self._policies is None:
+            self._policies = [LoanPolicyRecord._make(row) for row in self.session.execute(
+                select(*LoanPolicy.__table__.columns).order_by(LoanPolicy.min_reputation.desc()))]
+            self.session.commit()
+        return self._policies
 
-            # Определение максимального количества книг и срока возврата в зависимости от репутации пользователя
-            if user.reputation >= 80:
-                max_copies = self.HIGH_REPUTATION_LIMIT
-                return_days = self.HIGH_REPUTATION_RETURN_DAYS
-            elif 50 <= user.reputation < 80:
-                max_copies = self.MIDDLE_REPUTATION_LIMIT
-                return_days = self.MIDDLE_REPUTATION_RETURN_DAYS
+    def set_loan_policy(self, tier, min_reputation=None, max_books=None, return_days=None, penalty_per_day=None):
+        # Создает или изменяет политику уровня; для нового уровня обязательны все значения.
+        # Триггер loan_policies пересчитывает лимиты, сроки и ставки всех пользователей в той же транзакции.
+        params = {name: value for name, value in (('min_reputation', min_reputation), ('max_books', max_books),
+                                                  ('return_days', return_days), ('penalty_per_day', penalty_per_day))
+                  if value is not None}
+        try:
+            policy = self.session.get(LoanPolicy, tier)
+            if policy is None:
+                missing = [name for name in LoanPolicyRecord._fields[1:] if name not in params]
+                if missing:
+                    raise ValueError(f"Для нового уровня {tier} не заданы значения: {', '.join(missing)}.")
+                self.session.add(LoanPolicy(tier=tier, **params))
             else:
-                max_copies = self.LOW_REPUTATION_LIMIT
-                return_days = self.LOW_REPUTATION_RETURN_DAYS
+                for name, value in params.items():
+                    setattr(policy, name, value)
+            self.session.commit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при изменении политики выдачи: {e}")
+            self.session.rollback()
+            raise
+        finally:
+            self._policies = None
+            self.cache.clear()
 
-            # Проверяем, сколько книг уже взял пользователь
-            borrowed_books_count = self.session.query(BorrowedBook).filter_by(user_id=user_id).count()
+    def delete_loan_policy(self, tier):
+        policy = self.session.get(LoanPolicy, tier)
+        if policy is None:
+            raise ValueError(f"Политика выдачи {tier} не найдена.")
+        self.session.delete(policy)
+        self.session.commit()
+        self._policies = None
+        self.cache.clear()
 
-            if borrowed_books_count >= max_copies:
+    def borrow_book(self, user_id, isbn):
+        try:
+            borrow_date = datetime.now()
+            # Создаем запись о взятой книге, только если пользователь существует и не достиг лимита своей политики.
+            # Счетчик active_loans увеличивается триггером в том же запросе.
+            new_borrowed_book = BorrowedBook.__table__.insert().from_select(
+                ['user_id', 'isbn', 'borrow_date', 'due_date'],
+                select(User.user_id, literal(isbn, Integer), literal(borrow_date, DateTime), self._due_date(borrow_date))
+                .where(User.user_id == user_id, User.active_loans < User.max_books),
+            )
+            if self.session.execute(new_borrowed_book).rowcount == 0:
+                if not self.user_exists(user_id):
+                    raise ValueError(f"Пользователь с ID {user_id} не найден.")
                 raise ValueError(f"Достигнуто максимальное количество книг для пользователя с ID {user_id}.")
 
-            # Уменьшаем количество доступных копий книги
-            book.copies -= 1
+            # Резерв пользователя на книгу снимается триггером borrowed_books_hold_fulfilled; закрепленная
+            # за резервом копия при этом возвращается в доступные и сразу списывается следующим запросом
+
+            # Проверяем наличие копий и уменьшаем их количество одним условным UPDATE,
+            # поэтому две параллельные выдачи не могут забрать одну и ту же последнюю копию
+            books = Book.__table__
+            take_copy = update(books).where(books.c.isbn == isbn, books.c.copies > 0).values(copies=books.c.copies - 1)
+            if self.session.execute(take_copy).rowcount == 0:
+                if not self.book_exists(isbn):
+                    raise ValueError(f"Книга с ID {isbn} не найдена.")
+                raise ValueError("Нет доступных копий книги.")
+
+            self.session.commit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при взятии книги: {e}")
+            self.session.rollback()
+            if self.raise_errors:
+                raise
+        self._invalidate(user_id=user_id, isbn=isbn)
 
-            # Устанавливаем дату взятия и срок возврата
+    def borrow_books(self, user_id, isbns):
+        # Выдача нескольких книг одной транзакцией: лимит пользователя проверяется один раз, копии списываются
+        # одним UPDATE, записи о выдаче создаются одним многострочным INSERT. Книги, которые выдать нельзя,
+        # пропускаются, остальные выдаются. Возвращает отчет по каждой позиции в порядке isbns:
+        # [{'isbn': ..., 'ok': True/False, 'error': None или текст ошибки}]
+        items = [{'isbn': isbn, 'ok': False, 'error': None} for isbn in isbns]
+        try:
+            if not self._lock_user(user_id):
+                raise ValueError(f"Пользователь с ID {user_id} не найден.")
             borrow_date = datetime.now()
+            max_copies, return_days = self.session.execute(
+                select(User.max_books - User.active_loans, User.return_days).where(User.user_id == user_id)
+            ).one()
             due_date = borrow_date + timedelta(days=return_days)
 
-            # Создаем новую запись о взятой книге
-            new_borrowed_book = BorrowedBook(user_id=user_id, isbn=isbn, borrow_date=borrow_date, due_date=due_date)
+            isbns = {self._as_id(item['isbn']) for item in items} - {None}
+            # Копия, закрепленная за резервом пользователя, считается доступной: при вставке записи о выдаче
+            # триггер возвращает ее в books.copies, поэтому записи вставляются до списания копий
+            reserved = (select(func.count()).where(Hold.user_id == user_id, Hold.isbn == Book.isbn,
+                                                   Hold.status == Hold.READY).scalar_subquery())
+            copies = dict(self.session.execute(
+                select(Book.isbn, Book.copies + reserved).where(Book.isbn.in_(isbns))
+            ).all()) if isbns else {}
+            taken = {}
+            for item in items:
+                isbn = self._as_id(item['isbn'])
+                if max_copies - sum(taken.values()) <= 0:
+                    item['error'] = f"Достигнуто максимальное количество книг для пользователя с ID {user_id}."
+                elif isbn not in copies:
+                    item['error'] = f"Книга с ID {item['isbn']} не найдена."
+                elif copies[isbn] - taken.get(isbn, 0) <= 0:
+                    item['error'] = "Нет доступных копий книги."
+                else:
+                    taken[isbn] = taken.get(isbn, 0) + 1
+                    item['ok'] = True
 
-            # Сохраняем изменения
-            self.session.add(new_borrowed_book)
+            if taken:
+                # Счетчик active_loans увеличивается триггером для каждой вставленной строки
+                self.session.execute(BorrowedBook.__table__.insert().values([
+                    {'user_id': user_id, 'isbn': isbn, 'borrow_date': borrow_date, 'due_date': due_date}
+                    for isbn, count in taken.items() for _ in range(count)
+                ]))
+                books = Book.__table__
+                self.session.execute(
+                    update(books).where(books.c.isbn.in_(taken))
+                    .values(copies=books.c.copies - case(taken, value=books.c.isbn, else_=0))
+                )
             self.session.commit()
         except Exception as e:
-            self.logger.error(f"Ошибка при взятии книги: {e}")
+            self.logger.error(f"Ошибка при выдаче книг: {e}")
             self.session.rollback()
+            for item in items:
+                item.update(ok=False, error=item['error'] or str(e))
+        self._invalidate(user_id=user_id)
+        self.cache.invalidate(*(self._cache_key('book', item['isbn']) for item in items if item['ok']))
+        return items
+
+    def _lock_user(self, user_id):
+        # Пустое изменение строки пользователя начинает транзакцию записи, поэтому последующие чтения
+        # и изменения пакетной операции не пересекаются с параллельными выдачами и возвратами.
+        # Возвращает False, если пользователя нет.
+        return self.session.execute(
+            update(User).where(User.user_id == user_id).values(active_loans=User.active_loans)
+        ).rowcount > 0
+
+    @staticmethod
+    def _as_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
 
     def return_book(self, user_id, isbn):
         try:
@@ -193,31 +585,276 @@ class Library:
             if borrowed_book is None:
                 raise ValueError("Для пользователя нет взятой книги.")
 
-            # Удаляем запись о взятой книге
-            self.session.delete(borrowed_book)
+            # Перенос записи в журнал, возврат копии и штраф фиксируются одной транзакцией
+            self._close_loan(user, borrowed_book)
+            self.session.commit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при возврате книги: {e}")
+            self.session.rollback()
+            if self.raise_errors:
+                raise
+        self._invalidate(user_id=user_id, isbn=isbn)
+
+    def return_books(self, user_id, isbns):
+        # Возврат нескольких книг одной транзакцией по тем же правилам, что и return_book.
+        # Возвращает отчет по каждой позиции в том же формате, что и borrow_books.
+        items = [{'isbn': isbn, 'ok': False, 'error': None} for isbn in isbns]
+        try:
+            if not self._lock_user(user_id):
+                raise ValueError(f"Пользователь с ID {user_id} не найден.")
+            user = self.session.get(User, user_id)
+            isbns = {self._as_id(item['isbn']) for item in items} - {None}
+            loans = {}
+            for borrowed_book in (self.session.query(BorrowedBook)
+                                  .filter(BorrowedBook.user_id == user_id, BorrowedBook.isbn.in_(isbns))
+                                  .order_by(BorrowedBook.id)):
+                loans.setdefault(borrowed_book.isbn, []).append(borrowed_book)
+            # Книги загружаются одним запросом и удерживаются в books, пока _close_loan берет их из карты
+            # идентичности сессии; автоматический сброс отключен, чтобы изменения ушли в базу одним flush
+            books = self.session.query(Book).filter(Book.isbn.in_(loans)).all() if loans else []
+            history = []
+            with self.session.no_autoflush:
+                for item in items:
+                    pending = loans.get(self._as_id(item['isbn']))
+                    if not pending:
+                        item['error'] = "Для пользователя нет взятой книги."
+                        continue
+                    self._close_loan(user, pending.pop(0), history)
+                    item['ok'] = True
+            if history:
+                self.session.execute(LoanHistory.__table__.insert(), history)
             self.session.commit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при возврате книг: {e}")
+            self.session.rollback()
+            for item in items:
+                item.update(ok=False, error=item['error'] or str(e))
+        self._invalidate(user_id=user_id)
+        self.cache.invalidate(*(self._cache_key('book', item['isbn']) for item in items if item['ok']))
+        return items
 
-            # Увеличиваем количество доступных копий книги
-            book = self.session.query(Book).filter_by(isbn=isbn).first()
-            if book is not None:
-                book.copies += 1
-
-                # Проверяем, была ли книга возвращена в срок, и начисляем штраф при необходимости
-                if borrowed_book.return_date and borrowed_book.return_date > borrowed_book.due_date:
-                    overdue_days = (borrowed_book.return_date - borrowed_book.due_date).days
-                    overdue_penalty = overdue_days * 5
-                    user.penalty += overdue_penalty
-                    user.reputation -= user.penalty
-                else:
-                    # Если книга была возвращена в срок, увеличиваем репутацию пользователя
-                    user.reputation += 5
+    def _close_loan(self, user, borrowed_book, history=None):
+        # Переносит выдачу из borrowed_books в loan_history и применяет правила возврата; фиксирует вызывающий.
+        # Если передан список history, запись журнала добавляется в него для пакетной вставки.
+        penalized_days = borrowed_book.penalized_days or 0
+        penalty = borrowed_book.penalty or 0.0
+
+        # Возвращаем копию книги: первому ожидающему резерву или в доступные копии
+        book = self.session.get(Book, borrowed_book.isbn)
+        if book is not None:
+            self._release_copy(book.isbn, book)
+
+        # Пользователь мог быть удален после записи даты возврата: выдача переносится в журнал без штрафа
+        if book is not None and user is not None:
+            # Проверяем, была ли книга возвращена в срок, и начисляем штраф при необходимости
+            # Дни, за которые штраф уже начислен обходом process_overdues, повторно не учитываются
+            if borrowed_book.return_date and borrowed_book.return_date > borrowed_book.due_date:
+                overdue_days = (borrowed_book.return_date - borrowed_book.due_date).days
+                overdue_penalty = max(overdue_days - penalized_days, 0) * user.penalty_per_day
+                user.penalty += overdue_penalty
+                # Если часть штрафа уже снижала репутацию при обходе, вычитается только остаток
+                user.reputation -= overdue_penalty if penalized_days else user.penalty
+                penalty += overdue_penalty
+                penalized_days = max(overdue_days, penalized_days)
+            elif not penalized_days:
+                # Если книга была возвращена в срок, увеличиваем репутацию пользователя
+                user.reputation += 5
+
+            # Проверка и корректировка репутации пользователя
+            user.reputation = min(max(user.reputation, 0), 100)
+
+        return_date = borrowed_book.return_date or datetime.now()
+        if history is None:
+            self.session.add(LoanHistory.from_loan(borrowed_book, return_date, penalty, penalized_days))
+        else:
+            history.append(LoanHistory.values_from_loan(borrowed_book, return_date, penalty, penalized_days))
+        self.session.delete(borrowed_book)
 
-                # Проверка и корректировка репутации пользователя
-                user.reputation = min(max(user.reputation, 0), 100)
+    def _release_copy(self, isbn, book=None):
+        # Освободившаяся копия закрепляется за первым ожидающим резервом книги, а при пустой очереди
+        # увеличивает количество доступных копий (через загруженный объект book, если он передан).
+        # Возвращает True, если копия закреплена за резервом.
+        holds = Hold.__table__
+        first = (select(holds.c.id).where(holds.c.isbn == isbn, holds.c.status == Hold.WAITING)
+                 .order_by(holds.c.id).limit(1).scalar_subquery())
+        if self.session.execute(
+            update(holds).where(holds.c.id == first).values(status=Hold.READY, ready_at=datetime.now())
+        ).rowcount:
+            return True
+        if book is not None:
+            book.copies += 1
+        else:
+            books = Book.__table__
+            self.session.execute(update(books).where(books.c.isbn == isbn).values(copies=books.c.copies + 1))
+        return False
+
+    def place_hold(self, user_id, isbn):
+        # Ставит пользователя в очередь на книгу, у которой нет доступных копий. Возвращенная копия
+        # закрепляется за первым в очереди в транзакции возврата. Возвращает позицию в очереди (с 1).
+        try:
+            if not self._lock_user(user_id):
+                raise ValueError(f"Пользователь с ID {user_id} не найден.")
+            book = self.session.execute(select(Book.copies).where(Book.isbn == isbn)).first()
+            if book is None:
+                raise ValueError(f"Книга с ID {isbn} не найдена.")
+            if book.copies > 0:
+                raise ValueError("Есть доступные копии книги, ее можно взять без резерва.")
+            if self.session.execute(select(exists().where(Hold.user_id == user_id, Hold.isbn == isbn))).scalar():
+                raise ValueError("Пользователь уже зарезервировал эту книгу.")
+            hold_id = self.session.execute(Hold.__table__.insert().values(
+                user_id=user_id, isbn=isbn, status=Hold.WAITING, created_at=datetime.now())).inserted_primary_key[0]
+            position = self.session.execute(select(func.count()).where(
+                Hold.isbn == isbn, Hold.status == Hold.WAITING, Hold.id <= hold_id)).scalar()
+            self.session.commit()
+            return position
+        except Exception as e:
+            self.logger.error(f"Ошибка при резервировании книги: {e}")
+            self.session.rollback()
+            raise
+
+    def hold_position(self, user_id, isbn):
+        # Позиция резерва в очереди: 0 - копия ждет выдачи, None - резерва нет
+        queue = aliased(Hold)
+        waiting_before = select(func.count()).where(queue.isbn == Hold.isbn, queue.status == Hold.WAITING,
+                                                    queue.id <= Hold.id).scalar_subquery()
+        row = self.session.execute(
+            select(Hold.status, waiting_before).where(Hold.user_id == user_id, Hold.isbn == isbn)
+        ).first()
+        if row is None:
+            return None
+        return 0 if row.status == Hold.READY else row[1]
+
+    def cancel_hold(self, user_id, isbn):
+        # Снимает резерв; закрепленная за ним копия переходит следующему в очереди или в доступные копии
+        holds = Hold.__table__
+        try:
+            status = self.session.execute(
+                delete(holds).where(holds.c.user_id == user_id, holds.c.isbn == isbn).returning(holds.c.status)
+            ).scalar()
+            if status is None:
+                raise ValueError("Резерв не найден.")
+            if status == Hold.READY:
+                self._release_copy(isbn)
+            self.session.commit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при снятии резерва: {e}")
+            self.session.rollback()
+            raise
+        self._invalidate(isbn=isbn)
+
+    def expire_holds(self, as_of=None):
+        # Снимает резервы, копия по которым не забрана за HOLD_PICKUP_DAYS; копии переходят следующим
+        # в очереди. Возвращает количество снятых резервов.
+        cutoff = (as_of or datetime.now()) - timedelta(days=self.HOLD_PICKUP_DAYS)
+        holds = Hold.__table__
+        try:
+            expired = self.session.execute(
+                delete(holds).where(holds.c.status == Hold.READY, holds.c.ready_at < cutoff)
+                .returning(holds.c.isbn)
+            ).scalars().all()
+            for isbn in expired:
+                self._release_copy(isbn)
+            self.session.commit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при снятии просроченных резервов: {e}")
+            self.session.rollback()
+            raise
+        finally:
+            self.cache.clear()
+        return len(expired)
+
+    def compact_loans(self, before=None, chunk_size=None):
+        # Завершает выдачи, для которых дата возврата уже записана (set_return_date, перенос из BorrowedBooks),
+        # но запись осталась в borrowed_books: они переносятся в loan_history по тем же правилам, что и в
+        # return_book. Каждая порция из chunk_size записей фиксируется отдельной транзакцией.
+        # Возвращает количество перенесенных записей по месячным разделам журнала.
+        before = before or datetime.now()
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        periods = {}
+        try:
+            while True:
+                loans = (self.session.query(BorrowedBook)
+                         .filter(BorrowedBook.return_date.isnot(None), BorrowedBook.return_date <= before)
+                         .order_by(BorrowedBook.id).limit(chunk_size).all())
+                if not loans:
+                    break
+                # Пользователи и книги порции загружаются двумя запросами, записи журнала вставляются одним
+                users = {user.user_id: user for user in self.session.query(User).filter(
+                    User.user_id.in_({borrowed_book.user_id for borrowed_book in loans}))}
+                books = self.session.query(Book).filter(Book.isbn.in_({loan.isbn for loan in loans})).all()
+                history = []
+                with self.session.no_autoflush:
+                    for borrowed_book in loans:
+                        self._close_loan(users.get(borrowed_book.user_id), borrowed_book, history)
+                        period = LoanHistory.period_of(borrowed_book.return_date)
+                        periods[period] = periods.get(period, 0) + 1
+                self.session.execute(LoanHistory.__table__.insert(), history)
                 self.session.commit()
         except Exception as e:
-            self.logger.error(f"Ошибка при возврате книги: {e}")
+            self.logger.error(f"Ошибка при переносе завершенных выдач в журнал: {e}")
             self.session.rollback()
+            raise
+        finally:
+            self.cache.clear()
+        return dict(sorted(periods.items()))
+
+    def process_overdues(self, as_of=None, dry_run=False):
+        # Начисляет штрафы по всем просроченным невозвращенным книгам на дату as_of набором UPDATE-запросов.
+        # Для каждой записи хранится количество уже оплаченных дней просрочки, поэтому повторный запуск
+        # за тот же день ничего не меняет. При dry_run=True только возвращает итоги без изменения данных.
+        as_of = as_of or datetime.now()
+        params = {'as_of': as_of, 'rate': self.OVERDUE_PENALTY_PER_DAY}
+        # Новые дни просрочки по каждой записи: полные сутки от срока возврата до as_of минус уже учтенные.
+        # Ставка берется из политики пользователя; для выдач удаленных пользователей - ставка по умолчанию.
+        charges = (
+            "SELECT id, user_id, overdue_days, overdue_days - penalized_days AS new_days, rate FROM ("
+            "  SELECT loans.id, loans.user_id, loans.penalized_days,"
+            "         COALESCE(borrowers.penalty_per_day, :rate) AS rate,"
+            "         (CAST(strftime('%s', :as_of) AS INTEGER) - CAST(strftime('%s', loans.due_date) AS INTEGER)) / 86400"
+            "         AS overdue_days"
+            "  FROM borrowed_books AS loans LEFT JOIN users AS borrowers ON borrowers.user_id = loans.user_id"
+            "  WHERE loans.return_date IS NULL AND loans.due_date < :as_of"
+            ") WHERE overdue_days > penalized_days"
+        )
+        try:
+            # Начисления вычисляются один раз до изменения пользователей: изменение репутации меняет политику
+            # и ставку penalty_per_day (триггер users_policy_on_reputation), а выдачи должны хранить ту сумму,
+            # которая начислена пользователю
+            self.session.execute(text(
+                "CREATE TEMP TABLE IF NOT EXISTS overdue_charges (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                "overdue_days INTEGER NOT NULL, new_days INTEGER NOT NULL, rate REAL NOT NULL)"
+            ))
+            self.session.execute(text("DELETE FROM temp.overdue_charges"))
+            self.session.execute(text(f"INSERT INTO temp.overdue_charges {charges}").bindparams(
+                bindparam('as_of', type_=DateTime)), params)
+            totals = self.session.execute(text(
+                "SELECT COUNT(*) AS loans, COUNT(DISTINCT user_id) AS users, COALESCE(SUM(new_days), 0) AS days, "
+                "COALESCE(SUM(new_days * rate), 0) AS penalty FROM temp.overdue_charges"
+            )).mappings().one()
+            result = dict(totals, dry_run=dry_run)
+            if dry_run or not totals['loans']:
+                self.session.rollback()
+                return result
+
+            self.session.execute(text(
+                "UPDATE users SET penalty = users.penalty + user_charges.amount,"
+                "                 reputation = MIN(MAX(users.reputation - user_charges.amount, 0), 100) "
+                "FROM (SELECT user_id, SUM(new_days * rate) AS amount FROM temp.overdue_charges GROUP BY user_id) "
+                "AS user_charges WHERE users.user_id = user_charges.user_id"
+            ))
+            self.session.execute(text(
+                "UPDATE borrowed_books SET penalized_days = loan_charges.overdue_days,"
+                "                          penalty = borrowed_books.penalty + loan_charges.new_days * loan_charges.rate "
+                "FROM temp.overdue_charges AS loan_charges WHERE borrowed_books.id = loan_charges.id"
+            ))
+            self.session.execute(text("DELETE FROM temp.overdue_charges"))
+            self.session.commit()
+            self.cache.clear()
+            return result
+        except Exception as e:
+            self.logger.error(f"Ошибка при начислении штрафов за просрочку: {e}")
+            self.session.rollback()
+            raise
 
     def set_return_date(self, user_id, isbn, return_date):
         try:
@@ -231,46 +868,381 @@ class Library:
         except Exception as e:
             self.logger.error(f"Ошибка при установке даты возврата книги: {e}")
             self.session.rollback()
+            if self.raise_errors:
+                raise
 
     def get_borrowed_books_count(self, user_id):
         try:
-            count = self.session.query(BorrowedBook).filter_by(user_id=user_id).count()
-            return count
+            count = self.session.query(User.active_loans).filter_by(user_id=user_id).scalar()
+            return count or 0
         except Exception as e:
             self.logger.error(f"Ошибка при получении количества взятых книг: {e}")
             return None
 
-    def view_borrowed_books(self, user_id):
+    def view_borrowed_books(self, user_id, limit=None, after=None):
+        # limit и after (ID последней полученной записи) позволяют получать записи страницами
         try:
-            borrowed_books = self.session.query(BorrowedBook).filter_by(user_id=user_id).all()
-            count = self.get_borrowed_books_count(user_id)
-            return borrowed_books, count
+            borrowed_books = self._borrowed_books_query(user_id, after)
+            if limit is None:
+                borrowed_books = borrowed_books.all()
+                return borrowed_books, len(borrowed_books)
+            return borrowed_books.limit(limit).all(), self.get_borrowed_books_count(user_id)
         except Exception as e:
             self.logger.error(f"Ошибка при просмотре взятых книг: {e}")
             return None, None
 
-    def search_books(self, title=None, author=None, isbn=None):
+    def iter_borrowed_books(self, user_id, batch_size=1000):
+        # Потоковый вариант view_borrowed_books: записи загружаются из базы пакетами по batch_size
         try:
-            query = self.session.query(Book)
-            if title:
-                query = query.filter(Book.title.like(f'%{title}%'))
-            if author:
-                query = query.filter(Book.author.like(f'%{author}%'))
-            if isbn:
-                query = query.filter_by(isbn=isbn)
-            return query.all()
+            yield from self._borrowed_books_query(user_id).yield_per(batch_size)
+        except Exception as e:
+            self.logger.error(f"Ошибка при просмотре взятых книг: {e}")
+            raise
+
+    def _borrowed_books_query(self, user_id, after=None):
+        borrowed_books = self.session.query(BorrowedBook).filter_by(user_id=user_id)
+        if after is not None:
+            borrowed_books = borrowed_books.filter(BorrowedBook.id > after)
+        return borrowed_books.order_by(BorrowedBook.id)
+
+    def view_loans(self, user_id=None, limit=None, after=None, with_user=False):
+        # Выдачи вместе с названием и автором книги одним запросом с JOIN; записи - кортежи LoanRecord,
+        # поэтому вывод списка не загружает книги по одной. with_user=True добавляет имя пользователя.
+        # Без user_id возвращаются выдачи всех пользователей; after - ID последней полученной записи.
+        try:
+            loans = self._loans_query(user_id, after, with_user)
+            if limit is not None:
+                loans = loans.limit(limit)
+            return [LoanRecord._make(row) for row in self.session.execute(loans)]
+        except Exception as e:
+            self.logger.error(f"Ошибка при просмотре взятых книг: {e}")
+            return None
+
+    def iter_loans(self, user_id=None, batch_size=1000, with_user=False):
+        try:
+            result = self.session.execute(self._loans_query(user_id, with_user=with_user),
+                                          execution_options={'yield_per': batch_size})
+            for row in result:
+                yield LoanRecord._make(row)
+        except Exception as e:
+            self.logger.error(f"Ошибка при просмотре взятых книг: {e}")
+            raise
+
+    def _loans_query(self, user_id=None, after=None, with_user=False):
+        # Книга или пользователь могли быть удалены, поэтому соединения внешние
+        loans = (select(BorrowedBook.id, BorrowedBook.user_id, BorrowedBook.isbn, Book.title, Book.author,
+                        BorrowedBook.borrow_date, BorrowedBook.due_date, BorrowedBook.return_date,
+                        BorrowedBook.penalty, User.name if with_user else null())
+                 .select_from(BorrowedBook).outerjoin(Book, Book.isbn == BorrowedBook.isbn))
+        if with_user:
+            loans = loans.outerjoin(User, User.user_id == BorrowedBook.user_id)
+        if user_id is not None:
+            loans = loans.where(BorrowedBook.user_id == user_id)
+        if after is not None:
+            loans = loans.where(BorrowedBook.id > after)
+        return loans.order_by(BorrowedBook.id)
+
+    def view_holds(self, user_id=None, isbn=None, status=None, limit=None, after=None):
+        # Резервы вместе с названием книги (кортежи HoldRecord) в порядке очереди;
+        # after - ID последней полученной записи
+        try:
+            holds = self._holds_query(user_id, isbn, status, after)
+            if limit is not None:
+                holds = holds.limit(limit)
+            return [HoldRecord._make(row) for row in self.session.execute(holds)]
+        except Exception as e:
+            self.logger.error(f"Ошибка при просмотре резервов: {e}")
+            return None
+
+    def holds_ready_for_pickup(self, user_id=None, limit=None, after=None):
+        # Резервы, за которыми закреплена копия: выборка по индексу вместо повторных попыток взять книгу
+        return self.view_holds(user_id, status=Hold.READY, limit=limit, after=after)
+
+    def _holds_query(self, user_id=None, isbn=None, status=None, after=None):
+        holds = (select(Hold.id, Hold.user_id, Hold.isbn, Book.title, Hold.status, Hold.created_at, Hold.ready_at)
+                 .select_from(Hold).outerjoin(Book, Book.isbn == Hold.isbn))
+        if user_id is not None:
+            holds = holds.where(Hold.user_id == user_id)
+        if isbn is not None:
+            holds = holds.where(Hold.isbn == isbn)
+        if status is not None:
+            holds = holds.where(Hold.status == status)
+        if after is not None:
+            holds = holds.where(Hold.id > after)
+        return holds.order_by(Hold.id)
+
+    def view_loan_history(self, user_id=None, period=None, limit=None, after=None):
+        # Завершенные выдачи из журнала; period (YYYY-MM) ограничивает выборку одним месячным разделом
+        try:
+            history = self._loan_history_query(user_id, period, after)
+            if limit is not None:
+                history = history.limit(limit)
+            return history.all()
+        except Exception as e:
+            self.logger.error(f"Ошибка при просмотре журнала выдач: {e}")
+            return None
+
+    def iter_loan_history(self, user_id=None, period=None, batch_size=1000):
+        try:
+            yield from self._loan_history_query(user_id, period).yield_per(batch_size)
+        except Exception as e:
+            self.logger.error(f"Ошибка при просмотре журнала выдач: {e}")
+            raise
+
+    def _loan_history_query(self, user_id=None, period=None, after=None):
+        history = self.session.query(LoanHistory)
+        if period is not None:
+            history = history.filter_by(period=period)
+        if user_id is not None:
+            history = history.filter_by(user_id=user_id)
+        if after is not None:
+            history = history.filter(LoanHistory.id > after)
+        return history.order_by(LoanHistory.id)
+
+    def stats(self, period=None, start=None, end=None, limit=10):
+        # Самые выдаваемые книги и самые активные читатели за месяц period (YYYY-MM, по умолчанию текущий)
+        # или за дни с start по end (date или datetime, end не включается). Отчет за месяц читается по индексу
+        # месячной сводки, за произвольный период - суммированием дневных сводок за эти дни.
+        # Возвращает {'borrows': ..., 'returns': ..., 'books': [BookStatsRecord], 'borrowers': [UserStatsRecord]}
+        # с limit записями в порядке убывания количества выдач.
+        try:
+            if start is None and end is None:
+                period = period or LoanHistory.period_of(datetime.now())
+                book_stats, user_stats = BookMonthlyStats.__table__, UserMonthlyStats.__table__
+                where = lambda stats: [stats.c.period == period]
+            else:
+                book_stats, user_stats = BookDailyStats.__table__, UserDailyStats.__table__
+                where = lambda stats: self._stats_days(stats, start, end)
+            books = self._top_stats(book_stats.c.isbn, where(book_stats), limit)
+            borrowers = self._top_stats(user_stats.c.user_id, where(user_stats), limit)
+            # Итоги по сводке пользователей: в ней меньше строк, чем в сводке книг
+            borrows, returns = self.session.execute(
+                select(func.coalesce(func.sum(user_stats.c.borrows), 0),
+                       func.coalesce(func.sum(user_stats.c.returns), 0)).where(*where(user_stats))
+            ).one()
+            return {
+                'borrows': borrows,
+                'returns': returns,
+                'books': [BookStatsRecord(*row) for row in self.session.execute(
+                    select(books.c.isbn, Book.title, Book.author, books.c.borrows, books.c.returns)
+                    .outerjoin(Book, Book.isbn == books.c.isbn)
+                    .order_by(books.c.borrows.desc(), books.c.isbn))],
+                'borrowers': [UserStatsRecord(*row) for row in self.session.execute(
+                    select(borrowers.c.user_id, User.name, borrowers.c.borrows, borrowers.c.returns)
+                    .outerjoin(User, User.user_id == borrowers.c.user_id)
+                    .order_by(borrowers.c.borrows.desc(), borrowers.c.user_id))],
+            }
+        except Exception as e:
+            self.logger.error(f"Ошибка при построении статистики выдач: {e}")
+            return None
+
+    @staticmethod
+    def _top_stats(key, where, limit):
+        # Первые limit значений key по количеству выдач; названия и имена присоединяются уже к ним.
+        # Строка месячной сводки уже содержит итог по ключу, дневные строки суммируются.
+        stats = key.table
+        if 'period' in stats.c:
+            borrows, returns = stats.c.borrows, stats.c.returns
+            top = select(key, borrows, returns).where(*where)
+        else:
+            borrows, returns = func.sum(stats.c.borrows).label('borrows'), func.sum(stats.c.returns).label('returns')
+            top = select(key, borrows, returns).where(*where).group_by(key)
+        return top.order_by(borrows.desc(), key).limit(limit).subquery()
+
+    @staticmethod
+    def _stats_days(stats, start, end):
+        days = []
+        if start is not None:
+            days.append(stats.c.day >= start.strftime('%Y-%m-%d'))
+        if end is not None:
+            days.append(stats.c.day < end.strftime('%Y-%m-%d'))
+        return days
+
+    def search_books(self, title=None, author=None, isbn=None, query=None, limit=None, offset=0, after=None):
+        # title и author ищутся в соответствующем поле, query - по названию и автору одновременно.
+        # При полнотекстовом поиске каждое слово ищется по префиксу, результаты упорядочены по релевантности (BM25).
+        # Для постраничного обхода больших выборок передается after - ISBN последней полученной книги;
+        # в этом случае результаты упорядочены по ISBN.
+        try:
+            books = self._books_query(title, author, isbn, query, after)
+            if limit is not None:
+                books = books.limit(limit).offset(offset)
+            if self.read_only_records:
+                return list(self._records(books, Book))
+            return books.all()
         except Exception as e:
             self.logger.error(f"Ошибка при поиске книг: {e}")
             return None
 
-    def search_users(self, name=None, user_id=None):
+    def iter_books(self, title=None, author=None, isbn=None, query=None, batch_size=1000):
+        # Потоковый вариант search_books: книги загружаются из базы пакетами по batch_size
+        try:
+            books = self._books_query(title, author, isbn, query)
+            if self.read_only_records:
+                yield from self._records(books, Book, batch_size)
+            else:
+                yield from books.yield_per(batch_size)
+        except Exception as e:
+            self.logger.error(f"Ошибка при поиске книг: {e}")
+            raise
+
+    def _books_query(self, title=None, author=None, isbn=None, query=None, after=None):
+        terms = {'title': title, 'author': author, None: query}
+        match = self._full_text_match(terms) if self.full_text_search else None
+        if match:
+            books = self.session.query(Book).join(books_fts, books_fts.c.rowid == Book.isbn)
+            books = books.filter(literal_column('books_fts').op('MATCH')(match))
+            if after is None:
+                books = books.order_by(func.bm25(literal_column('books_fts')), Book.isbn)
+        else:
+            books = self.session.query(Book)
+            if title:
+                books = books.filter(Book.title.like(f'%{title}%'))
+            if author:
+                books = books.filter(Book.author.like(f'%{author}%'))
+            for word in (query or '').split():
+                books = books.filter(Book.title.like(f'%{word}%') | Book.author.like(f'%{word}%'))
+        if isbn:
+            books = books.filter(Book.isbn == isbn)
+        if after is not None:
+            books = books.filter(Book.isbn > after)
+        if after is not None or not match:
+            books = books.order_by(Book.isbn)
+        return books
+
+    @staticmethod
+    def _full_text_match(terms):
+        # Собирает выражение FTS5 MATCH; слова берутся в кавычки, чтобы ввод пользователя не разбирался как синтаксис.
+        # Возвращает None, если в каком-либо условии нет ни одного слова - тогда используется LIKE.
+        parts = []
+        for column, value in terms.items():
+            if not value:
+                continue
+            words = re.findall(r'\w+', value)
+            if not words:
+                return None
+            expression = ' AND '.join(f'"{word}"*' for word in words)
+            parts.append(f'{column} : ({expression})' if column else f'({expression})')
+        return ' AND '.join(parts) or None
+
+    def search_users(self, name=None, user_id=None, limit=None, after=None):
+        # after - ID последнего полученного пользователя для постраничного обхода
         try:
-            query = self.session.query(User)
-            if name:
-                query = query.filter(User.name.like(f'%{name}%'))
-            if user_id:
-                query = query.filter_by(user_id=user_id)
-            return query.all()
+            users = self._users_query(name, user_id, after)
+            if limit is not None:
+                users = users.limit(limit)
+            if self.read_only_records:
+                return list(self._records(users, User))
+            return users.all()
         except Exception as e:
             self.logger.error(f"Ошибка при поиске пользователей: {e}")
             return None
+
+    def fuzzy_search_books(self, title=None, author=None, query=None, threshold=None, limit=20):
+        # Поиск с опечатками по словам названия (title), автора (author) или любого из них (query).
+        # Каждое слово запроса должно совпасть с похожим словом книги (триграммное сходство не ниже threshold);
+        # книги упорядочены по сумме сходства слов, затем по ISBN.
+        terms = ([(word, (SearchPosting.TITLE,)) for word in search_words_of(title)]
+                 + [(word, (SearchPosting.AUTHOR,)) for word in search_words_of(author)]
+                 + [(word, (SearchPosting.TITLE, SearchPosting.AUTHOR)) for word in search_words_of(query)])
+        try:
+            return self._fuzzy_results(Book, Book.isbn, self._fuzzy_ids(terms, threshold, limit))
+        except Exception as e:
+            self.logger.error(f"Ошибка при нечетком поиске книг: {e}")
+            return None
+
+    def fuzzy_search_users(self, name, threshold=None, limit=20):
+        terms = [(word, (SearchPosting.USER_NAME,)) for word in search_words_of(name)]
+        try:
+            return self._fuzzy_results(User, User.user_id, self._fuzzy_ids(terms, threshold, limit))
+        except Exception as e:
+            self.logger.error(f"Ошибка при нечетком поиске пользователей: {e}")
+            return None
+
+    def _fuzzy_ids(self, terms, threshold, limit):
+        # Похожие слова словаря находятся по общим триграммам, затем книги или пользователи, в полях которых
+        # есть похожее слово для каждого слова запроса, - по спискам вхождений search_postings
+        threshold = self.FUZZY_THRESHOLD if threshold is None else threshold
+        rows, best = [], []
+        for term, (word, fields) in enumerate(terms):
+            similar = self._similar_words(word, threshold)
+            if not similar:
+                return []
+            rows.extend((term, word_id, field, similarity) for word_id, similarity in similar for field in fields)
+            best.append(([word_id for word_id, similarity in similar if similarity == similar[0][1]], fields))
+        if not rows:
+            return []
+        top = self._best_fuzzy_ids(best, limit)
+        if len(top) == limit:
+            return top
+        matches = values(column('term', Integer), column('word_id', Integer), column('field', Integer),
+                         column('similarity', Float), name='matches').data(rows).cte()
+        postings = SearchPosting.__table__
+        best = (select(postings.c.id, matches.c.term, func.max(matches.c.similarity).label('similarity'))
+                .join_from(matches, postings, and_(postings.c.word_id == matches.c.word_id,
+                                                    postings.c.field == matches.c.field))
+                .group_by(postings.c.id, matches.c.term).subquery())
+        return self.session.execute(
+            select(best.c.id).group_by(best.c.id).having(func.count() == len(terms))
+            .order_by(func.sum(best.c.similarity).desc(), best.c.id).limit(limit)
+        ).scalars().all()
+
+    def _best_fuzzy_ids(self, best, limit):
+        # Первые по ISBN (ID) limit документов, в которых для каждого слова запроса есть самое похожее слово
+        # словаря, - у них наибольшая возможная сумма сходства. Если таких документов не меньше limit, это и есть
+        # ответ: частые слова не требуют группировки всех их вхождений. Внешний список - с наименьшим числом
+        # пар (слово, поле); для одной пары он читается по индексу уже упорядоченным, и чтение останавливается
+        # после limit совпадений, остальные слова проверяются поиском по первичному ключу.
+        best = sorted(best, key=lambda item: len(item[0]) * len(item[1]))
+        postings = [aliased(SearchPosting) for _ in best]
+        query = select(postings[0].id).where(postings[0].word_id.in_(best[0][0]), postings[0].field.in_(best[0][1]))
+        for posting, (word_ids, fields) in zip(postings[1:], best[1:]):
+            query = query.where(exists().where(posting.word_id.in_(word_ids), posting.field.in_(fields),
+                                               posting.id == postings[0].id))
+        return self.session.execute(query.order_by(postings[0].id).limit(limit)).scalars().all()
+
+    def _similar_words(self, word, threshold):
+        # [(id слова, сходство)] для слов словаря, у которых доля общих триграмм (как в pg_trgm:
+        # общие / все различные триграммы обоих слов) не ниже threshold. Общих триграмм при этом не меньше
+        # threshold * триграмм запроса, что отсекает слова с единичными совпадениями до соединения со словарем.
+        trigrams = word_trigrams(word)
+        shared = func.count().label('shared')
+        candidates = (select(SearchTrigram.word_id, shared).where(SearchTrigram.trigram.in_(trigrams))
+                      .group_by(SearchTrigram.word_id)
+                      .having(func.count() >= max(math.ceil(threshold * len(trigrams)), 1)).subquery())
+        similarity = (candidates.c.shared * 1.0 / (len(trigrams) + SearchWord.trigrams - candidates.c.shared))
+        return self.session.execute(
+            select(SearchWord.id, similarity.label('similarity'))
+            .join(candidates, candidates.c.word_id == SearchWord.id).where(similarity >= threshold)
+            .order_by(similarity.desc(), SearchWord.id).limit(self.FUZZY_WORD_CANDIDATES)
+        ).all()
+
+    def _fuzzy_results(self, model, key, ids):
+        if not ids:
+            return []
+        query = self.session.query(model).filter(key.in_(ids))
+        found = list(self._records(query, model)) if self.read_only_records else query.all()
+        order = {id_: position for position, id_ in enumerate(ids)}
+        return sorted(found, key=lambda item: order[getattr(item, key.key)])
+
+    def iter_users(self, name=None, user_id=None, batch_size=1000):
+        # Потоковый вариант search_users: пользователи загружаются из базы пакетами по batch_size
+        try:
+            users = self._users_query(name, user_id)
+            if self.read_only_records:
+                yield from self._records(users, User, batch_size)
+            else:
+                yield from users.yield_per(batch_size)
+        except Exception as e:
+            self.logger.error(f"Ошибка при поиске пользователей: {e}")
+            raise
+
+    def _users_query(self, name=None, user_id=None, after=None):
+        users = self.session.query(User)
+        if name:
+            users = users.filter(User.name.like(f'%{name}%'))
+        if user_id:
+            users = users.filter_by(user_id=user_id)
+        if after is not None:
+            users = users.filter(User.user_id > after)
+        return users.order_by(User.user_id)
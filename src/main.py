@@ -1,22 +1,83 @@
-from library import Library
+import argparse
 import sys
+import threading
+
+PAGE_SIZE = 20  # Количество записей, выводимых до запроса следующей страницы
+
+def paginate(rows, page_size=PAGE_SIZE):
+    # Отдает записи по одной и после каждой полной страницы спрашивает, продолжать ли вывод
+    shown = 0
+    for row in rows:
+        if shown and shown % page_size == 0:
+            if input("Показать еще? (Enter - да, q - нет): ").strip().lower() == "q":
+                return
+        shown += 1
+        yield row
+
+class LibraryLoader:
+    # Открывает Library в фоновом потоке: импорт SQLAlchemy и проверка схемы базы выполняются, пока
+    # пользователь читает меню, поэтому меню выводится сразу после запуска
+    def __init__(self, *args, **kwargs):
+        self._library = None
+        self._error = None
+        self._thread = threading.Thread(target=self._load, args=args, kwargs=kwargs, daemon=True)
+        self._thread.start()
+
+    def _load(self, *args, server=None, **kwargs):
+        # С адресом службы (service.py) операции выполняются через ее API, база не открывается локально
+        try:
+            if server:
+                from client import LibraryClient
+                self._library = LibraryClient(server)
+                return
+            from library import Library
+            self._library = Library(*args, **kwargs)
+        except Exception as e:
+            self._error = e
+
+    def get(self):
+        # Ожидает окончания загрузки, если действие выбрано раньше; ошибка открытия базы передается вызывающему
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._library
+
+    def close(self):
+        self._thread.join()
+        if self._library is not None:
+            self._library.close_connection()
+
+def print_cart_report(items, done):
+    # Итог пакетной выдачи или возврата: ошибки по отдельным книгам и количество обработанных
+    for item in items:
+        if not item['ok']:
+            print(f"ISBN {item['isbn']}: {item['error']}")
+    print(f"{done} книг: {sum(item['ok'] for item in items)} из {len(items)}")
+
 def print_menu():
     print(f"{'Управление книгами':<40}|{'Управление пользователями':<40}|{'Получение и возврат книг':<40}|{'Функционал поиска':<40}", file=sys.stdout)
     print('-' * 143, file=sys.stdout)
-    print(f"{'1. Добавить новую книгу в библиотеку':<40}|{'5. Регистрация нового пользователя':<40}|{'9. Взять книгу':<40}|{'12. Поиск книг по названию, автору или':<40}", file=sys.stdout)
-    print(f"{'2. Просмотреть информацию о книге':<40}|{'6. Просмотреть сведения о пользователе':<40}|{'10. Вернуть книгу':<40}|{'   ID книги':<40}", file=sys.stdout)
+    print(f"{'1. Добавить новую книгу в библиотеку':<40}|{'5. Регистрация нового пользователя':<40}|{'9. Взять книги':<40}|{'12. Поиск книг по названию, автору или':<40}", file=sys.stdout)
+    print(f"{'2. Просмотреть информацию о книге':<40}|{'6. Просмотреть сведения о пользователе':<40}|{'10. Вернуть книги':<40}|{'   ID книги':<40}", file=sys.stdout)
     print(f"{'3. Обновить информацию о книге':<40}|{'7. Обновить информацию о пользователе':<40}|{'11. Просмотреть все взятые книги ':<40}|{'13. Поиск пользователей по имени или ':<40}", file=sys.stdout)
     print(f"{'4. Удалить книгу':<40}|{'8. Удалить пользователя':<40}|{'   пользователя':<40}|{'   ID пользователя ':<40}", file=sys.stdout)
-    print(f"{' ':<40}|{' ':<40}|{' ':<40}|{'14. Выход':<40}", file=sys.stdout)
+    print(f"{' ':<40}|{' ':<40}|{'15. Зарезервировать книгу':<40}|{'14. Выход':<40}", file=sys.stdout)
+    print(f"{' ':<40}|{' ':<40}|{'16. Резервы, готовые к выдаче':<40}|{' ':<40}", file=sys.stdout)
     print('-' * 143, file=sys.stdout)
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Консольное рабочее место библиотеки")
+    parser.add_argument('--server', help="Адрес службы библиотеки (service.py), например http://127.0.0.1:8765; "
+                                         "без него база library.db открывается локально")
+    args = parser.parse_args(argv)
     try:
-        library = Library()
+        loader = LibraryLoader(server=args.server)
 
         while True:
             print_menu()
             choice = input("Введите номер действия: ")
+            if choice != "14":
+                library = loader.get()
 
             if choice == "1":
                 try:
@@ -103,31 +164,30 @@ def main():
             elif choice == "9":
                 try:
                     user_id = input("Введите ID пользователя: ")
-                    isbn = input("Введите ISBN книги: ")
-                    library.borrow_book(user_id, isbn)
+                    isbns = input("Введите ISBN книг через пробел или запятую: ").replace(',', ' ').split()
+                    print_cart_report(library.borrow_books(user_id, isbns), "Выдано")
                 except Exception as e:
                     print(f"Ошибка: {e}")
 
             elif choice == "10":
                 try:
                     user_id = input("Введите ID пользователя: ")
-                    isbn = input("Введите ISBN книги: ")
-                    library.return_book(user_id, isbn)
+                    isbns = input("Введите ISBN книг через пробел или запятую: ").replace(',', ' ').split()
+                    print_cart_report(library.return_books(user_id, isbns), "Возвращено")
                 except Exception as e:
                     print(f"Ошибка: {e}")
 
             elif choice == "11":
                 try:
                     user_id = input("Введите ID пользователя: ")
-                    borrowed_books, count = library.view_borrowed_books(user_id)
-                    if borrowed_books:
+                    count = library.get_borrowed_books_count(user_id)
+                    if count:
                         print(f"Количество взятых книг пользователем: {count}")
-                        for borrowed_book in borrowed_books:
-                            borrow_date = borrowed_book.borrow_date.strftime("%d-%m-%Y")
-                            due_date = borrowed_book.due_date.strftime("%d-%m-%Y")
-                            return_date = borrowed_book.return_date.strftime(
-                                "%d-%m-%Y") if borrowed_book.return_date else "Не возвращена"
-                            print(f"ID заема: {borrowed_book.id}, ISBN книги: {borrowed_book.isbn}")
+                        for loan in paginate(library.iter_loans(user_id)):
+                            borrow_date = loan.borrow_date.strftime("%d-%m-%Y")
+                            due_date = loan.due_date.strftime("%d-%m-%Y")
+                            return_date = loan.return_date.strftime("%d-%m-%Y") if loan.return_date else "Не возвращена"
+                            print(f"ID заема: {loan.id}, ISBN книги: {loan.isbn}, Название: {loan.title}, Автор: {loan.author}")
                             print(f"Дата взятия: {borrow_date}, Дата возврата: {return_date}, Срок возврата: {due_date}")
                     else:
                         print("Пользователь не имеет взятых книг.")
@@ -141,12 +201,17 @@ def main():
                     isbn = input("Введите ISBN книги (оставьте пустым, чтобы не использовать): ")
 
                     isbn = int(isbn) if isbn else None
-                    books = library.search_books(title or None, author or None, isbn)
-                    if books:
-                        for book in books:
-                            print(book)
-                    else:
+                    found = False
+                    for book in paginate(library.iter_books(title or None, author or None, isbn)):
+                        print(book)
+                        found = True
+                    if not found:
                         print("Книги не найдены.")
+                        similar = library.fuzzy_search_books(title or None, author or None, limit=10) if title or author else None
+                        if similar:
+                            print("Возможно, вы искали:")
+                            for book in similar:
+                                print(book)
                 except Exception as e:
                     print(f"Ошибка: {e}")
 
@@ -156,17 +221,44 @@ def main():
                     user_id = input("Введите ID пользователя (оставьте пустым, чтобы не использовать): ")
 
                     user_id = int(user_id) if user_id else None
-                    users = library.search_users(name or None, user_id)
-                    if users:
-                        for user in users:
-                            print(f"ID: {user.user_id}, Имя: {user.name}, Штраф: {user.penalty}")
-                    else:
+                    found = False
+                    for user in paginate(library.iter_users(name or None, user_id)):
+                        print(f"ID: {user.user_id}, Имя: {user.name}, Штраф: {user.penalty}")
+                        found = True
+                    if not found:
                         print("Пользователь не найден.")
+                        similar = library.fuzzy_search_users(name, limit=10) if name else None
+                        if similar:
+                            print("Возможно, вы искали:")
+                            for user in similar:
+                                print(f"ID: {user.user_id}, Имя: {user.name}, Штраф: {user.penalty}")
+                except Exception as e:
+                    print(f"Ошибка: {e}")
+
+            elif choice == "15":
+                try:
+                    user_id = int(input("Введите ID пользователя: "))
+                    isbn = int(input("Введите ISBN книги: "))
+                    position = library.place_hold(user_id, isbn)
+                    print(f"Книга зарезервирована, место в очереди: {position}")
+                except Exception as e:
+                    print(f"Ошибка: {e}")
+
+            elif choice == "16":
+                try:
+                    user_id = input("Введите ID пользователя (оставьте пустым для всех): ")
+                    found = False
+                    for hold in library.holds_ready_for_pickup(int(user_id) if user_id else None):
+                        ready_at = hold.ready_at.strftime("%d-%m-%Y")
+                        print(f"ID пользователя: {hold.user_id}, ISBN книги: {hold.isbn}, Название: {hold.title}, Ожидает с: {ready_at}")
+                        found = True
+                    if not found:
+                        print("Нет резервов, готовых к выдаче.")
                 except Exception as e:
                     print(f"Ошибка: {e}")
 
             elif choice == "14":
-                library.close_connection()
+                loader.close()
                 print("До свидания!")
                 break
 
@@ -0,0 +1,154 @@
+# /src/maintenance.py
+import argparse
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from library import Library, upgrade_schema
+
+
+def verify_counters(library, args):
+    mismatches = library.verify_loan_counters()
+    for user_id, stored, actual in mismatches:
+        print(f"Пользователь {user_id}: счетчик {stored}, фактически взято книг {actual}")
+    print(f"Расхождений: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+def rebuild_counters(library, args):
+    fixed = library.rebuild_loan_counters()
+    print(f"Исправлено счетчиков: {fixed}")
+    return 0
+
+
+def migrate(db_file):
+    # Добавляет в существующую базу недостающие таблицы, столбцы и индексы; данные не изменяются
+    engine = create_engine(f'sqlite:///{db_file}')
+    try:
+        changes = upgrade_schema(engine)
+    finally:
+        engine.dispose()
+    for change in changes:
+        print(f"Добавлено: {change}")
+    print(f"Изменений схемы: {len(changes)}")
+    return 0
+
+
+def process_overdues(library, args):
+    as_of = datetime.fromisoformat(args.as_of) if args.as_of else None
+    result = library.process_overdues(as_of=as_of, dry_run=args.dry_run)
+    prefix = "Будет начислено" if args.dry_run else "Начислено"
+    print(f"{prefix}: {result['penalty']} за {result['days']} дн. просрочки "
+          f"({result['loans']} записей, {result['users']} пользователей)")
+    return 0
+
+
+def compact_loans(library, args):
+    before = datetime.fromisoformat(args.before) if args.before else None
+    periods = library.compact_loans(before=before)
+    for period, count in periods.items():
+        print(f"{period}: перенесено в журнал {count}")
+    print(f"Перенесено завершенных выдач: {sum(periods.values())}")
+    if args.vacuum:
+        # VACUUM нельзя выполнить внутри транзакции
+        with library.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql("VACUUM")
+        print("Файл базы данных сжат")
+    return 0
+
+
+def expire_holds(library, args):
+    as_of = datetime.fromisoformat(args.as_of) if args.as_of else None
+    print(f"Снято резервов, не забранных за {library.HOLD_PICKUP_DAYS} дн.: {library.expire_holds(as_of=as_of)}")
+    return 0
+
+
+def show_policies(library, args):
+    print(f"{'Уровень':<12}{'репутация от':>14}{'книг':>6}{'дней':>6}{'штраф/день':>12}")
+    for policy in library.loan_policies():
+        print(f"{policy.tier:<12}{policy.min_reputation:>14}{policy.max_books:>6}{policy.return_days:>6}"
+              f"{policy.penalty_per_day:>12.2f}")
+    return 0
+
+
+def set_policy(library, args):
+    # Лимиты, сроки и ставки пользователей уровня пересчитываются в базе при сохранении политики
+    library.set_loan_policy(args.tier, args.min_reputation, args.max_books, args.return_days, args.penalty_per_day)
+    return show_policies(library, args)
+
+
+def rebuild_stats(library, args):
+    print(f"Строк дневной статистики по книгам: {library.rebuild_circulation_stats()}")
+    return 0
+
+
+def show_stats(library, args):
+    start = datetime.fromisoformat(args.start) if args.start else None
+    end = datetime.fromisoformat(args.end) if args.end else None
+    stats = library.stats(period=args.period, start=start, end=end, limit=args.limit)
+    if stats is None:
+        # Library.stats записывает причину ошибки в журнал и возвращает None
+        print("Не удалось построить статистику выдач, подробности в журнале")
+        return 1
+    print(f"Выдач: {stats['borrows']}, возвратов: {stats['returns']}")
+    print("Самые выдаваемые книги:")
+    for book in stats['books']:
+        print(f"  {book.borrows:>8}  {book.isbn}  {book.title or '(удалена)'}, {book.author or ''}")
+    print("Самые активные читатели:")
+    for user in stats['borrowers']:
+        print(f"  {user.borrows:>8}  {user.user_id}  {user.name or '(удален)'}")
+    return 0
+
+
+def rebuild_search(library, args):
+    print(f"Слов в индексе нечеткого поиска: {library.rebuild_search_index()}")
+    return 0
+
+
+COMMANDS = {
+    'verify-counters': verify_counters,
+    'rebuild-counters': rebuild_counters,
+    'process-overdues': process_overdues,
+    'compact-loans': compact_loans,
+    'expire-holds': expire_holds,
+    'show-policies': show_policies,
+    'set-policy': set_policy,
+    'rebuild-stats': rebuild_stats,
+    'stats': show_stats,
+    'rebuild-search': rebuild_search,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных библиотеки")
+    parser.add_argument('command', choices=sorted(COMMANDS) + ['migrate'])
+    parser.add_argument('--db', default='library.db', help="Файл базы данных")
+    parser.add_argument('--as-of', help="Дата обхода просроченных книг и резервов (YYYY-MM-DD), по умолчанию - текущая")
+    parser.add_argument('--before', help="Перенести в журнал выдачи с датой возврата не позже указанной")
+    parser.add_argument('--vacuum', action='store_true', help="После переноса сжать файл базы данных")
+    parser.add_argument('--dry-run', action='store_true', help="Только показать итоги, не изменяя данные")
+    parser.add_argument('--tier', help="Уровень политики выдачи для set-policy")
+    parser.add_argument('--min-reputation', type=int, help="Минимальная репутация уровня")
+    parser.add_argument('--max-books', type=int, help="Максимальное количество книг на руках")
+    parser.add_argument('--return-days', type=int, help="Срок возврата в днях")
+    parser.add_argument('--penalty-per-day', type=float, help="Штраф за день просрочки")
+    parser.add_argument('--period', help="Месяц статистики (YYYY-MM), по умолчанию - текущий")
+    parser.add_argument('--start', help="Начало произвольного периода статистики (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Конец произвольного периода статистики (YYYY-MM-DD, не включается)")
+    parser.add_argument('--limit', type=int, default=10, help="Количество книг и читателей в статистике")
+    args = parser.parse_args(argv)
+
+    if args.command == 'migrate':
+        return migrate(args.db)
+    if args.command == 'set-policy' and not args.tier:
+        parser.error("для set-policy требуется --tier")
+
+    library = Library(args.db)
+    try:
+        return COMMANDS[args.command](library, args)
+    finally:
+        library.close_connection()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,707 @@
+# /src/models.py
+# Единая схема базы данных библиотеки: модели, служебные таблицы и обновление существующих баз
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.orm import declarative_base, relationship, synonym
+
+# Версия схемы, записываемая в таблицу schema_version после обновления базы
+SCHEMA_VERSION = 13
+
+Base = declarative_base()
+
+schema_version = Table('schema_version', Base.metadata, Column('version', Integer, nullable=False))
+
+class User(Base):
+    __tablename__ = 'users'
+
+    user_id = Column(Integer, primary_key=True)
+    name = Column(String)
+    penalty = Column(Float, default=0.0)
+    reputation = Column(Integer, default=100)
+    # Лимит, срок возврата и ставка штрафа по политике уровня репутации (loan_policies), ведутся триггерами
+    max_books = Column(Integer, default=10)
+    return_days = Column(Integer, default=14)
+    penalty_per_day = Column(Float, default=5.0, server_default='5', nullable=False)
+    active_loans = Column(Integer, default=0, server_default='0', nullable=False)  # Количество книг на руках, ведется триггерами
+
+class Book(Base):
+    __tablename__ = 'books'
+
+    isbn = Column(Integer, primary_key=True)
+    title = Column(String, index=True)
+    author = Column(String, index=True)
+    copies = Column(Integer)
+
+    def __str__(self):
+        return f"ID: {self.isbn}, Название: {self.title}, Автор: {self.author}, Количество копий: {self.copies}"
+
+class BorrowedBook(Base):
+    __tablename__ = 'borrowed_books'
+    __table_args__ = (
+        # Поиск записи по пользователю и книге (return_book, set_return_date) и подсчет по пользователю
+        Index('ix_borrowed_books_user_isbn_return', 'user_id', 'isbn', 'return_date'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.user_id'))
+    isbn = Column(Integer, ForeignKey('books.isbn'), index=True)
+    borrow_date = Column(DateTime, default=datetime.now)
+    return_date = Column(DateTime)
+    due_date = Column(DateTime, index=True)  # Поиск просроченных книг
+    penalty = Column(Float, default=0.0, server_default='0', nullable=False)  # Штраф, начисленный process_overdues
+    penalized_days = Column(Integer, default=0, server_default='0', nullable=False)  # Дни просрочки, за которые штраф уже начислен
+
+
+    # Имя первичного ключа в устаревшей таблице BorrowedBooks
+    borrow_id = synonym('id')
+
+    user = relationship("User")
+    book = relationship("Book")
+
+    def set_due_date(self):
+        self.due_date = datetime.now() + timedelta(days=14)
+
+# Неизменяемые записи книг и пользователей со всеми столбцами таблиц, которые возвращает Library
+# в режиме read_only_records вместо отслеживаемых сессией объектов
+class BookRecord(namedtuple('BookRecord', [column.key for column in Book.__table__.columns])):
+    __slots__ = ()
+    __str__ = Book.__str__
+
+UserRecord = namedtuple('UserRecord', [column.key for column in User.__table__.columns])
+
+RECORDS = {Book: BookRecord, User: UserRecord}
+
+# Запись о выдаче вместе с названием и автором книги (и, по запросу, именем пользователя) для просмотра.
+# Неизменяемый кортеж, не связанный с сессией: обращение к полям не выполняет запросов к базе.
+LoanRecord = namedtuple('LoanRecord', ['id', 'user_id', 'isbn', 'title', 'author', 'borrow_date', 'due_date',
+                                       'return_date', 'penalty', 'user_name'])
+
+class LoanHistory(Base):
+    # Журнал завершенных выдач: запись переносится сюда из borrowed_books при возврате книги и больше
+    # не изменяется. Журнал разбит на месячные разделы по столбцу period (месяц возврата, YYYY-MM),
+    # поэтому выборки за месяц читают только свой диапазон индекса.
+    __tablename__ = 'loan_history'
+    __table_args__ = (
+        # Индекс по одному столбцу period неявно упорядочен по id, поэтому выборка раздела не сортируется
+        Index('ix_loan_history_period', 'period'),
+        Index('ix_loan_history_user_return', 'user_id', 'return_date'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    loan_id = Column(Integer, nullable=False)  # ID записи в borrowed_books (может повторно использоваться SQLite)
+    period = Column(String(7), nullable=False)
+    # Пользователи и книги могут быть удалены, история при этом сохраняется, поэтому внешних ключей нет
+    user_id = Column(Integer, nullable=False)
+    isbn = Column(Integer, nullable=False)
+    borrow_date = Column(DateTime)
+    due_date = Column(DateTime)
+    return_date = Column(DateTime, nullable=False)
+    penalty = Column(Float, default=0.0, nullable=False)  # Итоговый штраф по выдаче
+    penalized_days = Column(Integer, default=0, nullable=False)  # Оплаченные дни просрочки
+
+    @staticmethod
+    def period_of(date):
+        return date.strftime('%Y-%m')
+
+    @classmethod
+    def from_loan(cls, borrowed_book, return_date, penalty=0.0, penalized_days=0):
+        return cls(**cls.values_from_loan(borrowed_book, return_date, penalty, penalized_days))
+
+    @classmethod
+    def values_from_loan(cls, borrowed_book, return_date, penalty=0.0, penalized_days=0):
+        # Значения столбцов записи журнала для пакетной вставки
+        return {'loan_id': borrowed_book.id, 'period': cls.period_of(return_date), 'user_id': borrowed_book.user_id,
+                'isbn': borrowed_book.isbn, 'borrow_date': borrowed_book.borrow_date,
+                'due_date': borrowed_book.due_date, 'return_date': return_date, 'penalty': penalty,
+                'penalized_days': penalized_days}
+
+class Hold(Base):
+    # Резерв книги: очередь ожидающих (waiting) по каждой книге обслуживается в порядке id.
+    # Возвращенная копия не попадает в books.copies, если есть ожидающие: она закрепляется за первым
+    # резервом очереди (ready) и выдается его владельцу через borrow_book/borrow_books.
+    __tablename__ = 'holds'
+    __table_args__ = (
+        # Один резерв пользователя на книгу; индекс также обслуживает выборку резервов пользователя
+        Index('ux_holds_user_isbn', 'user_id', 'isbn', unique=True),
+        # Первый ожидающий в очереди книги и позиция в очереди
+        Index('ix_holds_queue', 'isbn', 'status', 'id'),
+        # Резервы, готовые к выдаче
+        Index('ix_holds_status', 'status', 'id'),
+    )
+
+    WAITING = 'waiting'
+    READY = 'ready'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
+    isbn = Column(Integer, ForeignKey('books.isbn'), nullable=False)
+    status = Column(String(7), default=WAITING, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    ready_at = Column(DateTime)  # Время закрепления копии за резервом
+
+# Резерв вместе с названием книги для просмотра; неизменяемый кортеж, не связанный с сессией
+HoldRecord = namedtuple('HoldRecord', ['id', 'user_id', 'isbn', 'title', 'status', 'created_at', 'ready_at'])
+
+class LoanPolicy(Base):
+    # Политика выдачи для уровня репутации: пользователю действует политика с наибольшим min_reputation,
+    # не превышающим его репутацию. Значения копируются в строку пользователя триггерами USER_POLICY_TRIGGERS,
+    # поэтому выдача и начисление штрафов читают их из users без вычисления уровня.
+    __tablename__ = 'loan_policies'
+
+    tier = Column(String, primary_key=True)
+    min_reputation = Column(Integer, nullable=False, unique=True)
+    max_books = Column(Integer, nullable=False)
+    return_days = Column(Integer, nullable=False)
+    penalty_per_day = Column(Float, nullable=False)
+
+LoanPolicyRecord = namedtuple('LoanPolicyRecord', [column.key for column in LoanPolicy.__table__.columns])
+
+class BookDailyStats(Base):
+    # Сводка выдач и возвратов книги за день (YYYY-MM-DD). Счетчики увеличиваются триггерами
+    # CIRCULATION_STATS_TRIGGERS в транзакции выдачи и возврата; строки сохраняются после удаления книги.
+    # Таблица без rowid упорядочена по (day, isbn), поэтому выборка за период читает только свой диапазон.
+    __tablename__ = 'book_daily_stats'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    day = Column(String(10), primary_key=True)
+    isbn = Column(Integer, primary_key=True)
+    borrows = Column(Integer, default=0, nullable=False)
+    returns = Column(Integer, default=0, nullable=False)
+
+class UserDailyStats(Base):
+    # Сводка выдач и возвратов пользователя за день, ведется так же, как BookDailyStats
+    __tablename__ = 'user_daily_stats'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    day = Column(String(10), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    borrows = Column(Integer, default=0, nullable=False)
+    returns = Column(Integer, default=0, nullable=False)
+
+class BookMonthlyStats(Base):
+    # Те же счетчики за месяц (period, YYYY-MM, как в loan_history). Первые N книг месяца читаются
+    # по индексу ix_book_monthly_stats_top без группировки дневных строк.
+    __tablename__ = 'book_monthly_stats'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    period = Column(String(7), primary_key=True)
+    isbn = Column(Integer, primary_key=True)
+    borrows = Column(Integer, default=0, nullable=False)
+    returns = Column(Integer, default=0, nullable=False)
+
+class UserMonthlyStats(Base):
+    __tablename__ = 'user_monthly_stats'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    period = Column(String(7), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    borrows = Column(Integer, default=0, nullable=False)
+    returns = Column(Integer, default=0, nullable=False)
+
+Index('ix_book_monthly_stats_top', BookMonthlyStats.period, BookMonthlyStats.borrows.desc(), BookMonthlyStats.isbn)
+Index('ix_user_monthly_stats_top', UserMonthlyStats.period, UserMonthlyStats.borrows.desc(), UserMonthlyStats.user_id)
+
+# Сводки статистики выдач: модель, ключ и выражение SQLite, дающее день или месяц по дате
+CIRCULATION_STATS = (
+    (BookDailyStats, 'isbn', 'date({})'),
+    (UserDailyStats, 'user_id', 'date({})'),
+    (BookMonthlyStats, 'isbn', "strftime('%Y-%m', {})"),
+    (UserMonthlyStats, 'user_id', "strftime('%Y-%m', {})"),
+)
+
+# Строки отчетов Library.stats; title/author и name равны None для удаленных книг и пользователей
+BookStatsRecord = namedtuple('BookStatsRecord', ['isbn', 'title', 'author', 'borrows', 'returns'])
+UserStatsRecord = namedtuple('UserStatsRecord', ['user_id', 'name', 'borrows', 'returns'])
+
+# Политики, которыми заполняется пустая таблица loan_policies
+DEFAULT_LOAN_POLICIES = {
+    'high': LoanPolicyRecord('high', 80, 10, 14, 5.0),
+    'middle': LoanPolicyRecord('middle', 50, 5, 7, 5.0),
+    'low': LoanPolicyRecord('low', 0, 2, 3, 5.0),
+}
+
+# Столбцы users, материализующие политику; без подходящей политики пользователь не может брать книги
+POLICY_COLUMNS = ('max_books', 'return_days', 'penalty_per_day')
+
+def _policy_assignments(reputation):
+    return ", ".join(
+        f"{column} = COALESCE((SELECT {column} FROM loan_policies WHERE min_reputation <= {reputation} "
+        f"ORDER BY min_reputation DESC LIMIT 1), 0)"
+        for column in POLICY_COLUMNS
+    )
+
+# Политика пересчитывается для нового пользователя, при изменении его репутации
+# и для всех пользователей при любом изменении таблицы loan_policies
+USER_POLICY_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS users_policy_on_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE users SET {_policy_assignments('NEW.reputation')} WHERE user_id = NEW.user_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_policy_on_reputation AFTER UPDATE OF reputation ON users
+    WHEN NEW.reputation IS NOT OLD.reputation
+    BEGIN
+        UPDATE users SET {_policy_assignments('NEW.reputation')} WHERE user_id = NEW.user_id;
+    END""",
+) + tuple(
+    f"""CREATE TRIGGER IF NOT EXISTS loan_policies_{event.lower()} AFTER {event} ON loan_policies
+    BEGIN
+        UPDATE users SET {_policy_assignments('users.reputation')};
+    END"""
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+)
+
+# Фактическое количество взятых книг пользователя, по которому сверяется и перестраивается счетчик
+ACTUAL_LOANS_SQL = "(SELECT COUNT(*) FROM borrowed_books WHERE borrowed_books.user_id = users.user_id)"
+
+# Триггеры поддерживают счетчик users.active_loans при любой вставке и удалении записи о взятой книге
+LOAN_COUNTER_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS borrowed_books_loan_added AFTER INSERT ON borrowed_books
+    BEGIN
+        UPDATE users SET active_loans = active_loans + 1 WHERE user_id = NEW.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS borrowed_books_loan_removed AFTER DELETE ON borrowed_books
+    BEGIN
+        UPDATE users SET active_loans = active_loans - 1 WHERE user_id = OLD.user_id;
+    END""",
+)
+
+# Журнал выдач только пополняется: изменение и удаление записей запрещено
+LOAN_HISTORY_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS loan_history_no_update BEFORE UPDATE ON loan_history
+    BEGIN
+        SELECT RAISE(ABORT, 'loan_history is append-only');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS loan_history_no_delete BEFORE DELETE ON loan_history
+    BEGIN
+        SELECT RAISE(ABORT, 'loan_history is append-only');
+    END""",
+)
+
+# Выдача книги пользователю снимает его резерв на нее; копия, закрепленная за резервом, возвращается
+# в доступные, чтобы выдача списала ее тем же условным UPDATE, что и обычную копию
+HOLD_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS borrowed_books_hold_fulfilled AFTER INSERT ON borrowed_books
+    BEGIN
+        UPDATE books SET copies = copies + 1 WHERE isbn = NEW.isbn AND EXISTS (
+            SELECT 1 FROM holds WHERE user_id = NEW.user_id AND isbn = NEW.isbn AND status = '{Hold.READY}');
+        DELETE FROM holds WHERE user_id = NEW.user_id AND isbn = NEW.isbn;
+    END""",
+)
+
+# Выдача считается в день borrow_date, возврат - в день return_date записи журнала loan_history,
+# куда переносится каждая завершенная выдача (return_book, return_books, compact_loans)
+def _stats_upserts(date, isbn, user_id, counter):
+    values = {'isbn': isbn, 'user_id': user_id}
+    return "\n".join(
+        f"        INSERT INTO {model.__tablename__} ({model.__table__.c[0].name}, {key}, borrows, returns) "
+        f"VALUES ({bucket.format(date)}, {values[key]}, {int(counter == 'borrows')}, {int(counter == 'returns')}) "
+        f"ON CONFLICT ({model.__table__.c[0].name}, {key}) DO UPDATE SET {counter} = {counter} + 1;"
+        for model, key, bucket in CIRCULATION_STATS
+    )
+
+CIRCULATION_STATS_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS borrowed_books_stats AFTER INSERT ON borrowed_books
+    WHEN NEW.borrow_date IS NOT NULL
+    BEGIN
+{_stats_upserts('NEW.borrow_date', 'NEW.isbn', 'NEW.user_id', 'borrows')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS loan_history_stats AFTER INSERT ON loan_history
+    BEGIN
+{_stats_upserts('NEW.return_date', 'NEW.isbn', 'NEW.user_id', 'returns')}
+    END""",
+)
+
+# Полнотекстовый индекс по названию и автору (SQLite FTS5), синхронизируется с books триггерами.
+# Таблица описана в отдельных метаданных, чтобы create_all не пытался создать ее как обычную.
+books_fts = Table('books_fts', MetaData(), Column('rowid', Integer), Column('title', String), Column('author', String))
+
+BOOK_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE books_fts USING fts5(title, author, content='books', content_rowid='isbn')",
+    """CREATE TRIGGER books_fts_insert AFTER INSERT ON books
+    BEGIN
+        INSERT INTO books_fts (rowid, title, author) VALUES (NEW.isbn, NEW.title, NEW.author);
+    END""",
+    """CREATE TRIGGER books_fts_delete AFTER DELETE ON books
+    BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', OLD.isbn, OLD.title, OLD.author);
+    END""",
+    # Изменение количества копий не затрагивает полнотекстовый индекс
+    """CREATE TRIGGER books_fts_update AFTER UPDATE OF isbn, title, author ON books
+    BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', OLD.isbn, OLD.title, OLD.author);
+        INSERT INTO books_fts (rowid, title, author) VALUES (NEW.isbn, NEW.title, NEW.author);
+    END""",
+    "INSERT INTO books_fts (books_fts) VALUES ('rebuild')",
+)
+
+def has_full_text_search(connection):
+    return connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    )).first() is not None
+
+# Нечеткий поиск: триграммный индекс по словам названий, авторов и имен пользователей.
+# Каждое различное слово хранится один раз (search_words) вместе с его триграммами (search_word_trigrams),
+# а search_postings связывает слово с книгами и пользователями, в поле которых оно встречается. Похожие слова
+# ищутся по словарю, который намного меньше каталога, документы - по спискам вхождений найденных слов.
+# Индекс ведется триггерами SEARCH_INDEX_TRIGGERS на встроенных функциях SQLite, поэтому обновляется и при
+# изменениях не через Library. Триграммы не зависят от регистра латиницы и кириллицы, ё не отличается от е.
+class SearchWord(Base):
+    __tablename__ = 'search_words'
+
+    id = Column(Integer, primary_key=True)
+    word = Column(String, nullable=False, unique=True)
+    trigrams = Column(Integer, default=0, server_default='0', nullable=False)  # Количество различных триграмм слова
+
+class SearchTrigram(Base):
+    __tablename__ = 'search_word_trigrams'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    trigram = Column(String(3), primary_key=True)
+    word_id = Column(Integer, primary_key=True)
+
+class SearchPosting(Base):
+    __tablename__ = 'search_postings'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    TITLE = 1
+    AUTHOR = 2
+    USER_NAME = 3
+
+    word_id = Column(Integer, primary_key=True)
+    field = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True)  # ISBN книги или ID пользователя
+
+# Пока в таблице есть строка, триггеры books_search_insert и books_search_update не изменяют индекс: Library.add_books
+# ставит флаг на время порции в ее транзакции и индексирует книги порции набором запросов (index_books)
+search_index_deferred = Table('search_index_deferred', Base.metadata, Column('deferred', Integer, nullable=False))
+
+# Поля, входящие в индекс: код поля, таблица, ключ и столбец
+SEARCH_FIELDS = (
+    (SearchPosting.TITLE, 'books', 'isbn', 'title'),
+    (SearchPosting.AUTHOR, 'books', 'isbn', 'author'),
+    (SearchPosting.USER_NAME, 'users', 'user_id', 'name'),
+)
+
+WORD_SEPARATORS = '-/\t\n\r'  # Разделяют слова наравне с пробелом
+WORD_PUNCTUATION = ',.;:!?"\'()[]«»–—\\'  # Отбрасываются в начале и в конце слова
+MAX_WORD_TRIGRAMS = 64  # Более длинные слова индексируются по первым MAX_WORD_TRIGRAMS триграммам
+
+# Кириллица А-Я по коду, Ё и ё - к е, латиница - к нижнему регистру
+_FOLD_TABLE = str.maketrans({**{chr(code): chr(code + 0x20) for code in range(0x410, 0x430)},
+                             **{chr(code): chr(code + 0x20) for code in range(ord('A'), ord('Z') + 1)},
+                             'Ё': 'е', 'ё': 'е'})
+
+def _fold_char(char):
+    return char.translate(_FOLD_TABLE)
+
+def search_words_of(value):
+    # Слова значения в том виде, в каком их сохраняют триггеры индекса: латиница приводится к нижнему
+    # регистру целиком (SQLite lower()), кириллица - в первой букве (заглавная в начале названия и в имени);
+    # остальные буквы сравниваются без учета регистра на уровне триграмм
+    if not value:
+        return []
+    value = ''.join(' ' if char in WORD_SEPARATORS else char.lower() if char.isascii() else char for char in value)
+    words = (word.strip(WORD_PUNCTUATION) for word in value.split(' '))
+    return [_fold_char(word[0]) + word[1:] for word in words if word]
+
+def word_trigrams(word):
+    padded = f'  {word} '.translate(_FOLD_TABLE)
+    return {padded[i:i + 3] for i in range(min(len(word) + 1, MAX_WORD_TRIGRAMS))}
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def _fold_char_sql(char):
+    # То же приведение символа, что и _fold_char: кириллица А-Я по коду, Ё и ё - к е, латиница - lower()
+    return (f"CASE WHEN unicode({char}) BETWEEN 1040 AND 1071 THEN char(unicode({char}) + 32) "
+            f"WHEN unicode({char}) IN (1025, 1105) THEN 'е' ELSE lower({char}) END")
+
+def _search_words_sql(value):
+    # Табличная функция со словами значения: разделители заменяются пробелами, json_quote и json_each
+    # разбивают строку по пробелам. Слово - WORD_SQL: знаки препинания по краям отбрасываются, первая буква
+    # приводится к нижнему регистру.
+    for char in WORD_SEPARATORS:
+        value = f"replace({value}, char({ord(char)}), ' ')"
+    return f"""json_each('[' || replace(json_quote(lower({value})), ' ', '","') || ']') AS words"""
+
+_TRIMMED_WORD_SQL = f"trim(words.value, {_sql_string(WORD_PUNCTUATION)})"
+WORD_SQL = f"({_fold_char_sql(f'substr({_TRIMMED_WORD_SQL}, 1, 1)')}) || substr({_TRIMMED_WORD_SQL}, 2)"
+
+def _index_field_sql(field, key, column):
+    # INSERT OR IGNORE не подходит: в триггере, вызванном INSERT ... ON CONFLICT DO UPDATE (add_books),
+    # действует политика конфликтов внешней команды, поэтому повторы отсекаются DISTINCT и NOT EXISTS
+    words = _search_words_sql(column)
+    return (
+        f"INSERT INTO search_words (word) SELECT DISTINCT {WORD_SQL} FROM {words} WHERE {_TRIMMED_WORD_SQL} != '' "
+        f"AND NOT EXISTS (SELECT 1 FROM search_words WHERE word = {WORD_SQL});\n"
+        f"INSERT INTO search_postings (word_id, field, id) SELECT DISTINCT search_words.id, {field}, {key} "
+        f"FROM {words} JOIN search_words ON search_words.word = {WORD_SQL} WHERE NOT EXISTS ("
+        f"SELECT 1 FROM search_postings WHERE word_id = search_words.id AND field = {field} AND id = {key});"
+    )
+
+def _unindex_field_sql(field, key, column):
+    return (
+        f"DELETE FROM search_postings WHERE field = {field} AND id = {key} AND word_id IN ("
+        f"SELECT search_words.id FROM {_search_words_sql(column)} JOIN search_words ON search_words.word = {WORD_SQL});"
+    )
+
+def _prune_field_sql(column):
+    # Слова значения, у которых не осталось вхождений, удаляются из словаря (их триграммы - триггером
+    # search_words_prune), чтобы не занимать места среди похожих слов при нечетком поиске
+    return (
+        f"DELETE FROM search_words WHERE word IN (SELECT {WORD_SQL} FROM {_search_words_sql(column)}) "
+        f"AND NOT EXISTS (SELECT 1 FROM search_postings WHERE word_id = search_words.id);"
+    )
+
+def _word_trigrams_sql(word):
+    positions = '[' + ','.join(str(position) for position in range(1, MAX_WORD_TRIGRAMS + 1)) + ']'
+    padded = f"'  ' || {word} || ' '"
+    trigram = " || ".join(_fold_char_sql(f"substr({padded}, value + {offset}, 1)") for offset in range(3))
+    return f"SELECT {trigram} AS trigram FROM json_each('{positions}') WHERE value <= length({word}) + 1"
+
+def _search_index_triggers():
+    trigrams = _word_trigrams_sql('NEW.word')
+    triggers = [
+        # Слово, вставленное с уже посчитанными триграммами (index_books), триггер не обрабатывает
+        f"""CREATE TRIGGER IF NOT EXISTS search_words_trigrams AFTER INSERT ON search_words WHEN NEW.trigrams = 0
+    BEGIN
+        INSERT INTO search_word_trigrams (trigram, word_id) SELECT DISTINCT trigram, NEW.id FROM ({trigrams});
+        UPDATE search_words SET trigrams = (SELECT COUNT(DISTINCT trigram) FROM ({trigrams})) WHERE id = NEW.id;
+    END""",
+        # Когда таблица триграмм уже очищена (Library.rebuild_search_index), триграммы удаленного слова не считаются
+        f"""CREATE TRIGGER IF NOT EXISTS search_words_prune AFTER DELETE ON search_words
+    WHEN EXISTS (SELECT 1 FROM search_word_trigrams)
+    BEGIN
+        DELETE FROM search_word_trigrams WHERE word_id = OLD.id AND trigram IN ({_word_trigrams_sql('OLD.word')});
+    END""",
+    ]
+    for table in ('books', 'users'):
+        fields = [(field, key, column) for field, field_table, key, column in SEARCH_FIELDS if field_table == table]
+        key = fields[0][1]
+        index = "\n".join(_index_field_sql(field, f'NEW.{key}', f'NEW.{column}') for field, _, column in fields)
+        unindex = "\n".join(_unindex_field_sql(field, f'OLD.{key}', f'OLD.{column}') for field, _, column in fields)
+        prune = "\n".join(_prune_field_sql(f'OLD.{column}') for _, _, column in fields)
+        columns = ", ".join([key] + [column for _, _, column in fields])
+        deferred = "WHEN NOT EXISTS (SELECT 1 FROM search_index_deferred)\n" if table == 'books' else ""
+        triggers += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table}\n{deferred}BEGIN\n{index}\nEND",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}\nBEGIN\n{unindex}\n{prune}\nEND",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table}\n"
+            f"{deferred}BEGIN\n{unindex}\n{index}\n{prune}\nEND",
+        ]
+    return tuple(triggers)
+
+# Триграммы новых слов и вхождения слов книг и пользователей
+SEARCH_INDEX_TRIGGERS = _search_index_triggers()
+
+def build_search_index(connection):
+    # Индексирует всех пользователей и все книги в пустые таблицы индекса (Library.rebuild_search_index,
+    # создание индекса при обновлении схемы). Возвращает количество слов.
+    for table in ('books', 'users'):
+        _index_words(connection, _table_words_sql(table))
+    return connection.execute(text("SELECT COUNT(*) FROM search_words")).scalar()
+
+def index_books(connection, isbns):
+    # Индексирует книги с перечисленными ISBN в их текущем виде (порция Library.add_books)
+    if isbns:
+        _index_words(connection, _table_words_sql('books', _BOOKS_CHUNK), {'isbns': json.dumps(isbns)})
+
+_BOOKS_CHUNK = "books.isbn IN (SELECT value FROM json_each(:isbns))"
+_WORDS_BATCH = 10_000  # Количество новых слов, вставляемых одним executemany
+_TRIGRAMS_BATCH = 100_000  # Количество триграмм, вставляемых одним запросом
+
+def _table_words_sql(table, condition='1'):
+    # Различные слова индексируемых полей строк table, отобранных condition: (поле, ключ, слово). Слово без знаков
+    # препинания выбирается подзапросом с LIMIT -1: иначе SQLite подставляет trim() в каждое использование в WORD_SQL.
+    fold = _fold_char_sql('substr(word, 1, 1)')
+    return " UNION ".join(
+        f"SELECT {field} AS field, id, ({fold}) || substr(word, 2) AS word FROM ("
+        f"SELECT {table}.{key} AS id, {_TRIMMED_WORD_SQL} AS word FROM {table}, {_search_words_sql(f'{table}.{column}')} "
+        f"WHERE {condition} LIMIT -1) WHERE word != ''"
+        for field, field_table, key, column in SEARCH_FIELDS if field_table == table
+    )
+
+def _index_words(connection, words_sql, params=None):
+    # Слова строк разбираются одним запросом во временную таблицу; триграммы новых слов считаются word_trigrams,
+    # как для слов запроса, вхождения вставляются в порядке первичного ключа search_postings
+    connection.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS search_chunk_words (field INTEGER NOT NULL, id INTEGER NOT NULL, word TEXT NOT NULL)"
+    ))
+    connection.execute(text(f"INSERT INTO temp.search_chunk_words {words_sql}"), params or {})
+    words = connection.execute(text(
+        "SELECT DISTINCT word FROM temp.search_chunk_words AS chunk "
+        "WHERE NOT EXISTS (SELECT 1 FROM search_words WHERE search_words.word = chunk.word)"
+    )).scalars().all()
+    # Триграммы вставляются в порядке первичного ключа search_word_trigrams: слова каждой триграммы
+    # накапливаются по возрастанию ID, как их выдает search_words
+    word_ids = {}
+    for start in range(0, len(words), _WORDS_BATCH):
+        batch = words[start:start + _WORDS_BATCH]
+        trigrams = {word: word_trigrams(word) for word in batch}
+        connection.execute(text("INSERT INTO search_words (word, trigrams) VALUES (:word, :trigrams)"),
+                           [{'word': word, 'trigrams': len(trigrams[word])} for word in batch])
+        for word, word_id in connection.execute(text(
+                "SELECT word, id FROM search_words WHERE word IN (SELECT value FROM json_each(:words)) ORDER BY id"),
+                {'words': json.dumps(batch)}):
+            for trigram in trigrams[word]:
+                word_ids.setdefault(trigram, []).append(word_id)
+    rows = [(trigram, word_id) for trigram in sorted(word_ids) for word_id in word_ids[trigram]]
+    for start in range(0, len(rows), _TRIGRAMS_BATCH):
+        connection.execute(text(
+            "INSERT INTO search_word_trigrams (trigram, word_id) "
+            "SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(:rows)"
+        ), {'rows': json.dumps(rows[start:start + _TRIGRAMS_BATCH])})
+    connection.execute(text(
+        "INSERT OR IGNORE INTO search_postings (word_id, field, id) SELECT search_words.id, chunk.field, chunk.id "
+        "FROM temp.search_chunk_words AS chunk JOIN search_words ON search_words.word = chunk.word ORDER BY 1, 2, 3"
+    ))
+    connection.execute(text("DELETE FROM temp.search_chunk_words"))
+
+def unindex_books(connection, isbns):
+    # Удаляет вхождения слов книг с перечисленными ISBN в их текущем виде (до изменения названия или автора).
+    # Возвращает ID слов, вхождения которых удалены, для prune_search_words.
+    return set(connection.execute(text(
+        f"DELETE FROM search_postings WHERE (word_id, field, id) IN (SELECT search_words.id, chunk.field, chunk.id "
+        f"FROM ({_table_words_sql('books', _BOOKS_CHUNK)}) AS chunk JOIN search_words ON search_words.word = chunk.word) RETURNING word_id"
+    ), {'isbns': json.dumps(isbns)}).scalars())
+
+def prune_search_words(connection, word_ids=None):
+    # Удаляет из словаря слова без вхождений: перечисленные в word_ids или все. Возвращает количество слов.
+    condition = "" if word_ids is None else "id IN (SELECT value FROM json_each(:word_ids)) AND "
+    return connection.execute(text(
+        f"DELETE FROM search_words WHERE {condition}"
+        "NOT EXISTS (SELECT 1 FROM search_postings WHERE word_id = search_words.id)"
+    ), {'word_ids': json.dumps(sorted(word_ids or ()))}).rowcount
+
+# Триггеры, определение которых изменилось: в базах версии ниже указанной они создаются заново
+REPLACED_TRIGGERS = (
+    (11, ('search_words_trigrams', 'books_search_insert', 'books_search_update')),
+    (12, ('books_search_delete', 'books_search_update', 'users_search_delete', 'users_search_update')),
+    (13, ('search_words_prune',)),
+)
+
+# Столбцы, добавленные после первой версии схемы, и их определения для ALTER TABLE
+ADDED_COLUMNS = (
+    ('users', 'active_loans', "INTEGER NOT NULL DEFAULT 0"),
+    ('borrowed_books', 'penalty', "FLOAT NOT NULL DEFAULT 0"),
+    ('borrowed_books', 'penalized_days', "INTEGER NOT NULL DEFAULT 0"),
+    ('users', 'penalty_per_day', "FLOAT NOT NULL DEFAULT 5"),
+)
+
+# Таблица выдачи из первой версии схемы (src/database.py). Таблицы Books и Users той версии совпадают
+# с books и users, так как имена таблиц в SQLite не зависят от регистра.
+LEGACY_LOANS_TABLE = 'BorrowedBooks'
+
+def recount_active_loans(connection):
+    result = connection.execute(text(
+        f"UPDATE users SET active_loans = {ACTUAL_LOANS_SQL} WHERE active_loans != {ACTUAL_LOANS_SQL}"
+    ))
+    return result.rowcount
+
+def refresh_user_policies(connection):
+    # Пересчитывает материализованную политику всех пользователей, возвращает количество строк
+    return connection.execute(text(f"UPDATE users SET {_policy_assignments('users.reputation')}")).rowcount
+
+def seed_loan_policies(connection):
+    # Заполняет новую таблицу политиками по умолчанию до создания триггеров loan_policies,
+    # чтобы пользователи пересчитывались один раз, а не после каждой вставленной строки
+    connection.execute(LoanPolicy.__table__.insert(), [policy._asdict() for policy in DEFAULT_LOAN_POLICIES.values()])
+    refresh_user_policies(connection)
+
+def backfill_circulation_stats(connection):
+    # Заполняет сводки по текущим выдачам и журналу loan_history; вызывается для новых таблиц до создания
+    # триггеров CIRCULATION_STATS_TRIGGERS. Выдачи без даты (из первой версии схемы) не учитываются.
+    # Возвращает количество строк дневной сводки по книгам.
+    rowcounts = []
+    for model, key, bucket in CIRCULATION_STATS:
+        loans = (f"SELECT {bucket.format('borrow_date')} AS bucket, {key}, 1 AS borrows, 0 AS returns "
+                 "FROM borrowed_books WHERE borrow_date IS NOT NULL "
+                 f"UNION ALL SELECT {bucket.format('borrow_date')}, {key}, 1, 0 FROM loan_history "
+                 "WHERE borrow_date IS NOT NULL "
+                 f"UNION ALL SELECT {bucket.format('return_date')}, {key}, 0, 1 FROM loan_history")
+        rowcounts.append(connection.execute(text(
+            f"INSERT INTO {model.__tablename__} ({model.__table__.c[0].name}, {key}, borrows, returns) "
+            f"SELECT bucket, {key}, SUM(borrows), SUM(returns) FROM ({loans}) GROUP BY bucket, {key}"
+        )).rowcount)
+    return rowcounts[0]
+
+def upgrade_schema(engine):
+    # Приводит базу к текущей схеме без потери данных и возвращает список выполненных изменений
+    with engine.begin() as connection:
+        return apply_schema_upgrades(connection)
+
+def apply_schema_upgrades(connection):
+    # База текущей версии не инспектируется заново: при запуске это два коротких запроса вместо create_all
+    # и чтения списков таблиц, столбцов и индексов
+    version = get_schema_version(connection)
+    if version == SCHEMA_VERSION:
+        return []
+    changes = []
+    # Имена таблиц в SQLite не зависят от регистра
+    existing_tables = {name.lower() for name in inspect(connection).get_table_names()}
+    changes.extend(table.name for table in Base.metadata.sorted_tables if table.name.lower() not in existing_tables)
+    Base.metadata.create_all(connection)
+
+    inspector = inspect(connection)
+    for table, column, definition in ADDED_COLUMNS:
+        if column not in {existing['name'] for existing in inspector.get_columns(table)}:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+            changes.append(f'{table}.{column}')
+    if 'users.active_loans' in changes:
+        recount_active_loans(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(connection)
+                changes.append(index.name)
+    if 'loan_policies' in changes:
+        seed_loan_policies(connection)
+    if 'book_daily_stats' in changes:
+        backfill_circulation_stats(connection)
+    for since, names in REPLACED_TRIGGERS:
+        if version < since:
+            for name in names:
+                connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    for trigger in (LOAN_COUNTER_TRIGGERS + LOAN_HISTORY_TRIGGERS + USER_POLICY_TRIGGERS + HOLD_TRIGGERS
+                    + CIRCULATION_STATS_TRIGGERS + SEARCH_INDEX_TRIGGERS):
+        connection.execute(text(trigger))
+    if 'search_words' in changes:
+        build_search_index(connection)
+    elif version < 12:
+        # До версии 12 слова без вхождений оставались в словаре
+        prune_search_words(connection)
+
+    compile_options = connection.execute(text("PRAGMA compile_options")).scalars().all()
+    if 'ENABLE_FTS5' in compile_options and not has_full_text_search(connection):
+        for statement in BOOK_SEARCH_DDL:
+            connection.execute(text(statement))
+        changes.append('books_fts')
+
+    if LEGACY_LOANS_TABLE.lower() in existing_tables:
+        changes.append(f'{LEGACY_LOANS_TABLE} -> borrowed_books ({migrate_legacy_loans(connection)})')
+
+    if get_schema_version(connection) != SCHEMA_VERSION:
+        connection.execute(schema_version.delete())
+        connection.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+    return changes
+
+def get_schema_version(connection):
+    if connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    )).first() is None:
+        return 0
+    return connection.execute(schema_version.select()).scalar() or 0
+
+def migrate_legacy_loans(connection):
+    # Переносит записи одним INSERT ... SELECT в borrowed_books (счетчики active_loans обновляются триггером)
+    # и удаляет устаревшую таблицу в той же транзакции
+    result = connection.execute(text(
+        "INSERT INTO borrowed_books (user_id, isbn, borrow_date, due_date, return_date, penalty) "
+        f"SELECT user_id, isbn, borrow_date, due_date, return_date, COALESCE(penalty, 0) FROM {LEGACY_LOANS_TABLE} "
+        "ORDER BY borrow_id"
+    ))
+    connection.execute(text(f"DROP TABLE {LEGACY_LOANS_TABLE}"))
+    return result.rowcount
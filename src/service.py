@@ -0,0 +1,152 @@
+# /src/service.py
+# Служба библиотеки: один процесс держит открытой базу и выполняет операции Library по запросам
+# рабочих мест через локальный JSON API поверх HTTP. Изменения от разных рабочих мест группируются
+# в общие транзакции (batching.WriteBatcher), поэтому файл базы не делят между собой десятки процессов.
+#   python src/service.py --db library.db --port 8765
+#   python src/main.py --server http://127.0.0.1:8765
+#
+# Запрос: POST /call/<операция> с телом {"args": [...], "kwargs": {...}}
+# Ответ:  200 {"result": ...} или 400/404 {"error": "текст", "type": "ValueError"}
+import argparse
+import json
+import logging
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batching import WriteBatcher
+from library import Library
+from models import Base
+
+# Операции чтения выполняются сразу в потоке запроса, операции изменения - через поток записи
+READ_OPERATIONS = frozenset({
+    'view_book', 'book_exists', 'view_user', 'user_exists', 'search_books', 'search_users',
+    'fuzzy_search_books', 'fuzzy_search_users',
+    'get_borrowed_books_count', 'view_borrowed_books', 'view_loans', 'view_loan_history',
+    'view_holds', 'holds_ready_for_pickup', 'hold_position', 'loan_policies', 'stats',
+})
+WRITE_OPERATIONS = Library.WRITE_OPERATIONS
+
+
+def encode(value):
+    # Объекты моделей и записи (namedtuple) передаются как {"__record__": имя, "fields": {...}, "text": str()},
+    # даты - как {"__datetime__": ISO}; клиент восстанавливает из них объекты с теми же атрибутами
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, Base):
+        fields = {column.key: getattr(value, column.key) for column in value.__mapper__.column_attrs}
+        return {'__record__': type(value).__name__, 'fields': encode(fields), 'text': str(value)}
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        return {'__record__': type(value).__name__, 'fields': encode(value._asdict()), 'text': str(value)}
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode_arguments(value):
+    # Даты в аргументах (as_of, return_date) передаются так же, как в ответах
+    if isinstance(value, dict):
+        if set(value) == {'__datetime__'}:
+            return datetime.fromisoformat(value['__datetime__'])
+        return {key: decode_arguments(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_arguments(item) for item in value]
+    return value
+
+
+class LibraryService:
+    def __init__(self, library, window_ms=2, max_batch=64):
+        self.library = library
+        self.batcher = WriteBatcher(library, window_ms, max_batch)
+
+    def call(self, name, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if name in WRITE_OPERATIONS:
+            return self.batcher.submit(getattr(Library, name), *args, **kwargs)
+        if name in READ_OPERATIONS:
+            try:
+                return getattr(self.library, name)(*args, **kwargs)
+            finally:
+                # Сессия потока запроса освобождается, чтобы следующее чтение видело новые изменения
+                self.library.release_session()
+        raise LookupError(f"Неизвестная операция: {name}")
+
+    def close(self):
+        self.batcher.close()
+        self.library.close_connection()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: соединение рабочего места переиспользуется для последующих запросов. Заголовки и тело
+    # ответа отправляются отдельными записями, поэтому алгоритм Нейгла отключен: иначе каждый ответ
+    # задерживался бы до подтверждения (delayed ACK) на ~40 мс
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if not self.path.startswith('/call/'):
+            return self._reply(404, {'error': f"Неизвестный путь: {self.path}", 'type': 'LookupError'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            result = self.server.service.call(self.path[len('/call/'):], decode_arguments(body.get('args', [])),
+                                              decode_arguments(body.get('kwargs', {})))
+        except LookupError as e:
+            return self._reply(404, {'error': str(e), 'type': 'LookupError'})
+        except Exception as e:
+            return self._reply(400, {'error': str(e), 'type': type(e).__name__})
+        self._reply(200, {'result': encode(result)})
+
+    def do_GET(self):
+        if self.path == '/health':
+            return self._reply(200, {'status': 'ok', 'batching': self.server.service.batcher.stats()})
+        self._reply(404, {'error': f"Неизвестный путь: {self.path}", 'type': 'LookupError'})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger('library.service').debug(format, *args)
+
+
+class LibraryHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь подключений рассчитана на одновременный запуск десятков рабочих мест
+    request_queue_size = 128
+
+
+def create_server(library, host='127.0.0.1', port=8765, window_ms=2, max_batch=64):
+    server = LibraryHTTPServer((host, port), ServiceHandler)
+    server.service = LibraryService(library, window_ms, max_batch)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служба библиотеки с локальным JSON API")
+    parser.add_argument('--db', default='library.db', help="Файл базы данных")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window-ms', type=float, default=2, help="Время набора пакета изменений, мс")
+    parser.add_argument('--max-batch', type=int, default=64, help="Максимальное количество операций в пакете")
+    parser.add_argument('--cache-size', type=int, default=0, help="Размер кэша Library")
+    args = parser.parse_args(argv)
+
+    server = create_server(Library(args.db, cache_size=args.cache_size), args.host, args.port,
+                           args.window_ms, args.max_batch)
+    print(f"Служба библиотеки: http://{args.host}:{server.server_address[1]} (база {args.db})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+
+if __name__ == '__main__':
+    main()
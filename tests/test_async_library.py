@@ -0,0 +1,99 @@
+# /tests/test_async_library.py
+import asyncio
+import pytest
+from src.library import Library
+
+pytest.importorskip('aiosqlite')
+from src.async_library import AsyncLibrary
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_async_borrow_and_return(tmp_path):
+    async def scenario():
+        async with AsyncLibrary(tmp_path / "library.db") as library:
+            await library.register_user(1, "Test User")
+            await library.add_book(123456789, "Test Book", "Test Author", 2)
+            await library.borrow_book(1, 123456789)
+
+            borrowed_books, count = await library.view_borrowed_books(1)
+            book = await library.view_book(123456789)
+            assert count == 1
+            assert borrowed_books[0].isbn == 123456789
+            # Срок возврата определяется теми же правилами, что и в Library
+            assert (borrowed_books[0].due_date - borrowed_books[0].borrow_date).days == Library.HIGH_REPUTATION_RETURN_DAYS
+            assert book.copies == 1
+            assert [(loan.isbn, loan.title) for loan in await library.view_loans(1)] == [(123456789, "Test Book")]
+
+            await library.return_book(1, 123456789)
+            user = await library.view_user(1)
+            assert user.active_loans == 0
+            assert user.reputation == 100
+            assert (await library.view_book(123456789)).copies == 2
+    run(scenario())
+
+@pytest.mark.parametrize("reputation, expected_loans", [
+    (100, Library.HIGH_REPUTATION_LIMIT),
+    (60, Library.MIDDLE_REPUTATION_LIMIT),
+    (10, Library.LOW_REPUTATION_LIMIT),
+])
+def test_async_reputation_limits(tmp_path, reputation, expected_loans):
+    async def scenario():
+        async with AsyncLibrary(tmp_path / "library.db") as library:
+            await library.register_user(1, "Test User")
+            await library.update_user(1, "Test User", reputation=reputation)
+            await library.add_books((1000 + i, f"Test Book {i}", "Test Author", 1) for i in range(12))
+            for i in range(12):
+                await library.borrow_book(1, 1000 + i)
+            assert await library.get_borrowed_books_count(1) == expected_loans
+    run(scenario())
+
+def test_async_concurrent_borrowers(tmp_path):
+    async def scenario():
+        async with AsyncLibrary(tmp_path / "library.db") as library:
+            await library.add_book(123456789, "Test Book", "Test Author", 3)
+            for user_id in range(1, 21):
+                await library.register_user(user_id, f"Test User {user_id}")
+
+            await asyncio.gather(*(library.borrow_book(user_id, 123456789) for user_id in range(1, 21)))
+
+            assert (await library.view_book(123456789)).copies == 0
+            counts = await asyncio.gather(*(library.get_borrowed_books_count(user_id) for user_id in range(1, 21)))
+            assert sum(counts) == 3
+    run(scenario())
+
+def test_async_search_and_iterators(tmp_path):
+    async def scenario():
+        async with AsyncLibrary(tmp_path / "library.db") as library:
+            await library.add_books((1000 + i, f"Test Book {i}", "Test Author", 1) for i in range(5))
+            await library.register_user(1, "Test User")
+
+            assert len(await library.search_books(author="Test Author")) == 5
+            assert [book.isbn async for book in library.iter_books(author="Test Author", batch_size=2)] == [1000 + i for i in range(5)]
+            assert [user.user_id async for user in library.iter_users(name="Test")] == [1]
+    run(scenario())
+
+def test_async_iter_books_ranked_search(tmp_path):
+    async def scenario():
+        async with AsyncLibrary(tmp_path / "library.db") as library:
+            # При полнотекстовом поиске bm25 упорядочивает книги не по ISBN
+            await library.add_books((isbn, " ".join(["python"] * (isbn % 3 + 1) + ["guide"] * isbn), "Author", 1)
+                                    for isbn in range(1, 10))
+            assert [book.isbn for book in await library.search_books(title="python")] != list(range(1, 10))
+            assert [book.isbn async for book in library.iter_books(title="python", batch_size=3)] == list(range(1, 10))
+    run(scenario())
+
+def test_async_instrumentation(tmp_path):
+    from src.instrumentation import Instrumentation
+    instrumentation = Instrumentation(slow_ms=None)
+
+    async def scenario():
+        async with AsyncLibrary(tmp_path / "library.db", instrumentation=instrumentation) as library:
+            await library.register_user(1, "Test User")
+            await asyncio.gather(*(library.view_user(1) for _ in range(5)))
+    run(scenario())
+
+    methods = instrumentation.snapshot()['methods']
+    assert methods['view_user']['calls'] == 5
+    assert methods['view_user']['statements'] == 5
+    assert methods['register_user']['statements'] == 1
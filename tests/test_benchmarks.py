@@ -0,0 +1,38 @@
+# /tests/test_benchmarks.py
+from benchmarks.suite import SCENARIOS, compare, generate_dataset, run_suite
+from benchmarks.suite.dataset import dataset_checksum
+from src.library import Library
+
+PARAMS = {'books': 300, 'users': 30, 'loans': 500, 'active_per_user': 2, 'seed': 7}
+
+def test_dataset_is_deterministic(tmp_path):
+    first = generate_dataset(str(tmp_path / 'first.db'), **PARAMS)
+    second = generate_dataset(str(tmp_path / 'second.db'), **PARAMS)
+    assert dataset_checksum(first.db_file) == dataset_checksum(second.db_file)
+    assert dataset_checksum(first.db_file) != dataset_checksum(
+        generate_dataset(str(tmp_path / 'other.db'), **dict(PARAMS, seed=8)).db_file)
+
+    library = Library(first.db_file)
+    assert library.get_borrowed_books_count(1) == 2
+    assert len(library.view_loan_history()) == 500 - 30 * 2
+    assert library.verify_loan_counters() == []
+    library.close_connection()
+
+def test_run_suite(tmp_path):
+    dataset = generate_dataset(str(tmp_path / 'library.db'), **PARAMS)
+    results = run_suite(dataset, SCENARIOS, rounds=3, warmup=1)
+    assert [benchmark['name'] for benchmark in results['benchmarks']] == [scenario.name for scenario in SCENARIOS]
+    assert all(benchmark['stats']['rounds'] in (1, 3) for benchmark in results['benchmarks'])
+    assert results['params']['books'] == 300
+
+    # Сценарии выдачи возвращают книги, поэтому счетчики и количество книг у пользователей не меняются
+    library = Library(dataset.db_file)
+    assert library.verify_loan_counters() == []
+    assert sum(library.get_borrowed_books_count(user_id) for user_id in range(1, 31)) == 60
+    library.close_connection()
+
+def test_compare_detects_regressions():
+    def results(**medians):
+        return {'benchmarks': [{'name': name, 'stats': {'median': median}} for name, median in medians.items()]}
+    rows = compare(results(view_book=1.0, borrow_book=2.0), results(view_book=1.1, borrow_book=3.0, new=1.0), 0.2)
+    assert [(name, regressed) for name, _, _, _, regressed in rows] == [('view_book', False), ('borrow_book', True)]
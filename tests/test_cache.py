@@ -0,0 +1,48 @@
+# /tests/test_cache.py
+import time
+import pytest
+from src.cache import LRUCache
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Обращение к 'a' делает вытесняемой запись 'b'
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_ttl_expiry():
+    cache = LRUCache(maxsize=10, ttl=0.05)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+@pytest.mark.parametrize("maxsize, expected_hits, expected_misses", [
+    (0, 0, 2),  # Кэширование отключено
+    (10, 1, 1),
+])
+def test_stats(maxsize, expected_hits, expected_misses):
+    cache = LRUCache(maxsize=maxsize)
+    assert cache.get('a') is None
+    cache.put('a', 1)
+    cache.get('a')
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (expected_hits, expected_misses)
+
+def test_invalidate_and_clear():
+    cache = LRUCache(maxsize=10)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.invalidate('a', 'missing')
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    cache.clear()
+    assert cache.get('b') is None
@@ -1,9 +1,11 @@
 # /tests/test_database.py
 import pytest
+import sqlite3
 from sqlalchemy import inspect
 from src.database import create_connection, create_database, Book, User, BorrowedBook
 import datetime
-from src.library import Library
+from src.library import Library, Book as LibraryBook
+from models import SCHEMA_VERSION, get_schema_version, upgrade_schema
 
 def test_create_connection():
     engine, Session = create_connection(':memory:')
@@ -16,9 +18,50 @@ def test_create_database():
 
     engine, _ = create_connection('library.db')
     inspector = inspect(engine)
-    assert 'Books' in inspector.get_table_names()
-    assert 'Users' in inspector.get_table_names()
-    assert 'BorrowedBooks' in inspector.get_table_names()
+    assert 'books' in inspector.get_table_names()
+    assert 'users' in inspector.get_table_names()
+    assert 'borrowed_books' in inspector.get_table_names()
+
+def test_models_are_shared():
+    # database.py и library.py используют одну и ту же схему
+    assert Book is LibraryBook
+    assert Book.__tablename__ == 'books'
+    assert BorrowedBook.__tablename__ == 'borrowed_books'
+
+def test_upgrade_legacy_database(tmp_path):
+    # База, созданная первой версией database.py: отдельная таблица BorrowedBooks
+    db_file = tmp_path / "library.db"
+    connection = sqlite3.connect(db_file)
+    connection.executescript("""
+        CREATE TABLE "Books" (isbn INTEGER PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL, copies INTEGER);
+        CREATE TABLE "Users" (user_id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, penalty FLOAT, reputation INTEGER,
+                              max_books INTEGER, return_days INTEGER);
+        CREATE TABLE "BorrowedBooks" (borrow_id INTEGER PRIMARY KEY, user_id INTEGER, isbn INTEGER, borrow_date DATETIME,
+                                      due_date DATETIME, return_date DATETIME, penalty FLOAT);
+        INSERT INTO "Books" VALUES (123456789, 'Test Book', 'Test Author', 3);
+        INSERT INTO "Users" VALUES (1, 'Test User', 0.0, 100, 10, 14);
+        INSERT INTO "BorrowedBooks" VALUES (1, 1, 123456789, '2024-01-01 00:00:00.000000', '2024-01-15 00:00:00.000000', NULL, 0.0);
+        INSERT INTO "BorrowedBooks" VALUES (2, 1, 123456789, '2024-02-01 00:00:00.000000', '2024-02-15 00:00:00.000000', NULL, 2.5);
+    """)
+    connection.commit()
+    connection.close()
+
+    engine, Session = create_connection(db_file)
+    changes = upgrade_schema(engine)
+    assert 'BorrowedBooks -> borrowed_books (2)' in changes
+
+    inspector = inspect(engine)
+    assert 'BorrowedBooks' not in inspector.get_table_names()
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+    session = Session()
+    loans = session.query(BorrowedBook).order_by(BorrowedBook.borrow_id).all()
+    assert [(loan.user_id, loan.isbn, loan.penalty) for loan in loans] == [(1, 123456789, 0.0), (1, 123456789, 2.5)]
+    assert session.query(User).filter_by(user_id=1).one().active_loans == 2
+    session.close()
+
+    # Повторное обновление ничего не меняет
+    assert upgrade_schema(engine) == []
 
 @pytest.mark.parametrize("isbn, title, author, copies, expected_result", [
     (123456789, "Test Book1", "Test Author1", 3, "ID: 123456789, Название: Test Book1, Автор: Test Author1, Количество копий: 3"),
@@ -0,0 +1,71 @@
+# /tests/test_exporter.py
+import csv
+import gzip
+import pytest
+from datetime import datetime, timedelta
+from src.library import Library
+from src.exporter import export_database, export_table
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(tmp_path / "library.db")
+    library.register_user(1, "Test User")
+    library.add_books([(isbn, f"Book {isbn}", "Author", 2) for isbn in range(1, 6)])
+    library.borrow_books(1, [1, 2, 3])
+    library.return_books(1, [1])
+    yield library
+    library.close_connection()
+
+def read_rows(path):
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+@pytest.mark.parametrize("format", ["csv", "csv.gz"])
+def test_export_table(library, tmp_path, format):
+    path = tmp_path / f"books.{format}"
+    result = export_table(library, 'books', path, format=format, chunk_size=2)
+    assert result['rows'] == 5
+    rows = read_rows(path)
+    assert [row['isbn'] for row in rows] == ['1', '2', '3', '4', '5']
+    assert rows[0] == {'isbn': '1', 'title': 'Book 1', 'author': 'Author', 'copies': '2'}
+
+def test_incremental_export(library, tmp_path):
+    state = tmp_path / "state.json"
+    first = {result['table']: result for result in
+             export_database(library, tmp_path / "first", format='csv', state_file=state)}
+    assert {table: result['rows'] for table, result in first.items()} == {
+        'books': 5, 'users': 1, 'borrowed_books': 2, 'loan_history': 1}
+
+    library.borrow_book(1, 4)
+    library.return_books(1, [2, 3])
+    second = {result['table']: result for result in
+              export_database(library, tmp_path / "second", format='csv', state_file=state)}
+    # Книги и пользователи выгружаются целиком, выдачи и журнал - только новые строки
+    assert {table: result['rows'] for table, result in second.items()} == {
+        'books': 5, 'users': 1, 'borrowed_books': 1, 'loan_history': 2}
+    assert [row['isbn'] for row in read_rows(second['borrowed_books']['path'])] == ['4']
+    assert sorted(row['isbn'] for row in read_rows(second['loan_history']['path'])) == ['2', '3']
+
+    third = export_database(library, tmp_path / "third", tables=['loan_history'], format='csv', state_file=state)
+    assert third[0]['rows'] == 0
+
+def test_export_since(library, tmp_path):
+    result = export_table(library, 'borrowed_books', tmp_path / "loans.csv", since=datetime.now() + timedelta(days=1))
+    assert result['rows'] == 0
+    assert result['high_water_mark'] > datetime.now()
+
+def test_columnar_export_without_pyarrow(library, tmp_path, monkeypatch):
+    import src.exporter
+    monkeypatch.setattr(src.exporter, 'pyarrow', None)
+    results = export_database(library, tmp_path, tables=['books'])
+    assert results[0]['format'] == 'csv.gz'
+    assert len(read_rows(results[0]['path'])) == 5
+    with pytest.raises(ValueError):
+        export_database(library, tmp_path, tables=['books'], format='parquet')
+
+def test_parquet_export(library, tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    results = export_database(library, tmp_path, format='parquet', chunk_size=2)
+    assert results[0]['format'] == 'parquet'
+    assert parquet.read_table(results[0]['path']).column('isbn').to_pylist() == [1, 2, 3, 4, 5]
@@ -0,0 +1,66 @@
+# /tests/test_importer.py
+import json
+import pytest
+from src.library import Library
+from src.importer import import_catalog
+
+@pytest.fixture
+def library():
+    return Library(':memory:')
+
+def write_catalog(path, books):
+    if path.suffix == '.csv':
+        lines = ["isbn,title,author,copies"] + [f"{isbn},{title},{author},{copies}" for isbn, title, author, copies in books]
+        path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    else:
+        lines = [json.dumps({'isbn': isbn, 'title': title, 'author': author, 'copies': copies}, ensure_ascii=False)
+                 for isbn, title, author, copies in books]
+        path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+
+@pytest.mark.parametrize("file_name", ["catalog.csv", "catalog.jsonl"])
+def test_import_catalog(library, tmp_path, file_name):
+    path = tmp_path / file_name
+    books = [(1000 + i, f"Test Book {i}", f"Test Author {i % 3}", i % 4 + 1) for i in range(25)]
+    write_catalog(path, books)
+
+    # Маленький размер пакета, чтобы проверить загрузку несколькими транзакциями
+    stats = import_catalog(library, str(path), chunk_size=10)
+
+    assert stats['rows'] == 25
+    assert stats['rows_per_sec'] > 0
+    for isbn, title, author, copies in books:
+        book = library.view_book(isbn)
+        assert (book.title, book.author, book.copies) == (title, author, copies)
+
+@pytest.mark.parametrize("upsert, expected_title, expected_copies", [
+    (True, "New Title", 1),  # У существующей книги обновляются название и автор
+    (False, "Old Title", 1),  # Существующая книга остается без изменений
+])
+def test_add_books_conflict(library, upsert, expected_title, expected_copies):
+    library.add_book(123456789, "Old Title", "Test Author", 1)
+
+    count = library.add_books([(123456789, "New Title", "Test Author", 7), (987654321, "Test Book", "Test Author", 2)], upsert=upsert)
+
+    assert count == 2
+    book = library.view_book(123456789)
+    assert book.title == expected_title
+    assert book.copies == expected_copies
+    assert library.view_book(987654321).copies == 2
+
+def test_add_books_keeps_lent_copies(library):
+    library.register_user(1, "Test User")
+    library.add_books([(123456789, "Test Book", "Test Author", 1)])
+    library.borrow_book(1, 123456789)
+
+    # Повторный импорт каталога не делает выданную копию доступной
+    library.add_books([(123456789, "Test Book", "Test Author", 1)])
+    assert library.view_book(123456789).copies == 0
+    library.register_user(2, "Other User")
+    library.borrow_book(2, 123456789)
+    assert library.get_borrowed_books_count(2) == 0
+
+def test_import_catalog_unsupported_format(library, tmp_path):
+    path = tmp_path / "catalog.xml"
+    path.write_text("<books/>", encoding='utf-8')
+    with pytest.raises(ValueError):
+        import_catalog(library, str(path))
@@ -0,0 +1,68 @@
+# /tests/test_instrumentation.py
+import pytest
+from src.library import Library
+from src.instrumentation import Instrumentation
+
+@pytest.fixture
+def instrumentation():
+    return Instrumentation(slow_ms=None)
+
+@pytest.fixture
+def library(instrumentation):
+    library = Library(':memory:', instrumentation=instrumentation)
+    library.register_user(1, "Test User")
+    library.add_book(123456789, "Test Book", "Test Author", 1)
+    instrumentation.reset()
+    return library
+
+def test_statements_per_call(library, instrumentation):
+    library.borrow_book(1, 123456789)
+    # Вторая выдача не удается: запрос на проверку существования книги засчитывается и book_exists,
+    # и вызвавшему borrow_book
+    library.borrow_book(1, 123456789)
+    library.view_book(123456789)
+
+    methods = instrumentation.snapshot()['methods']
+    assert methods['borrow_book']['calls'] == 2
+    assert methods['borrow_book']['statements'] == 5
+    assert methods['borrow_book']['max_statements'] == 3
+    assert methods['book_exists']['statements'] == 1
+    assert methods['view_book']['statements_per_call'] == 1
+    assert sum(count for _, count in methods['borrow_book']['buckets']) <= 2
+
+def test_errors_are_counted(library, instrumentation):
+    with pytest.raises(ValueError):
+        library.delete_book(1)
+    assert instrumentation.snapshot()['methods']['delete_book']['errors'] == 1
+
+def test_slow_queries_capture_plan(instrumentation):
+    slow = []
+    instrumentation = Instrumentation(slow_ms=0, on_slow=slow.append)
+    library = Library(':memory:', instrumentation=instrumentation)
+    library.register_user(1, "Test User")
+    instrumentation.reset()
+    slow.clear()
+
+    library.view_user(1)
+    queries = [record for record in slow if record['kind'] == 'query']
+    assert len(queries) == 1
+    assert queries[0]['method'] == 'view_user'
+    assert any('users' in step for step in queries[0]['plan'])
+    assert [record['method'] for record in slow if record['kind'] == 'call'] == ['view_user']
+    assert 'view_user' in instrumentation.render_text()
+
+def test_export(library, instrumentation, tmp_path):
+    library.view_book(123456789)
+    path = tmp_path / "library.prom"
+    instrumentation.write(path)
+    content = path.read_text(encoding='utf-8')
+    assert 'library_call_duration_seconds_bucket{method="view_book",le="+Inf"} 1' in content
+    assert 'library_sql_statements_total{method="view_book"} 1' in content
+
+    instrumentation.write(path, format='text')
+    assert path.read_text(encoding='utf-8').startswith("Метод")
+
+def test_library_without_instrumentation():
+    library = Library(':memory:')
+    assert library.instrumentation is None
+    assert library.view_book.__func__ is Library.view_book
@@ -1,6 +1,10 @@
 # /tests/test_library.py
 import pytest
-from src.library import Library, Book, User, BorrowedBook
+import sqlite3
+import threading
+from collections import Counter
+from sqlalchemy import inspect, text
+from src.library import Library, Book, User, BorrowedBook, LoanHistory
 from datetime import datetime, timedelta
 @pytest.fixture
 def library():
@@ -37,6 +41,60 @@ def test_borrow_book(library, user_id, user_name, isbn, title, author, copies, m
         assert str(e) == str(expected_exception)
         return
 
+def run_concurrently(db_file, workers, action):
+    # Каждый поток работает со своим экземпляром Library (своим соединением с файлом базы)
+    libraries = [Library(db_file) for _ in range(workers)]
+    barrier = threading.Barrier(workers)
+
+    def worker(index):
+        barrier.wait()
+        action(libraries[index], index)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for library in libraries:
+        library.close_connection()
+
+@pytest.mark.parametrize("workers, copies", [
+    (16, 1),  # Последнюю копию одновременно пытаются взять все
+    (16, 5),
+])
+def test_borrow_book_concurrent_no_over_lending(tmp_path, workers, copies):
+    db_file = tmp_path / "library.db"
+    library = Library(db_file)
+    isbn = 123456789
+    library.add_book(isbn, "Test Book", "Test Author", copies)
+    for user_id in range(1, workers + 1):
+        library.register_user(user_id, f"Test User {user_id}")
+
+    run_concurrently(db_file, workers, lambda lib, i: lib.borrow_book(i + 1, isbn))
+
+    library.session.expire_all()
+    assert library.session.query(BorrowedBook).filter_by(isbn=isbn).count() == copies
+    assert library.view_book(isbn).copies == 0
+    assert sum(user.active_loans for user in library.session.query(User)) == copies
+    library.close_connection()
+
+def test_borrow_book_concurrent_user_limit(tmp_path):
+    db_file = tmp_path / "library.db"
+    library = Library(db_file)
+    user_id = 1
+    workers = 12
+    library.register_user(user_id, "Test User")
+    library.update_user(user_id, "Test User", reputation=20)
+    for i in range(workers):
+        library.add_book(1000000000 + i, f"Test Book {i}", "Test Author", 1)
+
+    run_concurrently(db_file, workers, lambda lib, i: lib.borrow_book(user_id, 1000000000 + i))
+
+    library.session.expire_all()
+    assert library.session.query(BorrowedBook).filter_by(user_id=user_id).count() == Library.LOW_REPUTATION_LIMIT
+    assert library.view_user(user_id).active_loans == Library.LOW_REPUTATION_LIMIT
+    library.close_connection()
+
 @pytest.mark.parametrize("isbn, title, author, copies", [
     (123456789, "Test Book1", "Test Author1", 3),
     (987654321, "Test Book2", "Test Author2", 5),
@@ -222,5 +280,854 @@ def test_search_books_by_isbn(library):
     # Проверяем, что книга найдена и соответствует ожидаемому
     assert len(book_by_isbn) == 1
     assert book_by_isbn[0].isbn == 123456789
+
+@pytest.mark.parametrize("borrowed, returned", [
+    (0, 0),
+    (3, 1),
+    (5, 5),
+])
+def test_active_loans_counter(library, borrowed, returned):
+    user_id = 1
+    library.register_user(user_id, "Test User")
+    for i in range(borrowed):
+        library.add_book(3000000000 + i, f"Test Book {i+1}", "Test Author", 1)
+        library.borrow_book(user_id, 3000000000 + i)
+    for i in range(returned):
+        library.return_book(user_id, 3000000000 + i)
+
+    assert library.view_user(user_id).active_loans == borrowed - returned
+    assert library.get_borrowed_books_count(user_id) == borrowed - returned
+    assert library.verify_loan_counters() == []
+
+def test_rebuild_loan_counters(library):
+    library.register_user(1, "Test User 1")
+    library.register_user(2, "Test User 2")
+    library.add_book(123456789, "Test Book", "Test Author", 2)
+    library.borrow_book(1, 123456789)
+
+    # Портим счетчики напрямую, минуя триггеры
+    library.session.query(User).filter_by(user_id=1).update({'active_loans': 4})
+    library.session.query(User).filter_by(user_id=2).update({'active_loans': 1})
+    library.session.commit()
+
+    assert library.verify_loan_counters() == [(1, 4, 1), (2, 1, 0)]
+    assert library.rebuild_loan_counters() == 2
+    assert library.verify_loan_counters() == []
+    assert library.view_user(1).active_loans == 1
+
+def test_upgrade_adds_active_loans(tmp_path):
+    # База в старом формате: без счетчика active_loans и без триггеров
+    db_file = tmp_path / "library.db"
+    connection = sqlite3.connect(db_file)
+    connection.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, name VARCHAR, penalty FLOAT, reputation INTEGER,
+                            max_books INTEGER, return_days INTEGER);
+        CREATE TABLE books (isbn INTEGER PRIMARY KEY, title VARCHAR, author VARCHAR, copies INTEGER);
+        CREATE TABLE borrowed_books (id INTEGER PRIMARY KEY, user_id INTEGER, isbn INTEGER,
+                                     borrow_date DATETIME, return_date DATETIME, due_date DATETIME);
+        INSERT INTO users VALUES (1, 'Test User', 0.0, 100, 10, 14);
+        INSERT INTO books VALUES (123456789, 'Test Book', 'Test Author', 5);
+        INSERT INTO borrowed_books (user_id, isbn) VALUES (1, 123456789), (1, 123456789);
+    """)
+    connection.commit()
+    connection.close()
+
+    library = Library(db_file)
+    indexes = {index['name'] for index in inspect(library.engine).get_indexes('borrowed_books')}
+    assert {'ix_borrowed_books_user_isbn_return', 'ix_borrowed_books_isbn', 'ix_borrowed_books_due_date'} <= indexes
+    assert library.view_user(1).active_loans == 2
+    library.borrow_book(1, 123456789)
+    assert library.view_user(1).active_loans == 3
+    library.close_connection()
+
+@pytest.fixture(params=[True, False], ids=["fts", "like"])
+def catalog(request):
+    # Одинаковые проверки выполняются для полнотекстового поиска и для LIKE
+    library = Library(':memory:', full_text_search=request.param)
+    library.add_books([
+        (1, "Война и мир", "Лев Толстой", 1),
+        (2, "Анна Каренина", "Лев Толстой", 1),
+        (3, "Хождение по мукам", "Алексей Толстой", 1),
+        (4, "Мир Полудня", "Стругацкие", 1),
+    ])
+    return library
+
+@pytest.mark.parametrize("kwargs, expected_isbns", [
+    ({'title': "Каренина"}, {2}),
+    ({'author': "Толст"}, {1, 2, 3}),
+    ({'title': "мир", 'author': "Толстой"}, {1}),
+    ({'query': "Толстой мир"}, {1}),
+    ({'query': "Лев"}, {1, 2}),
+    ({'author': "Толстой", 'isbn': 2}, {2}),
+])
+def test_search_books_modes(catalog, kwargs, expected_isbns):
+    books = catalog.search_books(**kwargs)
+    assert {book.isbn for book in books} == expected_isbns
+
+def test_search_books_full_text_prefix_and_sync(library):
+    assert library.full_text_search
+    library.add_book(123456789, "Programming Python", "Mark Lutz", 1)
+    library.add_book(987654321, "Learning Python", "Mark Lutz", 1)
+
+    # Поиск по префиксу слова
+    assert {book.isbn for book in library.search_books(query="prog")} == {123456789}
+
+    # Индекс обновляется при изменении и удалении книг
+    library.update_book(987654321, title="Learning Rust")
+    assert {book.isbn for book in library.search_books(title="python")} == {123456789}
+    library.delete_book(123456789)
+    assert library.search_books(query="python") == []
+
+def test_search_books_ranking_and_pagination(library):
+    library.add_book(1, "Python Cookbook", "Brian Jones", 1)
+    library.add_book(2, "Python Python Python", "Python Team", 1)
+    library.add_book(3, "Fluent Python", "Luciano Ramalho", 1)
+
+    # Наиболее релевантная книга идет первой
+    ranked = library.search_books(query="python")
+    assert ranked[0].isbn == 2
+    assert len(ranked) == 3
+
+    pages = [library.search_books(query="python", limit=2, offset=offset) for offset in (0, 2)]
+    assert [len(page) for page in pages] == [2, 1]
+    assert [book.isbn for page in pages for book in page] == [book.isbn for book in ranked]
+
+@pytest.mark.parametrize("page_size", [1, 3, 10])
+def test_search_pagination_with_cursor(library, page_size):
+    for i in range(7):
+        library.register_user(i + 1, f"Test User {i + 1}")
+        library.add_book(4000000000 + i, f"Test Book {i + 1}", "Test Author", 1)
+
+    # Обход постранично: курсор - ключ последней полученной записи
+    def collect(fetch, key):
+        rows, after = [], None
+        while True:
+            page = fetch(limit=page_size, after=after)
+            assert len(page) <= page_size
+            if not page:
+                return rows
+            rows.extend(page)
+            after = getattr(page[-1], key)
+
+    books = collect(lambda **kwargs: library.search_books(author="Test Author", **kwargs), 'isbn')
+    users = collect(lambda **kwargs: library.search_users(name="Test User", **kwargs), 'user_id')
+    assert [book.isbn for book in books] == [4000000000 + i for i in range(7)]
+    assert [user.user_id for user in users] == list(range(1, 8))
+
+def test_view_borrowed_books_pagination(library):
+    user_id = 1
+    library.register_user(user_id, "Test User")
+    for i in range(5):
+        library.add_book(5000000000 + i, f"Test Book {i + 1}", "Test Author", 1)
+        library.borrow_book(user_id, 5000000000 + i)
+
+    first_page, count = library.view_borrowed_books(user_id, limit=3)
+    second_page, _ = library.view_borrowed_books(user_id, limit=3, after=first_page[-1].id)
+
+    assert count == 5
+    assert [len(first_page), len(second_page)] == [3, 2]
+    assert [loan.isbn for loan in first_page + second_page] == [5000000000 + i for i in range(5)]
+
+def test_streaming_iterators(library):
+    user_id = 1
+    library.register_user(user_id, "Test User")
+    for i in range(5):
+        library.add_book(6000000000 + i, f"Test Book {i + 1}", "Test Author", 1)
+        library.borrow_book(user_id, 6000000000 + i)
+
+    assert [book.isbn for book in library.iter_books(author="Test Author", batch_size=2)] == [6000000000 + i for i in range(5)]
+    assert [user.user_id for user in library.iter_users(name="Test", batch_size=2)] == [user_id]
+    assert len(list(library.iter_borrowed_books(user_id, batch_size=2))) == 5
+
+@pytest.fixture
+def cached_library():
+    return Library(':memory:', cache_size=100)
+
+def test_cache_hits(cached_library):
+    cached_library.add_book(123456789, "Test Book", "Test Author", 2)
+    cached_library.register_user(1, "Test User")
+
+    for _ in range(3):
+        assert cached_library.view_book(123456789).title == "Test Book"
+        assert cached_library.view_user("1").name == "Test User"
+    assert cached_library.book_exists(123456789)
+    assert not cached_library.book_exists(987654321)
+    assert not cached_library.user_exists(2)
+
+    stats = cached_library.cache_stats()
+    assert stats['size'] == 2
+    assert stats['hits'] >= 5
+
+@pytest.mark.parametrize("action, expected_copies, expected_name, expected_active_loans", [
+    (lambda lib: lib.update_book(123456789, copies=7), 7, "Test User", 0),
+    (lambda lib: lib.update_user(1, "New Name"), 2, "New Name", 0),
+    (lambda lib: lib.borrow_book(1, 123456789), 1, "Test User", 1),
+    (lambda lib: (lib.borrow_book(1, 123456789), lib.view_book(123456789), lib.view_user(1),
+                  lib.return_book(1, 123456789)), 2, "Test User", 0),
+    # Повторный импорт не меняет количество доступных копий
+    (lambda lib: lib.add_books([(123456789, "Test Book", "Test Author", 9)]), 2, "Test User", 0),
+])
+def test_cache_invalidation(cached_library, action, expected_copies, expected_name, expected_active_loans):
+    cached_library.add_book(123456789, "Test Book", "Test Author", 2)
+    cached_library.register_user(1, "Test User")
+    # Заполняем кэш
+    cached_library.view_book(123456789)
+    cached_library.view_user(1)
+
+    action(cached_library)
+
+    assert cached_library.view_book(123456789).copies == expected_copies
+    user = cached_library.view_user(1)
+    assert user.name == expected_name
+    assert user.active_loans == expected_active_loans
+
+def test_cache_invalidation_on_delete(cached_library):
+    cached_library.add_book(123456789, "Test Book", "Test Author", 2)
+    cached_library.register_user(1, "Test User")
+    cached_library.view_book(123456789)
+    cached_library.view_user(1)
+
+    cached_library.delete_book(123456789)
+    cached_library.delete_user(1)
+
+    assert cached_library.view_book(123456789) is None
+    assert not cached_library.book_exists(123456789)
+    assert cached_library.view_user(1) is None
+    assert not cached_library.user_exists(1)
+
+def test_cache_invalidation_on_delete_user_with_ready_hold(cached_library):
+    cached_library.add_book(123456789, "Test Book", "Test Author", 1)
+    cached_library.register_user(1, "Test User 1")
+    cached_library.register_user(2, "Test User 2")
+    cached_library.borrow_book(2, 123456789)
+    cached_library.place_hold(1, 123456789)
+    cached_library.return_book(2, 123456789)
+    assert cached_library.view_book(123456789).copies == 0
+
+    # Копия, закрепленная за резервом удаленного пользователя, снова доступна
+    cached_library.delete_user(1)
+    assert cached_library.view_book(123456789).copies == 1
+
+def test_shared_library_across_threads(tmp_path):
+    # Один экземпляр Library обслуживает несколько потоков, у каждого своя сессия
+    library = Library(tmp_path / "library.db", pool_size=4)
+    isbn = 123456789
+    workers = 16
+    library.add_book(isbn, "Test Book", "Test Author", 5)
+    for user_id in range(1, workers + 1):
+        library.register_user(user_id, f"Test User {user_id}")
+
+    barrier = threading.Barrier(workers)
+    sessions = set()
+
+    def worker(user_id):
+        barrier.wait()
+        library.borrow_book(user_id, isbn)
+        assert library.search_books(title="Test Book")
+        sessions.add(id(library.session()))
+        library.release_session()
+
+    threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in range(1, workers + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sessions) > 1
+    assert library.session.query(BorrowedBook).count() == 5
+    assert library.view_book(isbn).copies == 0
+    library.close_connection()
+
+def test_unit_of_work(tmp_path):
+    library = Library(tmp_path / "library.db")
+    with library.unit_of_work() as session:
+        session.add(Book(isbn=1, title="Test Book", author="Test Author", copies=1))
+
+    with pytest.raises(RuntimeError):
+        with library.unit_of_work() as session:
+            session.add(Book(isbn=2, title="Test Book", author="Test Author", copies=1))
+            raise RuntimeError
+
+    assert library.book_exists(1)
+    assert not library.book_exists(2)
+    assert library.session.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+    library.close_connection()
+
+def test_process_overdues(library):
+    now = datetime.now()
+    library.register_user(1, "Test User 1")
+    library.register_user(2, "Test User 2")
+    library.add_book(123456789, "Test Book", "Test Author", 5)
+    library.borrow_book(1, 123456789)
+    library.borrow_book(2, 123456789)
+    # Вторая книга возвращена (дата возврата установлена) и в обходе не участвует
+    library.set_return_date(2, 123456789, now)
+    as_of = now + timedelta(days=Library.HIGH_REPUTATION_RETURN_DAYS + 3, hours=1)
+
+    dry_run = library.process_overdues(as_of=as_of, dry_run=True)
+    assert (dry_run['loans'], dry_run['users'], dry_run['days'], dry_run['penalty']) == (1, 1, 3, 15)
+    assert library.view_user(1).penalty == 0
+
+    result = library.process_overdues(as_of=as_of)
+    assert result['penalty'] == 15
+    user = library.view_user(1)
+    assert (user.penalty, user.reputation) == (15, 85)
+
+    # Повторный запуск за тот же день ничего не начисляет
+    assert library.process_overdues(as_of=as_of)['penalty'] == 0
+    # На следующий день начисляется только новый день просрочки
+    assert library.process_overdues(as_of=as_of + timedelta(days=1))['penalty'] == 5
+    user = library.view_user(1)
+    assert (user.penalty, user.reputation) == (20, 80)
+    assert library.view_user(2).penalty == 0
+
+def test_process_overdues_policy_change(library):
+    # Штраф снижает репутацию ниже порога уровня high: выдача хранит сумму, начисленную по прежней ставке,
+    # следующие дни начисляются по ставке нового уровня
+    library.set_loan_policy('middle', penalty_per_day=10)
+    library.register_user(1, "Test User")
+    library.update_user(1, "Test User", reputation=82)
+    library.add_book(123456789, "Test Book", "Test Author", 1)
+    library.borrow_book(1, 123456789)
+    due_date = library.view_borrowed_books(1)[0][0].due_date
+
+    assert library.process_overdues(as_of=due_date + timedelta(days=3, hours=1))['penalty'] == 15
+    user = library.view_user(1)
+    assert (user.penalty, user.reputation, user.penalty_per_day) == (15, 67, 10)
+    assert library.view_borrowed_books(1)[0][0].penalty == 15
+
+    assert library.process_overdues(as_of=due_date + timedelta(days=4, hours=1))['penalty'] == 10
+    assert library.view_borrowed_books(1)[0][0].penalty == 25
+    library.set_return_date(1, 123456789, due_date + timedelta(days=4, hours=2))
+    library.return_book(1, 123456789)
+    assert library.view_user(1).penalty == 25
+    assert [loan.penalty for loan in library.iter_loan_history(user_id=1)] == [25]
+
+def test_return_after_process_overdues(library):
+    now = datetime.now()
+    library.register_user(1, "Test User")
+    library.add_book(123456789, "Test Book", "Test Author", 1)
+    library.borrow_book(1, 123456789)
+    due_date = library.view_borrowed_books(1)[0][0].due_date
+    library.process_overdues(as_of=due_date + timedelta(days=2, hours=1))
+
+    # При возврате начисляется штраф только за дни, не учтенные обходом
+    library.set_return_date(1, 123456789, due_date + timedelta(days=5, hours=1))
+    library.return_book(1, 123456789)
+
+    user = library.view_user(1)
+    assert user.penalty == 25
+    assert user.reputation == 75
+
+def test_return_moves_loan_to_history(library):
+    library.register_user(1, "Test User")
+    library.add_book(123456789, "Test Book", "Test Author", 1)
+    library.borrow_book(1, 123456789)
+    due_date = library.view_borrowed_books(1)[0][0].due_date
+    return_date = due_date + timedelta(days=2, hours=1)
+    library.set_return_date(1, 123456789, return_date)
+    library.return_book(1, 123456789)
+
+    assert library.view_borrowed_books(1) == ([], 0)
+    assert library.view_book(123456789).copies == 1
+    history = library.view_loan_history(user_id=1)
+    assert [(loan.isbn, loan.period, loan.return_date, loan.penalty, loan.penalized_days) for loan in history] == [
+        (123456789, return_date.strftime('%Y-%m'), return_date, 10, 2)]
+    assert library.view_loan_history(period='1999-01') == []
+
+    # Журнал только пополняется
+    with pytest.raises(Exception, match="append-only"):
+        library.session.execute(text("DELETE FROM loan_history"))
+    library.session.rollback()
+
+def test_return_book_is_atomic(library, monkeypatch):
+    library.register_user(1, "Test User")
+    library.add_book(123456789, "Test Book", "Test Author", 1)
+    library.borrow_book(1, 123456789)
+
+    def broken_history(*args, **kwargs):
+        raise RuntimeError("history unavailable")
+    monkeypatch.setattr(LoanHistory, 'from_loan', broken_history)
+    library.return_book(1, 123456789)
+
+    # Ошибка при записи в журнал откатывает и удаление выдачи, и возврат копии
+    assert library.get_borrowed_books_count(1) == 1
+    assert library.view_book(123456789).copies == 0
+    assert library.view_loan_history() == []
+
+def test_compact_loans(library):
+    now = datetime.now()
+    library.register_user(1, "Test User")
+    for isbn in (1, 2, 3):
+        library.add_book(isbn, f"Book {isbn}", "Author", 1)
+        library.borrow_book(1, isbn)
+    library.set_return_date(1, 1, now - timedelta(days=40))
+    library.set_return_date(1, 2, now - timedelta(days=1))
+    # Дата возврата в будущем: выдача еще активна
+    library.set_return_date(1, 3, now + timedelta(days=1))
+
+    expected_periods = Counter(LoanHistory.period_of(now - timedelta(days=days)) for days in (40, 1))
+    assert library.compact_loans(chunk_size=1) == dict(expected_periods)
+    assert [loan.isbn for loan in library.view_borrowed_books(1)[0]] == [3]
+    assert sorted(loan.isbn for loan in library.iter_loan_history(user_id=1)) == [1, 2]
+    assert [library.view_book(isbn).copies for isbn in (1, 2, 3)] == [1, 1, 0]
+    assert library.verify_loan_counters() == []
+    assert library.compact_loans() == {}
+
+def test_compact_loans_deleted_user(library):
+    library.register_user(1, "Test User")
+    library.add_book(1, "Book 1", "Author", 1)
+    library.borrow_book(1, 1)
+    library.set_return_date(1, 1, datetime.now() - timedelta(days=1))
+    library.delete_user(1)
+
+    assert sum(library.compact_loans().values()) == 1
+    assert library.view_book(1).copies == 1
+    assert [loan.isbn for loan in library.iter_loan_history(user_id=1)] == [1]
+    assert library.compact_loans() == {}
+
+def test_borrow_books(library):
+    library.register_user(1, "Test User")
+    library.update_user(1, "Test User", reputation=60)
+    library.add_books([(isbn, f"Book {isbn}", "Author", 1) for isbn in (1, 2, 3, 4, 5, 6)])
+    library.add_book(7, "Book 7", "Author", 0)
+
+    items = library.borrow_books(1, [1, 1, 7, 99, "x", 2, 3, 4, 5, 6])
+    assert [(item['isbn'], item['ok']) for item in items] == [
+        (1, True), (1, False), (7, False), (99, False), ("x", False),
+        (2, True), (3, True), (4, True), (5, True), (6, False)]
+    assert items[1]['error'] == items[2]['error'] == "Нет доступных копий книги."
+    assert items[3]['error'] == "Книга с ID 99 не найдена."
+    # Пользователь со средней репутацией может взять не больше MIDDLE_REPUTATION_LIMIT книг
+    assert items[-1]['error'] == "Достигнуто максимальное количество книг для пользователя с ID 1."
+    assert library.get_borrowed_books_count(1) == Library.MIDDLE_REPUTATION_LIMIT
+    assert [library.view_book(isbn).copies for isbn in (1, 2, 6)] == [0, 0, 1]
+    assert library.verify_loan_counters() == []
+
+def test_borrow_books_unknown_user(library):
+    library.add_book(1, "Book 1", "Author", 1)
+    items = library.borrow_books(2, [1])
+    assert items == [{'isbn': 1, 'ok': False, 'error': "Пользователь с ID 2 не найден."}]
+    assert library.view_book(1).copies == 1
+
+def test_return_books(library):
+    now = datetime.now()
+    library.register_user(1, "Test User")
+    library.add_books([(isbn, f"Book {isbn}", "Author", 2) for isbn in (1, 2, 3)])
+    library.borrow_books(1, [1, 1, 2, 3])
+    due_date = library.view_borrowed_books(1)[0][0].due_date
+    library.set_return_date(1, 3, due_date + timedelta(days=2, hours=1))
+
+    items = library.return_books(1, [1, 1, 3, 2, 2])
+    assert [item['ok'] for item in items] == [True, True, True, True, False]
+    assert items[-1]['error'] == "Для пользователя нет взятой книги."
+    assert library.get_borrowed_books_count(1) == 0
+    assert [library.view_book(isbn).copies for isbn in (1, 2, 3)] == [2, 2, 2]
+    assert sorted(loan.isbn for loan in library.view_loan_history(user_id=1)) == [1, 1, 2, 3]
+    # Штраф за просрочку начисляется по тем же правилам, что и в return_book
+    assert library.view_user(1).penalty == 10
+
+def test_view_loans(library):
+    from src.instrumentation import Instrumentation
+    library.register_user(1, "Test User")
+    library.register_user(2, "Other User")
+    library.add_books([(isbn, f"Book {isbn}", f"Author {isbn}", 1) for isbn in (1, 2, 3)])
+    library.borrow_books(1, [1, 2])
+    library.borrow_book(2, 3)
+    library.delete_book(2)
+
+    instrumentation = Instrumentation(slow_ms=None)
+    instrumentation.attach(library)
+    loans = library.view_loans(1, with_user=True)
+    assert [(loan.isbn, loan.title, loan.author, loan.user_name) for loan in loans] == [
+        (1, "Book 1", "Author 1", "Test User"), (2, None, None, "Test User")]
+    # Названия книг получены тем же запросом
+    assert instrumentation.snapshot()['methods']['view_loans']['statements'] == 1
+
+    assert [loan.user_name for loan in library.view_loans()] == [None, None, None]
+    assert [loan.isbn for loan in library.view_loans(limit=1, after=loans[0].id)] == [2]
+    assert [loan.title for loan in library.iter_loans(batch_size=1)] == ["Book 1", None, "Book 3"]
+
+@pytest.mark.parametrize("cache_size", [0, 10])
+def test_read_only_records(tmp_path, cache_size):
+    library = Library(tmp_path / "library.db", read_only_records=True, cache_size=cache_size)
+    library.register_user(1, "Test User")
+    library.add_books([(1, "Война и мир", "Толстой", 2), (2, "Анна Каренина", "Толстой", 1)])
+
+    book = library.view_book(1)
+    assert book == (1, "Война и мир", "Толстой", 2)
+    assert str(book) == "ID: 1, Название: Война и мир, Автор: Толстой, Количество копий: 2"
+    with pytest.raises(AttributeError):
+        book.copies = 0
+    assert library.view_user(1).active_loans == 0
+    assert library.view_book(3) is None
+
+    assert sorted(book.isbn for book in library.search_books(author="Толстой")) == [1, 2]
+    assert [book.title for book in library.iter_books(query="анна", batch_size=1)] == ["Анна Каренина"]
+    assert [user.name for user in library.search_users(name="Test")] == ["Test User"]
+    assert [user.user_id for user in library.iter_users()] == [1]
+    # Записи не попадают в сессию
+    assert len(library.session.identity_map) == 0
+
+    library.borrow_book(1, 1)
+    assert library.view_book(1).copies == 1
+    assert library.view_user(1).active_loans == 1
+    library.close_connection()
+
+def test_loan_policies(library):
+    library.register_user(1, "Test User")
+    library.add_book(123456789, "Test Book", "Test Author", 5)
+    assert [policy.tier for policy in library.loan_policies()] == ['high', 'middle', 'low']
+    user = library.view_user(1)
+    assert (user.max_books, user.return_days, user.penalty_per_day) == (10, 14, 5)
+
+    # Изменение репутации пересчитывает материализованную политику пользователя
+    library.update_user(1, "Test User", reputation=60)
+    user = library.view_user(1)
+    assert (user.max_books, user.return_days) == (5, 7)
+    before = datetime.now()
+    library.borrow_book(1, 123456789)
+    loan = library.view_borrowed_books(1)[0][0]
+    assert loan.due_date - loan.borrow_date == timedelta(days=7)
+    assert loan.borrow_date >= before
+
+    # Изменение политики применяется ко всем пользователям уровня без изменения кода
+    library.set_loan_policy('middle', max_books=1, return_days=10, penalty_per_day=2.5)
+    assert library.loan_policies()[1] == ('middle', 50, 1, 10, 2.5)
+    user = library.view_user(1)
+    assert (user.max_books, user.return_days, user.penalty_per_day) == (1, 10, 2.5)
+    library.borrow_book(1, 123456789)
+    assert library.get_borrowed_books_count(1) == 1
+
+    result = library.process_overdues(as_of=loan.due_date + timedelta(days=2, hours=1))
+    assert result['penalty'] == 5
+
+    library.set_loan_policy('gold', min_reputation=95, max_books=20, return_days=30, penalty_per_day=1)
+    library.update_user(1, "Test User", reputation=100)
+    assert library.view_user(1).max_books == 20
+    library.delete_loan_policy('gold')
+    assert library.view_user(1).max_books == 10
+    with pytest.raises(ValueError):
+        library.set_loan_policy('silver', max_books=3)
+
+def test_holds(library):
+    isbn = 123456789
+    for user_id in range(1, 5):
+        library.register_user(user_id, f"Test User {user_id}")
+    library.add_book(isbn, "Test Book", "Test Author", 1)
+    with pytest.raises(ValueError):
+        library.place_hold(2, isbn)  # Есть доступная копия
+    library.borrow_book(1, isbn)
+    assert [library.place_hold(user_id, isbn) for user_id in (2, 3, 4)] == [1, 2, 3]
+    with pytest.raises(ValueError):
+        library.place_hold(2, isbn)
+    assert library.hold_position(4, isbn) == 3
+
+    # Возвращенная копия закрепляется за первым в очереди и недоступна остальным
+    library.return_book(1, isbn)
+    assert library.view_book(isbn).copies == 0
+    assert [(hold.user_id, hold.title) for hold in library.holds_ready_for_pickup()] == [(2, "Test Book")]
+    assert (library.hold_position(2, isbn), library.hold_position(3, isbn)) == (0, 1)
+    library.borrow_book(3, isbn)
+    assert library.get_borrowed_books_count(3) == 0
+
+    # Владелец резерва забирает копию, резерв снимается
+    library.borrow_book(2, isbn)
+    assert library.get_borrowed_books_count(2) == 1
+    assert library.hold_position(2, isbn) is None
+    assert library.view_book(isbn).copies == 0
+
+    # Снятый готовый резерв передает копию следующему, просроченный - возвращает ее в доступные
+    library.return_books(2, [isbn])
+    assert [hold.user_id for hold in library.holds_ready_for_pickup()] == [3]
+    library.cancel_hold(3, isbn)
+    assert [hold.user_id for hold in library.holds_ready_for_pickup()] == [4]
+    assert library.expire_holds(as_of=datetime.now() + timedelta(days=Library.HOLD_PICKUP_DAYS + 1)) == 1
+    assert library.view_holds() == []
+    assert library.view_book(isbn).copies == 1
+
+def test_borrow_books_with_ready_hold(library):
+    library.register_user(1, "Test User 1")
+    library.register_user(2, "Test User 2")
+    library.add_books([(1, "Book 1", "Author", 1), (2, "Book 2", "Author", 1)])
+    library.borrow_books(1, [1, 2])
+    library.place_hold(2, 1)
+    library.return_books(1, [1, 2])
+    assert library.borrow_books(1, [1])[0]['ok'] is False
+    assert [item['ok'] for item in library.borrow_books(2, [1, 2])] == [True, True]
+    assert library.view_book(1).copies == 0
+    assert library.view_holds(user_id=2) == []
+
+def test_holds_concurrent_queue(tmp_path):
+    # Тысячи резервов на популярную книгу, поставленных параллельно: очередь без пропусков и повторов,
+    # возвращенные копии достаются первым в очереди
+    db_file = tmp_path / "library.db"
+    library = Library(db_file)
+    isbn = 123456789
+    workers, per_worker, copies = 16, 150, 3
+    library.add_book(isbn, "Popular Book", "Test Author", copies)
+    library.session.execute(User.__table__.insert(), [
+        {'user_id': user_id, 'name': f"Test User {user_id}", 'reputation': 100}
+        for user_id in range(1, workers * per_worker + copies + 1)
+    ])
+    library.session.commit()
+    library.borrow_books(1, [isbn] * copies)
+    positions = [[] for _ in range(workers)]
+
+    def place_holds(lib, index):
+        for user_id in range(copies + 1 + index * per_worker, copies + 1 + (index + 1) * per_worker):
+            positions[index].append(lib.place_hold(user_id, isbn))
+
+    run_concurrently(db_file, workers, place_holds)
+
+    total = workers * per_worker
+    assert sorted(position for chunk in positions for position in chunk) == list(range(1, total + 1))
+    holds = library.view_holds(isbn=isbn)
+    assert len(holds) == total
+    library.return_books(1, [isbn] * copies)
+    ready = library.holds_ready_for_pickup()
+    assert [hold.id for hold in ready] == [hold.id for hold in holds[:copies]]
+    assert library.view_book(isbn).copies == 0
+    assert library.hold_position(holds[copies].user_id, isbn) == 1
+    library.close_connection()
+
+def test_group_commit(tmp_path):
+    # Изменения параллельных потоков фиксируются общими пакетами, ошибка одной операции
+    # возвращается только ее вызывающему
+    library = Library(tmp_path / "library.db", group_commit=True, group_commit_window_ms=20)
+    users = 20
+    library.add_book(123456789, "Test Book", "Test Author", users)
+    for user_id in range(1, users + 1):
+        library.register_user(user_id, f"Test User {user_id}")
+    assert library.view_user(1).name == "Test User 1"
+    library.update_user(1, "Renamed User")
+    assert library.view_user(1).name == "Renamed User"
+    before = library.batcher.stats()
+    barrier = threading.Barrier(users + 1)
+    errors = {}
+
+    def desk(operation, user_id, *args):
+        barrier.wait()
+        try:
+            operation(user_id, *args)
+        except ValueError as e:
+            errors[user_id] = str(e)
+        finally:
+            library.release_session()
+
+    threads = [threading.Thread(target=desk, args=(library.borrow_book, user_id, 123456789))
+               for user_id in range(1, users + 1)]
+    threads.append(threading.Thread(target=desk, args=(library.update_user, users + 1, "Nobody")))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = library.batcher.stats()
+    assert errors == {users + 1: "Пользователь с указанным ID не найден."}
+    assert stats['operations'] - before['operations'] == users + 1
+    assert stats['batches'] - before['batches'] < users + 1
+    assert library.view_book(123456789).copies == 0
+    assert library.get_borrowed_books_count(1) == 1
+
+    # Выдача без доступных копий завершается ошибкой у вызвавшего ее потока, остальные выдачи пакета фиксируются
+    library.add_book(987654321, "Other Book", "Test Author", 3)
+    threads = [threading.Thread(target=desk, args=(library.borrow_book, user_id, 987654321)) for user_id in (1, 2, 3, 4)]
+    threads.append(threading.Thread(target=desk, args=(library.return_book, 5, 555)))
+    barrier = threading.Barrier(len(threads))
+    errors.clear()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(errors.values()) == ["Для пользователя нет взятой книги.", "Нет доступных копий книги."]
+    assert sum(library.get_borrowed_books_count(user_id) for user_id in (1, 2, 3, 4)) == 4 + 3
+    assert library.view_book(987654321).copies == 0
+    with pytest.raises(ValueError):
+        library.set_return_date(5, 555, datetime.now())
+    library.close_connection()
+
+def test_group_commit_maintenance(tmp_path):
+    # Обслуживающие операции выполняются потоком записи вместе с выдачами других потоков
+    # и не ждут блокировку базы, которую держит пакет
+    library = Library(tmp_path / "library.db", group_commit=True, group_commit_window_ms=20, busy_timeout=100)
+    users = 10
+    library.add_books([(1, "Old Book", "Test Author", users), (2, "New Book", "Test Author", users)])
+    for user_id in range(1, users + 1):
+        library.register_user(user_id, f"Test User {user_id}")
+        library.borrow_book(user_id, 1)
+    for user_id in (1, 2, 3):
+        library.set_return_date(user_id, 1, datetime.now())
+    with library.unit_of_work() as session:
+        session.execute(text("UPDATE borrowed_books SET due_date = :due"), {'due': datetime.now() - timedelta(days=5)})
+    barrier = threading.Barrier(users + 4)
+    results = {}
+    errors = []
+
+    def desk(name, operation, *args, **kwargs):
+        barrier.wait()
+        try:
+            results[name] = operation(*args, **kwargs)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            library.release_session()
+
+    threads = [threading.Thread(target=desk, args=(user_id, library.borrow_book, user_id, 2))
+               for user_id in range(1, users + 1)]
+    threads += [
+        threading.Thread(target=desk, args=('overdues', library.process_overdues), kwargs={'as_of': datetime.now()}),
+        threading.Thread(target=desk, args=('compact', library.compact_loans), kwargs={'chunk_size': 1}),
+        threading.Thread(target=desk, args=('holds', library.expire_holds)),
+        threading.Thread(target=desk, args=('policy', library.set_loan_policy, 'low'), kwargs={'return_days': 5}),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results['overdues']['loans'] == users - 3
+    assert sum(results['compact'].values()) == 3
+    assert results['holds'] == 0
+    assert library.view_book(2).copies == 0
+    assert sum(library.get_borrowed_books_count(user_id) for user_id in range(1, users + 1)) == 2 * users - 3
+    assert {policy.tier: policy.return_days for policy in library.loan_policies()}['low'] == 5
+    library.close_connection()
+
+def test_circulation_stats(tmp_path):
+    db_file = tmp_path / "library.db"
+    library = Library(db_file)
+    library.add_books([(isbn, f"Book {isbn}", "Test Author", 5) for isbn in (1, 2, 3)])
+    for user_id in (1, 2):
+        library.register_user(user_id, f"Test User {user_id}")
+    library.borrow_book(1, 1)
+    library.borrow_books(2, [1, 2])
+    library.return_book(1, 1)
+    library.return_books(2, [2])
+    library.borrow_book(1, 3)
+    library.delete_book(3)
+
+    stats = library.stats()
+    assert (stats['borrows'], stats['returns']) == (4, 2)
+    assert [tuple(book) for book in stats['books']] == [
+        (1, "Book 1", "Test Author", 2, 1), (2, "Book 2", "Test Author", 1, 1), (3, None, None, 1, 0)]
+    assert [tuple(user) for user in stats['borrowers']] == [(1, "Test User 1", 2, 1), (2, "Test User 2", 2, 1)]
+    assert [book.isbn for book in library.stats(limit=1)['books']] == [1]
+    # Отчет за произвольные дни по дневным сводкам совпадает с отчетом за месяц
+    today = datetime.now()
+    assert library.stats(start=today, end=today + timedelta(days=1)) == stats
+    assert library.stats(start=today + timedelta(days=1))['books'] == []
+    assert library.stats(end=today - timedelta(days=40))['borrows'] == 0
+    assert library.stats(period='2000-01') == {'borrows': 0, 'returns': 0, 'books': [], 'borrowers': []}
+
+    # Пересчет по выдачам и журналу совпадает со сводками, которые вели триггеры
+    assert library.rebuild_circulation_stats() == 3
+    assert library.stats() == stats
+    library.close_connection()
+
+    # База предыдущей версии схемы: сводки заполняются при обновлении
+    connection = sqlite3.connect(db_file)
+    connection.executescript("""
+        DROP TABLE book_daily_stats; DROP TABLE user_daily_stats;
+        DROP TABLE book_monthly_stats; DROP TABLE user_monthly_stats;
+        DROP TRIGGER borrowed_books_stats; DROP TRIGGER loan_history_stats;
+        UPDATE schema_version SET version = 8;
+    """)
+    connection.close()
+    library = Library(db_file)
+    assert library.stats() == stats
+    library.close_connection()
+
+def test_fuzzy_search(library):
+    library.add_books([
+        (1, "Война и мир", "Лев Толстой", 1),
+        (2, "Преступление и наказание", "Фёдор Достоевский", 1),
+        (3, "Идиот", "Фёдор Достоевский", 1),
+        (4, "Анна Каренина", "Лев Толстой", 1),
+        (5, "The Brothers Karamazov", "Fyodor Dostoevsky", 1),
+    ])
+    library.register_user(1, "Иван Петров")
+    library.register_user(2, "Петр Иванов")
+    library.register_user(3, "Сергей Смирнов")
+
+    assert [book.isbn for book in library.fuzzy_search_books(author="достаевский")] == [2, 3]
+    assert [book.isbn for book in library.fuzzy_search_books(author="Dostoyevsky")] == [5]
+    assert [book.isbn for book in library.fuzzy_search_books(query="ТОЛСТОИ каренена")] == [4]
+    assert [book.isbn for book in library.fuzzy_search_books(title="вайна")] == [1]
+    assert [book.isbn for book in library.fuzzy_search_books(title="brotehrs")] == [5]
+    assert library.fuzzy_search_books(title="толстой") == []
+    assert library.fuzzy_search_books(title="вайна", threshold=0.9) == []
+    # Точное совпадение слова ранжируется выше похожего
+    assert [user.user_id for user in library.fuzzy_search_users("Иванов")] == [2, 1]
+    assert [user.user_id for user in library.fuzzy_search_users("смирнофф", limit=5)] == [3]
+    # Книги с самыми похожими словами для каждого слова запроса отбираются без ранжирования всех вхождений
+    assert [book.isbn for book in library.fuzzy_search_books(author="достоевский", limit=1)] == [2]
+    assert [user.user_id for user in library.fuzzy_search_users("Иванов", limit=1)] == [2]
+
+    # Индекс обновляется вместе с книгами и пользователями
+    library.update_book(1, title="Воскресение")
+    library.update_user(3, "Сергей Кузнецов")
+    library.delete_book(3)
+    library.add_books([(2, "Бесы", "Фёдор Достоевский", 1)])
+    assert library.fuzzy_search_books(title="вайна") == []
+    assert [book.isbn for book in library.fuzzy_search_books(title="васкресение")] == [1]
+    assert [book.isbn for book in library.fuzzy_search_books(title="бесы")] == [2]
+    assert library.fuzzy_search_books(title="преступление") == []
+    assert [book.isbn for book in library.fuzzy_search_books(author="достоевский")] == [2]
+    assert library.fuzzy_search_users("смирнов") == []
+    assert [user.user_id for user in library.fuzzy_search_users("кузнецов")] == [3]
+    assert library.rebuild_search_index() > 0
+    assert [book.isbn for book in library.fuzzy_search_books(author="достоевский")] == [2]
+
+def test_bulk_import_search_index(library):
+    # add_books индексирует порции набором запросов, триграммы новых слов считает word_trigrams;
+    # индекс совпадает с построенным заново rebuild_search_index
+    def index():
+        postings = library.session.execute(text(
+            "SELECT search_words.word, search_postings.field, search_postings.id FROM search_postings "
+            "JOIN search_words ON search_words.id = search_postings.word_id")).all()
+        trigrams = library.session.execute(text(
+            "SELECT search_words.word, search_words.trigrams, search_word_trigrams.trigram FROM search_word_trigrams "
+            "JOIN search_words ON search_words.id = search_word_trigrams.word_id")).all()
+        words = library.session.execute(text("SELECT word FROM search_words")).scalars().all()
+        return sorted(postings), sorted(trigrams), sorted(words)
+
+    library.add_book(1, "Война и мир", "Лев Толстой", 1)
+    library.add_books([(1, "Война и мир", "Лев Толстой", 1), (2, "Анна Каренина", "Лев Толстой", 1),
+                       (3, "Идиот, идиот", "Фёдор Достоевский", 1)], chunk_size=2)
+    library.add_books([(2, "Воскресение", "Лев Толстой", 1), (4, "Ёлка «Бесы»", "Фёдор Достоевский", 1)])
+    library.add_books([(3, "Игрок", "Фёдор Достоевский", 1)], upsert=False)
+    library.update_book(4, author="Федор Достоевский")
+    library.delete_book(1)
+    # Слова, у которых не осталось вхождений, удалены из словаря вместе с триграммами
+    bulk = index()
+    assert {"война", "каренина", "игрок"} & set(bulk[2]) == set()
+    assert library.rebuild_search_index() > 0
+    assert bulk == index()
+    assert [book.isbn for book in library.fuzzy_search_books(title="васкресение")] == [2]
+    assert library.fuzzy_search_books(title="каренина") == []
+    assert [book.isbn for book in library.fuzzy_search_books(title="идеот")] == [3]
+    assert [book.isbn for book in library.fuzzy_search_books(title="елка бесы")] == [4]
+
+def test_bulk_import_deferred_search_index(library):
+    # С defer_search_index порции не индексируются, индекс строится заново после загрузки и флаг снимается
+    library.add_book(1, "Война и мир", "Лев Толстой", 1)
+    indexed = []
+    def books():
+        for isbn, title in ((1, "Воскресение"), (2, "Анна Каренина"), (3, "Идиот")):
+            indexed.append(library.session.execute(text("SELECT COUNT(*) FROM search_postings")).scalar())
+            yield isbn, title, "Лев Толстой", 1
+    assert library.add_books(books(), chunk_size=1, defer_search_index=True) == 3
+    # Пока идет загрузка, вхождения новых книг не добавляются
+    assert indexed[1] == indexed[2]
+    assert library.session.execute(text("SELECT COUNT(*) FROM search_index_deferred")).scalar() == 0
+    assert library.fuzzy_search_books(title="война") == []
+    assert [book.isbn for book in library.fuzzy_search_books(title="васкресение")] == [1]
+    assert [book.isbn for book in library.fuzzy_search_books(title="идеот")] == [3]
+    library.add_book(4, "Бесы", "Фёдор Достоевский", 1)
+    assert [book.isbn for book in library.fuzzy_search_books(title="бесы")] == [4]
+
 if __name__ == "__main__":
     pytest.main()
@@ -1 +1,31 @@
+# /tests/test_main.py
+import subprocess
+import sys
+import pytest
+from src.main import LibraryLoader
 
+def test_main_imports_without_sqlalchemy():
+    # Меню выводится до загрузки SQLAlchemy: модуль main не импортирует library при запуске
+    code = "import sys; sys.path.insert(0, 'src'); import main; print('sqlalchemy' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.strip() == 'False'
+
+def test_library_loader(tmp_path):
+    loader = LibraryLoader(tmp_path / "library.db")
+    library = loader.get()
+    library.register_user(1, "Test User")
+    assert loader.get() is library
+    assert library.user_exists(1)
+    loader.close()
+
+def test_library_loader_error(tmp_path):
+    loader = LibraryLoader(tmp_path / "missing" / "library.db")
+    with pytest.raises(Exception):
+        loader.get()
+    loader.close()
+
+def test_library_loader_server():
+    # С адресом службы открывается клиент, база локально не используется
+    from src.client import LibraryClient
+    loader = LibraryLoader(server="http://127.0.0.1:8765")
+    assert type(loader.get()).__name__ == LibraryClient.__name__
+    loader.close()
@@ -0,0 +1,98 @@
+# /tests/test_service.py
+import threading
+import pytest
+from datetime import datetime
+from src.library import Library
+from src.batching import WriteBatcher
+from src.client import LibraryClient, ServiceError
+from src.service import create_server
+
+@pytest.fixture
+def server(tmp_path):
+    server = create_server(Library(tmp_path / "library.db"), port=0, window_ms=5)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+@pytest.fixture
+def client(server):
+    client = LibraryClient(f"http://127.0.0.1:{server.server_address[1]}")
+    yield client
+    client.close_connection()
+
+def test_client_calls(client):
+    client.register_user(1, "Test User")
+    client.add_books([(isbn, f"Book {isbn}", "Author", 1) for isbn in range(1, 4)])
+    book = client.view_book(1)
+    assert (book.isbn, book.title, book.copies) == (1, "Book 1", 1)
+    assert str(book) == "ID: 1, Название: Book 1, Автор: Author, Количество копий: 1"
+
+    items = client.borrow_books(1, [1, 2, 99])
+    assert [item['ok'] for item in items] == [True, True, False]
+    loans = list(client.iter_loans(1))
+    assert [loan.isbn for loan in loans] == [1, 2]
+    assert isinstance(loans[0].due_date, datetime)
+    assert [book.isbn for book in client.iter_books(author="Author")] == [1, 2, 3]
+
+    with pytest.raises(ValueError):
+        client.update_user(99, "Nobody")
+    with pytest.raises(ServiceError):
+        client.no_such_operation()
+
+def test_concurrent_writes_are_batched(server, client):
+    client.add_book(1, "Book", "Author", 1000)
+    users = 40
+    for user_id in range(1, users + 1):
+        client.register_user(user_id, f"User {user_id}")
+    before = server.service.batcher.stats()
+    barrier = threading.Barrier(users)
+
+    def desk(user_id):
+        barrier.wait()
+        client.borrow_book(user_id, 1)
+
+    threads = [threading.Thread(target=desk, args=(user_id,)) for user_id in range(1, users + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = server.service.batcher.stats()
+    assert stats['operations'] - before['operations'] == users
+    assert stats['batches'] - before['batches'] < users
+    assert client.view_book(1).copies == 1000 - users
+
+def test_failed_operation_does_not_roll_back_batch(tmp_path):
+    library = Library(tmp_path / "library.db")
+    library.register_user(1, "Test User")
+    library.add_book(1, "Book", "Author", 1)
+    batcher = WriteBatcher(library, window_ms=50)
+    results = {}
+
+    def submit(name, operation, *args):
+        try:
+            results[name] = batcher.submit(operation, *args)
+        except Exception as e:
+            results[name] = e
+
+    threads = [
+        threading.Thread(target=submit, args=('borrow', Library.borrow_book, 1, 1)),
+        threading.Thread(target=submit, args=('missing', Library.update_user, 2, "Nobody")),
+        threading.Thread(target=submit, args=('register', Library.register_user, 2, "Second User")),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert isinstance(results['missing'], ValueError)
+    assert batcher.stats()['batches'] == 1
+    library.release_session()
+    assert library.get_borrowed_books_count(1) == 1
+    assert library.view_book(1).copies == 0
+    assert library.user_exists(2)
+    library.close_connection()